@@ -3,13 +3,13 @@ from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.dialects.postgresql import insert
 from fastapi.security import HTTPBearer
 from datetime import datetime
 from app.db.base import get_db
-from app.db.air_quality_sites import AirQualitySiteDB
+from app.db.air_quality_sites import AirQualitySiteDB, insert_readings
 from app.schemas.air_quality_sites import AirQualityDataReq, AirQualitySite
 from app.db.users import get_user, UserNotFoundError
+from app.services.prediction import materialize_predictions
 
 # Security setup
 security = HTTPBearer()
@@ -64,6 +64,7 @@ async def add_air_quality_data(req: AirQualityDataReq, email: str = Header(...),
     excluded_records = []
 
     # Process each record
+    received_at = datetime.now()
     for record in req.data:
         try:
              # Check for empty or whitespace values
@@ -89,20 +90,21 @@ async def add_air_quality_data(req: AirQualityDataReq, email: str = Header(...),
                 raise ValueError(f"Longitude should be a valid number. Found: {record.Longitude}")
 
 
-            # Create AirQualitySiteDB instance if all validations pass
-            air_quality_record = AirQualitySiteDB(
-                Date=datetime.strptime(record.Date, "%Y-%m-%d").date(),
-                FM=record.FM,
-                cf1=record.cf1,
-                TempC=record.TempC,
-                RH=record.RH,
-                region=record.region,
-                ID=record.ID,
-                AQS_Site_ID=record.AQS_Site_ID,
-                Latitude=record.Latitude,
-                Longitude=record.Longitude
-            )
-            valid_records.append(air_quality_record)
+            # Plain row if all validations pass; the whole batch is inserted in one statement
+            valid_records.append({
+                "Date": datetime.strptime(record.Date, "%Y-%m-%d"),
+                "FM": record.FM,
+                "cf1": record.cf1,
+                "TempC": record.TempC,
+                "RH": record.RH,
+                "region": record.region,
+                "ID": record.ID,
+                "AQS_Site_ID": record.AQS_Site_ID,
+                "Latitude": record.Latitude,
+                "Longitude": record.Longitude,
+                "created_at": received_at,
+                "updated_at": received_at
+            })
         except Exception as e:
             # Log the error and the invalid record
             excluded_records.append({"record": record.dict(), "reason": str(e)})
@@ -111,15 +113,24 @@ async def add_air_quality_data(req: AirQualityDataReq, email: str = Header(...),
     # If there are valid records, insert them into the database
     if valid_records:
         try:
-            db.add_all(valid_records)
+            inserted = await insert_readings(db, valid_records)
             await db.commit()
-            return {"message": "Data inserted successfully.", "excluded_records": excluded_records}
         except IntegrityError as e:
             await db.rollback()
             raise HTTPException(status_code=409, detail=f"Integrity error: {str(e.orig)}")
         except Exception as e:
             await db.rollback()
             raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+        # Precompute calibrated values for every model; the readings are already
+        # committed, so a failure here only means the predict endpoint fills them lazily
+        try:
+            await materialize_predictions(db, inserted)
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Failed to materialize predictions: {str(e)}")
+
+        return {"message": "Data inserted successfully.", "excluded_records": excluded_records}
     
     # If no valid records were processed, return a message
     return {"message": "No valid records to insert.", "excluded_records": excluded_records}
@@ -0,0 +1,129 @@
+import os
+import time
+from urllib.parse import parse_qs
+from fastapi import APIRouter, Response
+from app.db.base import engine
+from app.services.metrics import metrics, request_seconds, gauge_family, counter_family, CONTENT_TYPE
+from app.services.model_registry import registry
+from app.services.inference import inference_executor
+from app.services.histogram_cache import histogram_cache
+from app.services.single_flight import single_flight
+from app.services.memory_report import memory_report
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request up to its last body byte, so streamed responses
+    count in full. Labels use the route template, never the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router fills in the matched route on this same scope
+            route = scope.get("route")
+            model = parse_qs(scope["query_string"].decode("latin-1")).get("code", [""])[0].upper()
+            request_seconds.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=route.path if route is not None else scope.get("root_path") or "unmatched",
+                status=status,
+                model=model if model in registry.codes else ""
+            )
+
+
+def collect_components():
+    """Model cache, inference pool, single-flight, histogram cache and DB pool, read at scrape time."""
+    # The main process's own cache plus the latest counters each inference worker reported
+    per_process = {**inference_executor.worker_registry_counters, os.getpid(): registry.counters()}
+    cache_totals = {key: sum(c[key] for c in per_process.values()) for key in ("hits", "misses", "reloads", "evictions")}
+
+    inference = inference_executor.stats()
+    flights = single_flight.stats()
+    histograms = histogram_cache.stats()
+
+    families = [
+        counter_family("model_cache_hits", "Model registry lookups served from memory, all processes",
+                       {(): cache_totals["hits"]}),
+        counter_family("model_cache_misses", "Model registry lookups that loaded an artifact, all processes",
+                       {(): cache_totals["misses"]}),
+        counter_family("model_cache_reloads", "Models reloaded because the artifact changed on disk",
+                       {(): cache_totals["reloads"]}),
+        counter_family("model_cache_evictions", "Models evicted from the registry LRU", {(): cache_totals["evictions"]}),
+        gauge_family("inference_in_flight", "Inference tasks submitted and not finished", {(): inference["in_flight"]}),
+        gauge_family("inference_queue_depth", "Inference tasks waiting for a free worker", {(): inference["queue_depth"]}),
+        gauge_family("inference_abandoned", "Timed-out or cancelled inference tasks still holding a worker",
+                     {(): inference["abandoned"]}),
+        counter_family("inference_tasks", "Finished inference tasks by outcome", {
+            ("completed",): inference["completed"],
+            ("failed",): inference["failed"],
+            ("timeout",): inference["timeouts"]
+        }, ("outcome",)),
+        counter_family("single_flight_calls", "Coalescable calls, and how many shared another call's result", {
+            ("executed",): flights["executions"],
+            ("coalesced",): flights["coalesced"]
+        }, ("result",)),
+        counter_family("histogram_cache_lookups", "Rendered histogram cache lookups", {
+            ("hit",): histograms["hits"],
+            ("miss",): histograms["misses"]
+        }, ("result",))
+    ]
+
+    # QueuePool; other pool classes (NullPool, StaticPool) have nothing to saturate
+    pool = engine.sync_engine.pool
+    if hasattr(pool, "checkedout"):
+        size, checked_out = pool.size(), pool.checkedout()
+        max_overflow = getattr(pool, "_max_overflow", 0)
+        capacity = size + max_overflow if max_overflow >= 0 else 0
+        families += [
+            gauge_family("db_pool_size", "Persistent connections the pool keeps", {(): size}),
+            gauge_family("db_pool_checked_out", "Connections currently in use", {(): checked_out}),
+            gauge_family("db_pool_overflow", "Connections open beyond pool_size", {(): max(pool.overflow(), 0)}),
+            gauge_family("db_pool_saturation", "Connections in use over the pool's maximum (size + max_overflow)",
+                         {(): checked_out / capacity if capacity else 0.0})
+        ]
+    return families
+
+
+def collect_memory():
+    """Footprint of the whole server process tree; see app/services/memory_report.py."""
+    report = memory_report()
+    if not report["supported"]:
+        return []
+    return [
+        gauge_family("server_memory_bytes", "Summed memory of the master, workers and inference processes",
+                     {(kind,): value for kind, value in report["totals"].items()}, ("kind",)),
+        gauge_family("server_worker_pss_bytes", "PSS of one worker together with its inference processes",
+                     {(pid,): cost["pss"] for pid, cost in report["per_worker"].items()}, ("worker",)),
+        gauge_family("server_processes", "Processes in the server tree", {(): len(report["processes"])})
+    ]
+
+
+def configure_metrics(app):
+    app.add_middleware(MetricsMiddleware)
+    metrics.register_collector(collect_components)
+    metrics.register_collector(collect_memory)
+    app.include_router(router, tags=["Metrics"])
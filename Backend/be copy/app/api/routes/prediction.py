@@ -1,12 +1,40 @@
-import os
+import math
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Literal, Optional
+from typing import Any, Awaitable, Callable, Literal, Optional
 from datetime import datetime
-from app.db.base import get_db
-from app.services.prediction import predict_with_model, predict_and_generate_histograms
+from app.db.base import get_db, AsyncSessionLocal
+from app.db.air_quality_sites import ReadingFilters
+from app.core.config import settings
+from app.services.prediction import (
+    predict_with_model,
+    predict_and_generate_histograms,
+    stream_predictions,
+    histogram_cache_key,
+    compute_histogram_data,
+    compare_models,
+    NDJSON_MEDIA_TYPE,
+    CSV_MEDIA_TYPE
+)
+from app.services.model_registry import registry
+from app.services.inference import inference_executor
+from app.services.histogram_cache import histogram_cache, etag_matches
+from app.services.single_flight import single_flight
+from app.services.metrics import stage_timer
+from app.services.memory_report import memory_report
+from app.services.drift import drift_report
+from app.services.micro_batch import micro_batcher
+from app.services.evaluation import cached_evaluation, evaluation_cache
+from app.services.batch_prediction import (
+    predict_batch,
+    check_body_size,
+    BatchInputError,
+    BatchTooLargeError,
+    UnsupportedMediaTypeError
+)
 
 
 # Security setup
@@ -23,20 +51,32 @@ logging.basicConfig(
 
 router = APIRouter()
 
-MODEL_MAP = {
-    "GB": "GB_model_for_website.joblib",
-    "KNN": "KNN_model_for_website.joblib",
-    "LR": "LR_model_for_website.joblib",
-    "NN": "NN_model_for_website.h5",
-    "RF": "RF_model_for_website.joblib"
-}
+
+def reading_filters(
+    site_id: Optional[str] = Query(None, alias="ID", description="Sensor ID, e.g. IA3"),
+    region: Optional[str] = Query(None, description="Region name"),
+    aqs_site_id: Optional[str] = Query(None, alias="AQS_Site_ID", description="AQS site ID, e.g. 19-153-0030"),
+    after: Optional[int] = Query(None, ge=0, description="Return rows after this id_no (next_after of the previous page)"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.PREDICTION_MAX_PAGE_SIZE, description="Page size")
+) -> ReadingFilters:
+    return ReadingFilters(site_id=site_id, region=region, aqs_site_id=aqs_site_id, after=after, limit=limit)
+
+
+async def _with_own_session(fn: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+    # Coalesced work outlives the request that started it and serves other waiters,
+    # so it cannot borrow that request's session: it opens and closes its own
+    async with AsyncSessionLocal() as db:
+        return await fn(db)
+
 
 @router.get("/predict")
 async def predict(
     code: Literal["GB", "KNN", "LR", "NN", "RF"] = Query(..., description="Model code"),
     from_date: Optional[datetime] = Query(None, description="From date (YYYY-MM-DD)"),
     to_date: Optional[datetime] = Query(None, description="To date (YYYY-MM-DD)"),
-    db: AsyncSession = Depends(get_db)
+    mode: Literal["exact", "fast"] = Query("exact", description="fast interpolates on the model's precomputed grid"),
+    accept: Optional[str] = Header(None),
+    filters: ReadingFilters = Depends(reading_filters)
 ):
     # if code == "NN":
     #     raise HTTPException(status_code=501, detail="NN model temporarily unavailable.")
@@ -46,46 +86,143 @@ async def predict(
         if from_date > to_date:
             raise HTTPException(status_code=400, detail="from_date must be before to_date")
 
-    model_filename = MODEL_MAP.get(code.upper())
-    if not os.path.exists(f"models/{model_filename}"):
+    if not registry.exists(code):
         raise HTTPException(status_code=500, detail="Model file not found")
 
+    if mode == "fast" and not registry.surrogate_exists(code):
+        raise HTTPException(status_code=500, detail=f"No fast-mode grid for {code}; build it with python -m app.services.surrogate {code}")
+
+    # Stream chunk by chunk when the client asks for NDJSON or CSV
+    for media_type in (NDJSON_MEDIA_TYPE, CSV_MEDIA_TYPE):
+        if accept and media_type in accept:
+            return StreamingResponse(
+                stream_predictions(code, from_date, to_date, media_type, mode, filters),
+                media_type=media_type
+            )
+
     try:
-        result = await predict_with_model(f"models/{model_filename}", db, from_date, to_date)
+        # Identical concurrent requests share one table scan and model pass
+        result = await single_flight.do(
+            ("predict", code, from_date, to_date, mode, filters),
+            lambda: _with_own_session(lambda db: predict_with_model(code, db, from_date, to_date, mode, filters))
+        )
         return {
             "model": code,
+            "mode": mode,
             "date_range": {
                 "from": from_date.isoformat() if from_date else None,
                 "to": to_date.isoformat() if to_date else None
             },
             # "count": len(predictions),
-            "data": result
+            "data": result["data"],
+            "next_after": result["next_after"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
+@router.get("/predict-point")
+async def predict_point(
+    code: Literal["GB", "KNN", "LR", "NN", "RF"] = Query(..., description="Model code"),
+    cf1: float = Query(..., description="PurpleAir cf1 reading"),
+    rh: float = Query(..., alias="RH", description="Relative humidity"),
+    temp_c: float = Query(..., alias="TempC", description="Temperature in Celsius"),
+    mode: Literal["exact", "fast"] = Query("exact", description="fast interpolates on the model's precomputed grid")
+):
+    # One reading; concurrent calls for the same model share a single predict call
+    if not all(math.isfinite(v) for v in (cf1, rh, temp_c)):
+        raise HTTPException(status_code=400, detail="cf1, RH and TempC must be finite numbers")
+
+    if not registry.exists(code):
+        raise HTTPException(status_code=500, detail="Model file not found")
+
+    if mode == "fast" and not registry.surrogate_exists(code):
+        raise HTTPException(status_code=500, detail=f"No fast-mode grid for {code}; build it with python -m app.services.surrogate {code}")
+
+    try:
+        calibrated = await micro_batcher.predict(code, [cf1, rh, temp_c], mode)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"model": code, "mode": mode, "calibrated": calibrated}
+
+
+async def _read_batch_body(request: Request) -> bytes:
+    # Refuse oversized bodies from the header, or while streaming when it is absent, before buffering them
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        check_body_size(int(content_length))
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        check_body_size(size)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@router.post("/predict-batch")
+async def predict_batch_rows(
+    request: Request,
+    code: Literal["GB", "KNN", "LR", "NN", "RF"] = Query(..., description="Model code"),
+    mode: Literal["exact", "fast"] = Query("exact", description="fast interpolates on the model's precomputed grid")
+):
+    # Caller-supplied cf1 / RH / TempC rows in JSON, CSV, .npy or Arrow; answered in the same format
+    if not registry.exists(code):
+        raise HTTPException(status_code=500, detail="Model file not found")
+
+    if mode == "fast" and not registry.surrogate_exists(code):
+        raise HTTPException(status_code=500, detail=f"No fast-mode grid for {code}; build it with python -m app.services.surrogate {code}")
+
+    try:
+        body = await _read_batch_body(request)
+        content, media_type = await predict_batch(code, body, request.headers.get("content-type"), mode)
+    except UnsupportedMediaTypeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except BatchInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(content=content, media_type=media_type)
+
+
 @router.get("/histogram")
 async def get_histogram_data(
+    response: Response,
     code: Literal["GB", "KNN", "LR", "NN", "RF"] = Query(..., description="Model code"),
     from_date: Optional[datetime] = Query(None),
     to_date: Optional[datetime] = Query(None),
+    if_none_match: Optional[str] = Header(None),
+    filters: ReadingFilters = Depends(reading_filters),
     db: AsyncSession = Depends(get_db)
 ):
     if from_date and to_date and from_date > to_date:
         raise HTTPException(status_code=400, detail="from_date must be before to_date")
 
-    model_filename = MODEL_MAP.get(code.upper())
-    if not model_filename or not os.path.exists(f"models/{model_filename}"):
+    if not registry.exists(code):
         raise HTTPException(status_code=500, detail="Model file not found")
 
     try:
-        image_path = await predict_and_generate_histograms(f"models/{model_filename}", db, from_date, to_date)
+        # The cache key doubles as the ETag: a match means the client's image is current
+        with stage_timer("histogram", code, "cache_key"):
+            cache_key = await histogram_cache_key(code, db, from_date, to_date, filters)
+        etag = histogram_cache.etag(cache_key)
+        if etag_matches(if_none_match, etag) and histogram_cache.get(cache_key):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        image_path = await single_flight.do(
+            ("histogram", code, from_date, to_date, filters),
+            lambda: _with_own_session(
+                lambda db: predict_and_generate_histograms(code, db, from_date, to_date, cache_key, filters)
+            )
+        )
 
         if not image_path:
             raise HTTPException(status_code=404, detail="No data found for the given range")
 
+        response.headers["ETag"] = etag
+
         return {
             "model": code,
             "date_range": {
@@ -98,3 +235,159 @@ async def get_histogram_data(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/histogram-data")
+async def get_histogram_bins(
+    code: Literal["GB", "KNN", "LR", "NN", "RF"] = Query(..., description="Model code"),
+    from_date: Optional[datetime] = Query(None),
+    to_date: Optional[datetime] = Query(None),
+    bins: int = Query(10, ge=1, le=500, description="Number of equal-width bins per feature")
+):
+    if from_date and to_date and from_date > to_date:
+        raise HTTPException(status_code=400, detail="from_date must be before to_date")
+
+    if not registry.exists(code):
+        raise HTTPException(status_code=500, detail="Model file not found")
+
+    try:
+        histogram_data = await single_flight.do(
+            ("histogram-data", code, from_date, to_date, bins),
+            lambda: _with_own_session(lambda db: compute_histogram_data(code, db, from_date, to_date, bins))
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not histogram_data:
+        raise HTTPException(status_code=404, detail="No data found for the given range")
+
+    return {
+        "model": code,
+        "date_range": {
+            "from": from_date.isoformat() if from_date else None,
+            "to": to_date.isoformat() if to_date else None
+        },
+        **histogram_data
+    }
+
+
+@router.get("/compare")
+async def compare(
+    codes: str = Query(..., description="Comma separated model codes, e.g. GB,KNN,NN"),
+    from_date: Optional[datetime] = Query(None, description="From date (YYYY-MM-DD)"),
+    to_date: Optional[datetime] = Query(None, description="To date (YYYY-MM-DD)"),
+    metrics: bool = Query(False, description="Include RMSE and R² against FM")
+):
+    if from_date and to_date and from_date > to_date:
+        raise HTTPException(status_code=400, detail="from_date must be before to_date")
+
+    # Keep the caller's order, drop duplicates
+    model_codes = list(dict.fromkeys(c.strip().upper() for c in codes.split(",") if c.strip()))
+    invalid_codes = [c for c in model_codes if c not in registry.codes]
+    if not model_codes or invalid_codes:
+        raise HTTPException(status_code=400, detail=f"Invalid model codes {invalid_codes}. Choose from {registry.codes}")
+
+    missing_codes = [c for c in model_codes if not registry.exists(c)]
+    if missing_codes:
+        raise HTTPException(status_code=500, detail=f"Model file not found for {missing_codes}")
+
+    try:
+        result = await single_flight.do(
+            ("compare", tuple(model_codes), from_date, to_date, metrics),
+            lambda: _with_own_session(lambda db: compare_models(model_codes, db, from_date, to_date, metrics))
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "models": model_codes,
+        "date_range": {
+            "from": from_date.isoformat() if from_date else None,
+            "to": to_date.isoformat() if to_date else None
+        },
+        "count": result.get("count", 0),
+        "data": result.get("data", []),
+        **({"metrics": result.get("metrics")} if metrics else {})
+    }
+
+
+@router.get("/evaluate")
+async def evaluate(
+    code: Literal["GB", "KNN", "LR", "NN", "RF"] = Query(..., description="Model code"),
+    group_by: Literal["ID", "region", "month"] = Query("ID", description="Report metrics per sensor, region or month"),
+    from_date: Optional[datetime] = Query(None, description="From date (YYYY-MM-DD)"),
+    to_date: Optional[datetime] = Query(None, description="To date (YYYY-MM-DD)"),
+    site_id: Optional[str] = Query(None, alias="ID", description="Sensor ID, e.g. IA3"),
+    region: Optional[str] = Query(None, description="Region name"),
+    aqs_site_id: Optional[str] = Query(None, alias="AQS_Site_ID", description="AQS site ID, e.g. 19-153-0030")
+):
+    # count, bias, RMSE, MAE and R² against FM per group, cached per model and data version
+    if from_date and to_date and from_date > to_date:
+        raise HTTPException(status_code=400, detail="from_date must be before to_date")
+
+    if not registry.exists(code):
+        raise HTTPException(status_code=500, detail="Model file not found")
+
+    filters = ReadingFilters(site_id=site_id, region=region, aqs_site_id=aqs_site_id)
+    try:
+        result = await single_flight.do(
+            ("evaluate", code, group_by, from_date, to_date, filters),
+            lambda: _with_own_session(lambda db: cached_evaluation(code, db, group_by, from_date, to_date, filters))
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not result:
+        raise HTTPException(status_code=404, detail="No data found for the given range")
+
+    return {
+        "model": code,
+        "model_version": registry.version(code),
+        "group_by": group_by,
+        "date_range": {
+            "from": from_date.isoformat() if from_date else None,
+            "to": to_date.isoformat() if to_date else None
+        },
+        **result
+    }
+
+
+@router.get("/models")
+async def get_model_stats():
+    # Load time, resident memory and cache counters for every loaded model
+    return {
+        **registry.stats(),
+        "inference": inference_executor.stats(),
+        "single_flight": single_flight.stats(),
+        "micro_batch": micro_batcher.stats(),
+        "histogram_cache": histogram_cache.stats(),
+        "evaluation_cache": evaluation_cache.stats()
+    }
+
+
+@router.get("/drift")
+async def get_drift(
+    code: Optional[Literal["GB", "KNN", "LR", "NN", "RF"]] = Query(None, description="Model code (default: all)"),
+    site_id: Optional[str] = Query(None, alias="ID", description="Sensor ID, e.g. IA3"),
+    db: AsyncSession = Depends(get_db)
+):
+    # Running residual statistics of the currently served model versions, maintained at ingest
+    codes = [code] if code else [c for c in registry.codes if registry.exists(c)]
+    try:
+        stats = await drift_report(db, {c: registry.version(c) for c in codes}, site_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "window_size": settings.DRIFT_WINDOW,
+        "z_threshold": settings.DRIFT_Z_THRESHOLD,
+        "drifting": sum(s["drifting"] for s in stats),
+        "data": stats
+    }
+
+
+@router.get("/memory")
+async def get_memory_report():
+    # RSS, PSS and USS of the master, every worker and their inference processes
+    try:
+        return memory_report()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
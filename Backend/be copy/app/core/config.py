@@ -12,6 +12,64 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     GOOGLE_CLIENT_ID: str
 
+    # Number of deserialized models kept in the in-process registry
+    MODEL_CACHE_SIZE: int = 5
+
+    # Process pool used for model inference and plot rendering (0 = thread fallback)
+    INFERENCE_WORKERS: int = 2
+    # Seconds a request waits for its inference task. A timed-out task keeps its worker until it finishes
+    # (running work cannot be interrupted) and stays counted as in flight until then
+    INFERENCE_TIMEOUT: float = 60.0
+    # "fork" shares this process's preloaded models with the workers copy-on-write; "forkserver" forks them
+    # from a server that loads its own copy (app/services/model_preload.py); "spawn" loads one per worker
+    INFERENCE_START_METHOD: str = "spawn"
+
+    # Rows fetched and predicted per chunk when /predictors/predict streams NDJSON/CSV
+    PREDICTION_STREAM_CHUNK_SIZE: int = 5000
+
+    # Largest page a client may ask for with limit= on /predictors/predict
+    PREDICTION_MAX_PAGE_SIZE: int = 50000
+
+    # POST /predictors/predict-batch: rows per inference task, and the most rows one body may carry
+    PREDICT_BATCH_CHUNK_ROWS: int = 100000
+    PREDICT_BATCH_MAX_ROWS: int = 5000000
+    # Bodies over this size are refused before they are read in full or decoded (room for the row limit as CSV / JSON)
+    PREDICT_BATCH_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # /predictors/predict-point: concurrent single rows are predicted together once
+    # the oldest has waited this long or the batch is this large
+    MICRO_BATCH_MAX_WAIT_MS: float = 2.0
+    MICRO_BATCH_MAX_ROWS: int = 256
+
+    # /predictors/evaluate results kept in memory per worker
+    EVALUATION_CACHE_SIZE: int = 128
+
+    # Upper bound for the rendered histogram cache under static/histograms/cache
+    HISTOGRAM_CACHE_MAX_BYTES: int = 200 * 1024 * 1024
+
+    # NumPy NN forward pass: float32 halves memory traffic, batches bound intermediates
+    NN_INFERENCE_DTYPE: str = "float64"
+    NN_INFERENCE_BATCH_SIZE: int = 65536
+
+    # "sklearn" or "compiled" (packed-array evaluator in app/services/tree_ensemble.py) for GB/RF
+    TREE_BACKEND: str = "sklearn"
+    TREE_BATCH_SIZE: int = 4096
+    # Batches at least this large go back to sklearn, which wins past a few hundred rows
+    TREE_FALLBACK_MIN_ROWS: int = 512
+
+    # Threads per KD-tree query in the KNN index (-1 = all cores)
+    KNN_QUERY_WORKERS: int = 1
+
+    # Prometheus text metrics at /metrics plus per-request timing middleware
+    METRICS_ENABLED: bool = True
+
+    # Memory-map model arrays read-only so server and inference processes share one copy
+    MODEL_MMAP: bool = False
+
+    # /predictors/drift: recent residuals kept per sensor and model, and the |z| that counts as drift
+    DRIFT_WINDOW: int = 256
+    DRIFT_Z_THRESHOLD: float = 3.0
+
     class Config:
         env_file = ".env"
 
@@ -1,7 +1,20 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+import io
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Float, DateTime, Date, select, func, and_, insert, table, column, text
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.postgresql import asyncpg as pg_asyncpg
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.base import Base
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 class AirQualitySiteDB(Base):
     __tablename__ = "air_quality_sites"
 
@@ -11,10 +24,295 @@ class AirQualitySiteDB(Base):
     cf1 = Column(Float, nullable=False)
     TempC = Column(Float, nullable=False)
     RH = Column(Float, nullable=False)
-    region = Column(String, nullable=False)
-    ID = Column(String, nullable=False)
-    AQS_Site_ID = Column(String, nullable=False)
+    region = Column(String, nullable=False, index=True)
+    ID = Column(String, nullable=False, index=True)
+    AQS_Site_ID = Column(String, nullable=False, index=True)
     Latitude = Column(Float, nullable=False)
     Longitude = Column(Float, nullable=False)
     created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
\ No newline at end of file
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+# Postgres binary COPY layout for the fixed-width types we fetch column-wise
+_PG_EPOCH_US = 946684800000000  # 2000-01-01 in microseconds since the Unix epoch
+_PG_EPOCH_DAYS = 10957          # 2000-01-01 in days since the Unix epoch
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+_COPY_DIALECT = pg_asyncpg.dialect(paramstyle="numeric_dollar")
+
+
+# Columns an upload supplies; id_no comes from the sequence
+INSERT_COLUMNS = ["Date", "FM", "cf1", "TempC", "RH", "region", "ID", "AQS_Site_ID", "Latitude", "Longitude",
+                  "created_at", "updated_at"]
+# What materialize_predictions needs back from every inserted row
+RETURNED_COLUMNS = ["id_no", "cf1", "RH", "TempC", "FM", "ID"]
+_STAGING_TABLE = "air_quality_sites_staging"
+
+
+class ColumnarFetchUnsupported(Exception):
+    """Raised when a query cannot be decoded by the binary COPY fast path."""
+    pass
+
+
+def _binary_dtype(column_type) -> str:
+    if isinstance(column_type, Float):
+        return ">f8"
+    if isinstance(column_type, DateTime):
+        return ">i8"
+    if isinstance(column_type, Date):
+        return ">i4"
+    if isinstance(column_type, BigInteger):
+        return ">i8"
+    if isinstance(column_type, Integer):
+        return ">i4"
+    raise ColumnarFetchUnsupported(f"No fixed-width binary layout for {column_type!r}")
+
+
+def _check_binary_copy(query):
+    # Decided from the query alone so undecodable selects skip the COPY round trip entirely
+    for name, expression in query.selected_columns.items():
+        _binary_dtype(expression.type)
+        element = getattr(expression, "element", expression)  # look through labels
+        if isinstance(element, Column) and element.nullable:
+            raise ColumnarFetchUnsupported(f"Column {name} is nullable")
+
+
+def _decode_binary_copy(buffer: bytes, names: list, types: list) -> Dict[str, np.ndarray]:
+    if not buffer.startswith(_COPY_SIGNATURE):
+        raise ColumnarFetchUnsupported("Unexpected COPY header")
+
+    # Header: signature, int32 flags, int32 extension length, extension bytes
+    extension_length = int.from_bytes(buffer[15:19], "big")
+    body = memoryview(buffer)[19 + extension_length:-2]  # trailing int16 -1 marks the end
+
+    dtypes = [_binary_dtype(t) for t in types]
+    row_dtype = np.dtype(
+        [("nfields", ">i2")]
+        + [field for i, dt in enumerate(dtypes) for field in ((f"len{i}", ">i4"), (f"col{i}", dt))]
+    )
+    if len(body) % row_dtype.itemsize:
+        # Variable-sized rows mean a NULL slipped in
+        raise ColumnarFetchUnsupported("Rows are not fixed width (NULL values?)")
+
+    rows = np.frombuffer(body, dtype=row_dtype)
+    for i, dt in enumerate(dtypes):
+        if len(rows) and not (rows[f"len{i}"] == np.dtype(dt).itemsize).all():
+            raise ColumnarFetchUnsupported("Rows are not fixed width (NULL values?)")
+
+    columns = {}
+    for i, (name, column_type) in enumerate(zip(names, types)):
+        values = rows[f"col{i}"]
+        if isinstance(column_type, DateTime):
+            columns[name] = (values.astype(np.int64) + _PG_EPOCH_US).astype("datetime64[us]")
+        elif isinstance(column_type, Date):
+            columns[name] = (values.astype(np.int64) + _PG_EPOCH_DAYS).astype("datetime64[D]")
+        else:
+            columns[name] = values.astype(values.dtype.newbyteorder("="))
+    return columns
+
+
+async def fetch_columns(db: AsyncSession, query) -> Dict[str, np.ndarray]:
+    """
+    Run a column-only select and return one contiguous NumPy array per column.
+
+    On asyncpg the query is wrapped in a binary COPY ... TO STDOUT and decoded
+    with a single np.frombuffer call, so no per-row Python objects are created.
+    Queries selecting variable-width types or nullable columns go straight to a
+    plain asyncpg fetch, as do results that still hold a NULL (outer joins).
+    Other drivers use a regular SQLAlchemy execute.
+    """
+    names = list(query.selected_columns.keys())
+    types = [c.type for c in query.selected_columns]
+    connection = await db.connection()
+
+    if connection.dialect.driver == "asyncpg":
+        compiled = query.compile(dialect=_COPY_DIALECT)
+        params = [compiled.params[name] for name in compiled.positiontup]
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+
+        try:
+            _check_binary_copy(query)
+            output = io.BytesIO()
+            await driver_connection.copy_from_query(compiled.string, *params, output=output, format="binary")
+            return _decode_binary_copy(output.getvalue(), names, types)
+        except ColumnarFetchUnsupported as e:
+            logger.info(f"Binary COPY fast path not used: {e}")
+
+        records = await driver_connection.fetch(compiled.string, *params)
+    else:
+        records = (await db.execute(query)).all()
+
+    return {
+        name: np.array([r[i] for r in records])
+        for i, name in enumerate(names)
+    }
+
+
+def filter_date_range(query, from_date: Optional[datetime], to_date: Optional[datetime]):
+    if from_date and to_date:
+        query = query.where(
+            and_(
+                AirQualitySiteDB.Date >= from_date,
+                AirQualitySiteDB.Date <= to_date
+            )
+        )
+    return query
+
+
+@dataclass(frozen=True)
+class ReadingFilters:
+    """
+    Site and paging filters applied in SQL next to the date range. Pages are
+    keyset based: after is the id_no of the last row already seen, and rows
+    come back in id_no order.
+    """
+    site_id: Optional[str] = None
+    region: Optional[str] = None
+    aqs_site_id: Optional[str] = None
+    after: Optional[int] = None
+    limit: Optional[int] = None
+
+    @property
+    def paginated(self) -> bool:
+        return self.after is not None or self.limit is not None
+
+    def where(self, query):
+        if self.site_id is not None:
+            query = query.where(AirQualitySiteDB.ID == self.site_id)
+        if self.region is not None:
+            query = query.where(AirQualitySiteDB.region == self.region)
+        if self.aqs_site_id is not None:
+            query = query.where(AirQualitySiteDB.AQS_Site_ID == self.aqs_site_id)
+        if self.after is not None:
+            query = query.where(AirQualitySiteDB.id_no > self.after)
+        return query
+
+    def paginate(self, query):
+        if self.paginated:
+            query = query.order_by(AirQualitySiteDB.id_no)
+        if self.limit is not None:
+            query = query.limit(self.limit)
+        return query
+
+    def cache_key(self) -> str:
+        values = (self.site_id, self.region, self.aqs_site_id, self.after, self.limit)
+        if all(v is None for v in values):
+            return ""
+        return "|".join("" if v is None else str(v) for v in values)
+
+
+def filter_readings(query, from_date: Optional[datetime], to_date: Optional[datetime],
+                    filters: Optional[ReadingFilters] = None, paginate: bool = True):
+    """Date range plus optional site and page filters; aggregates pass paginate=False."""
+    query = filter_date_range(query, from_date, to_date)
+    if filters:
+        query = filters.where(query)
+        if paginate:
+            query = filters.paginate(query)
+    return query
+
+
+async def fetch_data_version(db: AsyncSession, from_date: Optional[datetime] = None,
+                             to_date: Optional[datetime] = None, filters: Optional[ReadingFilters] = None) -> str:
+    """
+    Cheap fingerprint of the readings in a date range. It changes whenever rows
+    are added, removed or updated, so it can be part of a cache key.
+    """
+    query = select(
+        func.count(AirQualitySiteDB.id_no),
+        func.max(AirQualitySiteDB.id_no),
+        func.max(AirQualitySiteDB.updated_at)
+    )
+
+    # Ignores the page size: a change anywhere after the cursor still changes the version
+    query = filter_readings(query, from_date, to_date, filters, paginate=False)
+    count, max_id, max_updated = (await db.execute(query)).one()
+    return f"{count}-{max_id}-{max_updated.isoformat() if max_updated else ''}"
+
+
+async def fetch_column_histograms(db: AsyncSession, column_names: List[str], bins: int,
+                                  from_date: Optional[datetime] = None,
+                                  to_date: Optional[datetime] = None) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Equal-width histograms of raw reading columns computed in Postgres with
+    width_bucket, so only the bin counts leave the database. Edges follow
+    numpy.histogram: the last bin is closed and a constant column is centred
+    in a bin of width one.
+    """
+    columns = [getattr(AirQualitySiteDB, name) for name in column_names]
+    bounds_query = select(*[agg(c) for c in columns for agg in (func.min, func.max)])
+    bounds = (await db.execute(filter_date_range(bounds_query, from_date, to_date))).one()
+
+    histograms = {}
+    for i, (name, reading_column) in enumerate(zip(column_names, columns)):
+        low, high = bounds[2 * i], bounds[2 * i + 1]
+        if low is None:
+            histograms[name] = (np.array([]), np.zeros(bins, dtype=np.int64))
+            continue
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+
+        # width_bucket puts the maximum in bucket bins + 1; fold it into the last bin
+        bucket = func.least(func.width_bucket(reading_column, low, high, bins), bins).label("bucket")
+        query = filter_date_range(select(bucket, func.count()).group_by(bucket), from_date, to_date)
+        rows = (await db.execute(query)).all()
+
+        counts = np.zeros(bins, dtype=np.int64)
+        for bucket_number, count in rows:
+            counts[bucket_number - 1] = count
+        histograms[name] = (np.linspace(low, high, bins + 1), counts)
+
+    return histograms
+
+
+async def insert_readings(db: AsyncSession, rows: List[dict]) -> list:
+    """
+    Insert readings (dicts keyed by INSERT_COLUMNS) in one set-based statement
+    and return (id_no, cf1, RH, TempC, FM, ID) for every inserted row. The caller
+    commits.
+
+    On asyncpg the rows are COPYed into a temporary staging table, dropped at
+    commit, and moved over with INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+    Readings have no natural unique key (the same sensor and date legitimately
+    repeat), so the conflict clause only guards the primary key and any unique
+    index added later. Other drivers get batched multi-row INSERT ... VALUES
+    with the same conflict clause where the dialect has one; skipped rows are
+    not returned.
+    """
+    if not rows:
+        return []
+
+    target = AirQualitySiteDB.__table__
+    returning = [target.c[name] for name in RETURNED_COLUMNS]
+    connection = await db.connection()
+
+    if connection.dialect.driver != "asyncpg":
+        # executemany with RETURNING is sent as batched multi-row VALUES ("insertmanyvalues") from
+        # one cached statement; insert().values(rows) would be recompiled with every parameter inlined
+        dialect_insert = {"postgresql": pg_insert, "sqlite": sqlite_insert}.get(connection.dialect.name)
+        statement = dialect_insert(target).on_conflict_do_nothing() if dialect_insert else insert(target)
+        return (await db.execute(statement.returning(*returning), rows)).all()
+
+    columns = ", ".join(f'"{name}"' for name in INSERT_COLUMNS)
+    await db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {_STAGING_TABLE} ON COMMIT DROP AS "
+        f"SELECT {columns} FROM {target.name} WITH NO DATA"
+    ))
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        _STAGING_TABLE,
+        records=[tuple(row[name] for name in INSERT_COLUMNS) for row in rows],
+        columns=INSERT_COLUMNS
+    )
+
+    staging = table(_STAGING_TABLE, *[column(name) for name in INSERT_COLUMNS])
+    result = await db.execute(
+        pg_insert(target)
+        .from_select(INSERT_COLUMNS, select(*[staging.c[name] for name in INSERT_COLUMNS]))
+        .on_conflict_do_nothing()
+        .returning(*returning)
+    )
+    inserted = result.all()
+    # Empty the staging table too, in case the caller inserts again before committing
+    await db.execute(text(f"TRUNCATE {_STAGING_TABLE}"))
+    return inserted
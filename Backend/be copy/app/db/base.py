@@ -45,6 +45,24 @@ class Base(DeclarativeBase):
         return cls.__name__.lower()
 
 
+def create_missing_indexes(connection):
+    """
+    create_all only builds indexes together with a new table. Add the ones
+    declared since then to tables that already exist; run it through
+    run_sync right after create_all. Building an index on a large table
+    blocks writes to it until done, once.
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info(f"Creating missing index {index.name} on {table.name}")
+                index.create(connection)
+
+
 async def check_db_connection():
     async with engine.connect() as connection:
         try:
@@ -0,0 +1,44 @@
+from typing import Sequence
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, delete, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.base import Base
+
+
+class CalibratedPredictionDB(Base):
+    __tablename__ = "calibrated_predictions"
+
+    id_no = Column(Integer, ForeignKey("air_quality_sites.id_no", ondelete="CASCADE"), primary_key=True)
+    model_code = Column(String, primary_key=True)
+    model_version = Column(String, primary_key=True)
+    calibrated = Column(Float, nullable=False)
+
+
+async def save_calibrated_predictions(db: AsyncSession, model_code: str, model_version: str,
+                                      ids: Sequence[int], values: Sequence[float]):
+    """
+    Store calibrated values for one model version and drop rows computed by any
+    older version of the same model for those readings.
+    """
+    if not len(ids):
+        return
+
+    ids = [int(i) for i in ids]
+    await db.execute(
+        delete(CalibratedPredictionDB).where(
+            and_(
+                CalibratedPredictionDB.model_code == model_code,
+                CalibratedPredictionDB.model_version != model_version,
+                CalibratedPredictionDB.id_no.in_(ids)
+            )
+        )
+    )
+
+    rows = [
+        {"id_no": i, "model_code": model_code, "model_version": model_version, "calibrated": float(v)}
+        for i, v in zip(ids, values)
+    ]
+    stmt = insert(CalibratedPredictionDB).on_conflict_do_nothing(
+        index_elements=["id_no", "model_code", "model_version"]
+    )
+    await db.execute(stmt, rows)
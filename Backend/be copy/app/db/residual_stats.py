@@ -0,0 +1,75 @@
+from typing import Dict, List, Optional
+from sqlalchemy import Column, String, Float, BigInteger, LargeBinary, select, delete, and_, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.base import Base
+
+
+class ResidualStatsDB(Base):
+    """
+    Running residual statistics (calibrated - FM) of one model version on one
+    sensor. count, mean and m2 are Welford accumulators; recent holds the last
+    few residuals as little-endian float32, oldest first.
+    """
+    __tablename__ = "residual_stats"
+
+    site_id = Column(String, primary_key=True)
+    model_code = Column(String, primary_key=True)
+    model_version = Column(String, primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)
+    abs_mean = Column(Float, nullable=False, default=0.0)
+    recent = Column(LargeBinary, nullable=False, default=b"")
+
+
+async def lock_residual_stats(db: AsyncSession, model_code: str, model_version: str,
+                              site_ids: List[str]) -> Dict[str, ResidualStatsDB]:
+    """
+    Rows for these sensors, created empty when missing and locked until the
+    transaction ends, so concurrent ingests merge one after the other. Keys are
+    locked in sorted order to rule out deadlocks between them.
+    """
+    site_ids = sorted(set(site_ids))
+    await db.execute(
+        insert(ResidualStatsDB).on_conflict_do_nothing(
+            index_elements=["site_id", "model_code", "model_version"]
+        ),
+        [{"site_id": s, "model_code": model_code, "model_version": model_version, "count": 0, "mean": 0.0,
+          "m2": 0.0, "abs_mean": 0.0, "recent": b""} for s in site_ids]
+    )
+    result = await db.execute(
+        select(ResidualStatsDB)
+        .where(and_(
+            ResidualStatsDB.model_code == model_code,
+            ResidualStatsDB.model_version == model_version,
+            ResidualStatsDB.site_id.in_(site_ids)
+        ))
+        .order_by(ResidualStatsDB.site_id)
+        .with_for_update()
+    )
+    return {row.site_id: row for row in result.scalars().all()}
+
+
+async def fetch_residual_stats(db: AsyncSession, model_versions: Dict[str, str],
+                               site_id: Optional[str] = None) -> List[ResidualStatsDB]:
+    """Stored statistics for the given model_code -> model_version pairs, optionally one sensor only."""
+    if not model_versions:
+        return []
+    query = select(ResidualStatsDB).where(
+        tuple_(ResidualStatsDB.model_code, ResidualStatsDB.model_version).in_(list(model_versions.items()))
+    )
+    if site_id is not None:
+        query = query.where(ResidualStatsDB.site_id == site_id)
+    result = await db.execute(query.order_by(ResidualStatsDB.site_id, ResidualStatsDB.model_code))
+    return list(result.scalars().all())
+
+
+async def replace_residual_stats(db: AsyncSession, model_code: str, model_version: str, rows: List[dict]):
+    """Drop every stored row of this model version and write rows instead (used by the rebuild)."""
+    await db.execute(delete(ResidualStatsDB).where(and_(
+        ResidualStatsDB.model_code == model_code,
+        ResidualStatsDB.model_version == model_version
+    )))
+    if rows:
+        await db.execute(insert(ResidualStatsDB), rows)
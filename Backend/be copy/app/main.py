@@ -2,7 +2,11 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from app.api.routes import register_routes
 from app.api.routes.cors import configure_cors
-from app.db.base import Base, engine, check_db_connection  # Import the async check function
+from app.api.routes.metrics import configure_metrics
+from app.db.base import Base, engine, check_db_connection, create_missing_indexes  # Import the async check function
+from app.services.model_registry import registry
+from app.services.inference import inference_executor
+from app.core.config import settings
 import logging
 import os
 
@@ -17,6 +21,10 @@ configure_cors(app)
 # Register API routes
 register_routes(app)
 
+# Request timings and component counters, served at /metrics
+if settings.METRICS_ENABLED:
+    configure_metrics(app)
+
 @app.on_event("startup")
 async def startup():
     # Ensure the directory exists
@@ -35,6 +43,21 @@ async def startup():
     async with engine.begin() as conn:
         # This will create all the tables defined in Base.metadata
         await conn.run_sync(Base.metadata.create_all)
+        # Tables created by an earlier version miss the indexes added since
+        await conn.run_sync(create_missing_indexes)
+
+    # Only the thread fallback predicts in this process. With a pool the workers hold the models
+    # (see InferenceExecutor.start) and this process only needs their versions, read from the file hashes
+    if settings.INFERENCE_WORKERS == 0:
+        timings = registry.warm_up()
+        logging.info(f"Model warm-up load times: {timings}")
+
+    inference_executor.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    inference_executor.shutdown()
 
 
 @app.get("/")
@@ -34,6 +34,9 @@ class AirQualitySite(BaseModel):
 
     @validator('Date', pre=True)
     def parse_date(cls, value):
+        # Rows read back from the database already hold a datetime
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d")
         # Try multiple date formats
         date_formats = ["%m/%d/%Y", "%d-%m-%Y", "%m-%d-%Y"]
         for fmt in date_formats:
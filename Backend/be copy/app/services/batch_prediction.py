@@ -0,0 +1,206 @@
+"""
+Calibration of caller-supplied feature rows, for POST /predictors/predict-batch.
+
+Bodies are decoded straight into one float64 (n, 3) matrix in FEATURE_COLUMNS
+order, with no per-row objects:
+
+    application/json                     {"cf1": [...], "RH": [...], "TempC": [...]}
+    text/csv                             header row with cf1 (or PA), RH, TempC
+    application/x-npy                    (n, 3) array, or a structured array with those fields
+    application/vnd.apache.arrow.stream  Arrow IPC stream (or .file) with those columns
+
+Bodies over PREDICT_BATCH_MAX_BYTES are refused before decoding (the route
+also checks Content-Length before reading), and .npy bodies are checked
+against PREDICT_BATCH_MAX_ROWS from their header alone.
+
+The matrix is cut into chunks that run concurrently in the inference pool.
+The calibrated values come back in the request's format, one per input row
+and in input order. Rows with a missing feature are not sent to the model
+(GB and LR reject NaN) and come back as null / NaN. Arrow needs pyarrow,
+which is imported only when an Arrow body arrives.
+"""
+import io
+import json
+import asyncio
+from typing import Tuple
+import numpy as np
+import pandas as pd
+from app.core.config import settings
+from app.services.dataset import FEATURE_COLUMNS
+from app.services.inference import inference_executor
+from app.services.metrics import stage_timer, prediction_rows
+
+JSON_MEDIA_TYPE = "application/json"
+CSV_MEDIA_TYPE = "text/csv"
+NPY_MEDIA_TYPE = "application/x-npy"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+ARROW_FILE_MEDIA_TYPE = "application/vnd.apache.arrow.file"
+BATCH_MEDIA_TYPES = [JSON_MEDIA_TYPE, CSV_MEDIA_TYPE, NPY_MEDIA_TYPE, ARROW_STREAM_MEDIA_TYPE, ARROW_FILE_MEDIA_TYPE]
+
+# PurpleAir exports call the cf1 channel PA (see app/services/dataset.py)
+COLUMN_ALIASES = {"PA": "cf1"}
+
+
+class BatchInputError(Exception):
+    """Custom exception for request bodies that cannot be decoded into feature rows."""
+    pass
+
+
+class BatchTooLargeError(Exception):
+    """Custom exception for batches over PREDICT_BATCH_MAX_ROWS or PREDICT_BATCH_MAX_BYTES."""
+    pass
+
+
+class UnsupportedMediaTypeError(Exception):
+    """Custom exception for batch bodies in a format the endpoint does not read."""
+    pass
+
+
+def media_type_of(content_type: str) -> str:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type not in BATCH_MEDIA_TYPES:
+        raise UnsupportedMediaTypeError(f"Unsupported Content-Type {content_type!r}. Use one of {BATCH_MEDIA_TYPES}")
+    return media_type
+
+
+def check_body_size(size: int):
+    if size > settings.PREDICT_BATCH_MAX_BYTES:
+        raise BatchTooLargeError(f"Body of {size} bytes exceeds the limit of {settings.PREDICT_BATCH_MAX_BYTES}")
+
+
+def check_row_count(rows: int):
+    if rows > settings.PREDICT_BATCH_MAX_ROWS:
+        raise BatchTooLargeError(f"{rows} rows exceed the limit of {settings.PREDICT_BATCH_MAX_ROWS}")
+
+
+def _stack_columns(columns: dict) -> np.ndarray:
+    columns = {COLUMN_ALIASES.get(name, name): values for name, values in columns.items()}
+    missing = [name for name in FEATURE_COLUMNS if name not in columns]
+    if missing:
+        raise BatchInputError(f"Missing feature columns {missing}")
+    try:
+        arrays = [np.asarray(columns[name], dtype=np.float64) for name in FEATURE_COLUMNS]
+    except (TypeError, ValueError) as e:
+        raise BatchInputError(f"Feature columns must be numeric: {e}")
+    if any(a.ndim != 1 for a in arrays) or len({len(a) for a in arrays}) != 1:
+        raise BatchInputError("Feature columns must be flat lists of equal length")
+    return np.column_stack(arrays)
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        raise UnsupportedMediaTypeError("Arrow bodies need pyarrow, which is not installed on this server")
+    return pyarrow
+
+
+def decode_features(body: bytes, media_type: str) -> np.ndarray:
+    """(n, 3) float64 matrix in FEATURE_COLUMNS order; null / empty cells become NaN."""
+    if media_type == JSON_MEDIA_TYPE:
+        try:
+            columns = json.loads(body)
+        except ValueError as e:
+            raise BatchInputError(f"Invalid JSON: {e}")
+        if not isinstance(columns, dict):
+            raise BatchInputError('JSON body must be columnar: {"cf1": [...], "RH": [...], "TempC": [...]}')
+        return _stack_columns(columns)
+
+    if media_type == CSV_MEDIA_TYPE:
+        try:
+            frame = pd.read_csv(io.BytesIO(body), usecols=lambda c: COLUMN_ALIASES.get(c, c) in FEATURE_COLUMNS)
+        except (ValueError, pd.errors.ParserError) as e:
+            raise BatchInputError(f"Invalid CSV: {e}")
+        return _stack_columns({name: frame[name].to_numpy() for name in frame.columns})
+
+    if media_type == NPY_MEDIA_TYPE:
+        try:
+            stream = io.BytesIO(body)
+            # The header gives the shape, so oversized arrays are refused without reading the data
+            read_header = np.lib.format.read_array_header_1_0 if np.lib.format.read_magic(stream) == (1, 0) \
+                else np.lib.format.read_array_header_2_0
+            shape, _, _ = read_header(stream)
+            check_row_count(shape[0] if shape else 1)
+            array = np.load(io.BytesIO(body), allow_pickle=False)
+        except ValueError as e:
+            raise BatchInputError(f"Invalid .npy body: {e}")
+        if array.dtype.names:
+            return _stack_columns({name: array[name] for name in array.dtype.names})
+        if array.ndim != 2 or array.shape[1] != len(FEATURE_COLUMNS):
+            raise BatchInputError(f".npy body must have shape (n, {len(FEATURE_COLUMNS)}) in {FEATURE_COLUMNS} order")
+        return np.ascontiguousarray(array, dtype=np.float64)
+
+    pa = _arrow()
+    try:
+        reader = pa.ipc.open_stream(body) if media_type == ARROW_STREAM_MEDIA_TYPE else pa.ipc.open_file(body)
+        table = reader.read_all()
+    except pa.ArrowInvalid as e:
+        raise BatchInputError(f"Invalid Arrow body: {e}")
+    return _stack_columns({
+        name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names
+    })
+
+
+def encode_predictions(predictions: np.ndarray, media_type: str) -> Tuple[bytes, str]:
+    """(body, media type) holding one calibrated value per input row."""
+    if media_type == JSON_MEDIA_TYPE:
+        values = predictions.tolist() if np.isfinite(predictions).all() \
+            else np.where(np.isfinite(predictions), predictions, None).tolist()
+        return json.dumps({"count": len(predictions), "calibrated": values}).encode(), media_type
+
+    if media_type == CSV_MEDIA_TYPE:
+        return pd.DataFrame({"calibrated": predictions}).to_csv(index=False, na_rep="NaN").encode(), media_type
+
+    if media_type == NPY_MEDIA_TYPE:
+        output = io.BytesIO()
+        np.save(output, predictions, allow_pickle=False)
+        return output.getvalue(), media_type
+
+    pa = _arrow()
+    table = pa.table({"calibrated": predictions})
+    output = pa.BufferOutputStream()
+    writer = pa.ipc.new_stream(output, table.schema) if media_type == ARROW_STREAM_MEDIA_TYPE \
+        else pa.ipc.new_file(output, table.schema)
+    with writer:
+        writer.write_table(table)
+    return output.getvalue().to_pybytes(), media_type
+
+
+async def predict_features(model_code: str, features: np.ndarray, mode: str = "exact",
+                           chunk_rows: int = settings.PREDICT_BATCH_CHUNK_ROWS) -> np.ndarray:
+    """
+    Calibrated value per row (NaN where a feature is missing). Complete rows go
+    through the model in chunks, at most one per inference worker at a time.
+    """
+    complete = np.isfinite(features).all(axis=1)
+    predictions = np.full(len(features), np.nan)
+    rows = features if complete.all() else features[complete]
+    if not len(rows):
+        return predictions
+
+    semaphore = asyncio.Semaphore(max(inference_executor.max_workers, 1))
+
+    async def run_chunk(start: int) -> np.ndarray:
+        async with semaphore:
+            chunk = await inference_executor.predict(model_code, rows[start:start + chunk_rows], mode=mode)
+            return np.asarray(chunk, dtype=np.float64).ravel()
+
+    chunks = await asyncio.gather(*[run_chunk(start) for start in range(0, len(rows), chunk_rows)])
+    predictions[complete] = np.concatenate(chunks)
+    return predictions
+
+
+async def predict_batch(model_code: str, body: bytes, content_type: str, mode: str = "exact") -> Tuple[bytes, str]:
+    """Decode, calibrate and encode one request body; nothing touches the database."""
+    media_type = media_type_of(content_type)
+    check_body_size(len(body))
+    with stage_timer("batch", model_code, "decode"):
+        features = decode_features(body, media_type)
+    check_row_count(len(features))
+    prediction_rows.observe(len(features), pipeline="batch", model=model_code)
+
+    with stage_timer("batch", model_code, "predict"):
+        predictions = await predict_features(model_code, features, mode)
+    with stage_timer("batch", model_code, "encode"):
+        return encode_predictions(predictions, media_type)
@@ -0,0 +1,19 @@
+import pandas as pd
+
+# Model inputs, in the column order every calibration model was trained on
+FEATURE_COLUMNS = ["cf1", "RH", "TempC"]
+TARGET_COLUMN = "FM"
+
+
+def load_dataset(path: str) -> pd.DataFrame:
+    """
+    Read a measurement CSV the same way the training notebooks do. Exports
+    that name the PurpleAir channel PA are renamed to cf1, and gaps are
+    forward/back filled.
+    """
+    data = pd.read_csv(path).rename(columns={"PA": "cf1"})
+    data = data.ffill().bfill()
+    missing = [c for c in FEATURE_COLUMNS + [TARGET_COLUMN] if c not in data.columns]
+    if missing:
+        raise ValueError(f"Dataset {path} is missing columns {missing}")
+    return data
@@ -0,0 +1,224 @@
+"""
+Residual and drift statistics per (sensor ID, model version), kept up to date
+as readings are ingested.
+
+Residuals are calibrated - FM, so a positive bias means the model reads
+high. Each ingest batch is reduced to per-sensor (count, mean, M2, mean |r|)
+with NumPy and merged into the stored accumulators with Chan's parallel
+update. Every stored row is O(1) state no matter how much history it covers.
+The last DRIFT_WINDOW residuals are kept as well. A window bias several
+standard errors away from the all-time bias is reported as drift.
+
+Readings stored before this existed can be folded in once:
+
+    python -m app.services.drift --rebuild
+"""
+import sys
+import math
+import asyncio
+import argparse
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy import select, func, and_
+from app.core.config import settings
+from app.db.air_quality_sites import AirQualitySiteDB
+from app.db.calibrated_predictions import CalibratedPredictionDB
+from app.db.residual_stats import (
+    ResidualStatsDB,
+    lock_residual_stats,
+    fetch_residual_stats,
+    replace_residual_stats
+)
+
+# Setting up a simple logger
+logger = logging.getLogger(__name__)
+
+WINDOW_DTYPE = np.dtype("<f4")
+
+
+def group_residuals(site_ids: Sequence[str], residuals: np.ndarray) -> Dict[str, dict]:
+    """Per-sensor count, mean, M2, mean |r| and the residuals themselves (in input order) of one batch."""
+    residuals = np.asarray(residuals, dtype=np.float64)
+    keep = np.isfinite(residuals)
+    sites, inverse = np.unique(np.asarray(site_ids, dtype=object)[keep], return_inverse=True)
+    residuals = residuals[keep]
+
+    counts = np.bincount(inverse, minlength=len(sites))
+    means = np.bincount(inverse, weights=residuals, minlength=len(sites)) / np.maximum(counts, 1)
+    m2 = np.bincount(inverse, weights=(residuals - means[inverse]) ** 2, minlength=len(sites))
+    abs_means = np.bincount(inverse, weights=np.abs(residuals), minlength=len(sites)) / np.maximum(counts, 1)
+
+    order = np.argsort(inverse, kind="stable")
+    per_site = np.split(residuals[order], np.cumsum(counts)[:-1])
+    return {
+        str(site): {"count": int(counts[i]), "mean": float(means[i]), "m2": float(m2[i]),
+                    "abs_mean": float(abs_means[i]), "residuals": per_site[i]}
+        for i, site in enumerate(sites)
+    }
+
+
+def merge_stats(count_a: int, mean_a: float, m2_a: float, abs_a: float,
+                count_b: int, mean_b: float, m2_b: float, abs_b: float):
+    """Chan et al. pairwise combination of two (count, mean, M2) accumulators, plus mean |r|."""
+    count = count_a + count_b
+    if count == 0:
+        return 0, 0.0, 0.0, 0.0
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / count
+    m2 = m2_a + m2_b + delta * delta * count_a * count_b / count
+    abs_mean = (abs_a * count_a + abs_b * count_b) / count
+    return count, mean, m2, abs_mean
+
+
+def append_window(recent: bytes, residuals: np.ndarray, size: int) -> bytes:
+    window = np.concatenate([np.frombuffer(recent, dtype=WINDOW_DTYPE), residuals.astype(WINDOW_DTYPE)])
+    return window[-size:].tobytes() if size > 0 else b""
+
+
+async def update_residual_stats(db, model_code: str, model_version: str, site_ids: Sequence[str],
+                                observed: np.ndarray, predicted: np.ndarray,
+                                window_size: int = settings.DRIFT_WINDOW):
+    """Fold one batch of freshly calibrated readings into the stored statistics (caller commits)."""
+    batch = group_residuals(site_ids, np.asarray(predicted, dtype=np.float64) - np.asarray(observed, dtype=np.float64))
+    if not batch:
+        return
+
+    rows = await lock_residual_stats(db, model_code, model_version, list(batch))
+    for site_id, stats in batch.items():
+        row = rows[site_id]
+        row.count, row.mean, row.m2, row.abs_mean = merge_stats(
+            row.count, row.mean, row.m2, row.abs_mean,
+            stats["count"], stats["mean"], stats["m2"], stats["abs_mean"]
+        )
+        row.recent = append_window(row.recent, stats["residuals"], window_size)
+    await db.flush()
+
+
+def summarize(row: ResidualStatsDB, z_threshold: float = settings.DRIFT_Z_THRESHOLD) -> dict:
+    count = int(row.count)
+    variance = row.m2 / (count - 1) if count > 1 else None
+    std = math.sqrt(variance) if variance is not None else None
+
+    window = np.frombuffer(row.recent, dtype=WINDOW_DTYPE).astype(np.float64)
+    window_bias = float(window.mean()) if len(window) else None
+    window_rmse = float(np.sqrt(np.mean(window ** 2))) if len(window) else None
+
+    # Standard errors between the recent bias and the long-run one
+    drift_z = None
+    if std and len(window):
+        drift_z = (window_bias - row.mean) / (std / math.sqrt(len(window)))
+
+    return {
+        "ID": row.site_id,
+        "model": row.model_code,
+        "model_version": row.model_version,
+        "count": count,
+        "bias": row.mean,
+        "variance": variance,
+        "std": std,
+        "rmse": math.sqrt(row.m2 / count + row.mean ** 2) if count else None,
+        "mae": row.abs_mean if count else None,
+        "window": {"count": len(window), "bias": window_bias, "rmse": window_rmse},
+        "drift_z": drift_z,
+        "drifting": drift_z is not None and abs(drift_z) > z_threshold,
+        "updated_at": row.updated_at.isoformat() if isinstance(row.updated_at, datetime) else row.updated_at
+    }
+
+
+async def drift_report(db, model_versions: Dict[str, str], site_id: Optional[str] = None) -> List[dict]:
+    """Summaries of the stored statistics; reads only the small residual_stats table."""
+    return [summarize(row) for row in await fetch_residual_stats(db, model_versions, site_id)]
+
+
+async def rebuild_residual_stats(db, model_code: str, model_version: str,
+                                 window_size: int = settings.DRIFT_WINDOW) -> int:
+    """
+    Recompute one model version's statistics from every stored calibrated value,
+    with the aggregates and the per-sensor recent window done in Postgres.
+    """
+    residual = (CalibratedPredictionDB.calibrated - AirQualitySiteDB.FM).label("residual")
+    joined = and_(
+        CalibratedPredictionDB.id_no == AirQualitySiteDB.id_no,
+        CalibratedPredictionDB.model_code == model_code,
+        CalibratedPredictionDB.model_version == model_version
+    )
+
+    totals = await db.execute(
+        select(
+            AirQualitySiteDB.ID,
+            func.count(),
+            func.avg(residual),
+            func.var_pop(residual) * func.count(),
+            func.avg(func.abs(residual))
+        ).join(CalibratedPredictionDB, joined).group_by(AirQualitySiteDB.ID)
+    )
+
+    # Newest window_size residuals per sensor in ingest order, the order live updates append in
+    rank = func.row_number().over(
+        partition_by=AirQualitySiteDB.ID,
+        order_by=(AirQualitySiteDB.created_at.desc(), AirQualitySiteDB.id_no.desc())
+    ).label("rank")
+    ranked = select(AirQualitySiteDB.ID, residual, rank).join(CalibratedPredictionDB, joined).subquery()
+    recent = await db.execute(
+        select(ranked.c.ID, ranked.c.residual)
+        .where(ranked.c.rank <= window_size)
+        .order_by(ranked.c.ID, ranked.c.rank.desc())
+    )
+    windows: Dict[str, list] = {}
+    for site_id, value in recent.all():
+        windows.setdefault(site_id, []).append(value)
+
+    rows = [
+        {
+            "site_id": site_id,
+            "model_code": model_code,
+            "model_version": model_version,
+            "count": count,
+            "mean": float(mean),
+            "m2": float(m2 or 0.0),
+            "abs_mean": float(abs_mean),
+            "recent": np.asarray(windows.get(site_id, []), dtype=WINDOW_DTYPE).tobytes()
+        }
+        for site_id, count, mean, m2, abs_mean in totals.all()
+    ]
+    await replace_residual_stats(db, model_code, model_version, rows)
+    return len(rows)
+
+
+async def _rebuild(codes: List[str]) -> dict:
+    from app.db.base import AsyncSessionLocal
+    from app.services.model_registry import registry
+
+    sensors = {}
+    async with AsyncSessionLocal() as db:
+        for code in codes:
+            if not registry.exists(code):
+                continue
+            sensors[code] = await rebuild_residual_stats(db, code, registry.version(code))
+        await db.commit()
+    return sensors
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.services.drift", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rebuild", action="store_true", help="Recompute statistics from the stored predictions")
+    parser.add_argument("--models", help="Comma separated model codes (default: every available model)")
+    args = parser.parse_args(argv)
+
+    if not args.rebuild:
+        parser.print_help()
+        return 0
+
+    from app.services.model_registry import registry
+    codes = [c.strip().upper() for c in args.models.split(",")] if args.models else registry.codes
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    sensors = asyncio.run(_rebuild(codes))
+    for code, count in sensors.items():
+        print(f"{code}: statistics rebuilt for {count} sensors")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Per-group accuracy of one model's calibrated values against FM, for
+/predictors/evaluate.
+
+Rows come from fetch_calibrated_frame, so stored predictions of the current
+model version are reused and only missing ones are computed. Grouping by ID
+or region stays on the binary COPY path: each row carries the smallest id_no
+of its group (a window min in SQL) instead of the string, and the k labels are
+looked up afterwards. Month groups come from the Date column. All groups are
+reduced at once with np.unique and np.bincount; there is no loop over groups.
+
+Results are cached in memory per worker, keyed by model version, data
+version (fetch_data_version), range, filters and grouping. New, changed or
+deleted readings and a new model version change the key.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Hashable, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func
+from app.core.config import settings
+from app.db.air_quality_sites import AirQualitySiteDB, ReadingFilters, fetch_data_version
+from app.services.model_registry import registry
+from app.services.metrics import stage_timer, prediction_rows
+from app.services.prediction import fetch_calibrated_frame
+
+# Setting up a simple logger
+logger = logging.getLogger(__name__)
+
+GROUP_COLUMNS = {"ID": AirQualitySiteDB.ID, "region": AirQualitySiteDB.region}
+GROUP_BY_OPTIONS = list(GROUP_COLUMNS) + ["month"]
+
+
+def grouped_metrics(keys: np.ndarray, predicted: np.ndarray, observed: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    count, bias, RMSE, MAE and R² of predicted against observed for every
+    distinct key, in sorted key order. Rows with a non-finite value are skipped;
+    r2 is NaN where a group's observations have no variance.
+    """
+    predicted = np.asarray(predicted, dtype=np.float64)
+    observed = np.asarray(observed, dtype=np.float64)
+    valid = np.isfinite(predicted) & np.isfinite(observed)
+    groups, inverse = np.unique(np.asarray(keys)[valid], return_inverse=True)
+    predicted, observed = predicted[valid], observed[valid]
+    size = len(groups)
+
+    counts = np.bincount(inverse, minlength=size)
+    n = np.maximum(counts, 1)
+    residuals = predicted - observed
+    ss_res = np.bincount(inverse, weights=residuals * residuals, minlength=size)
+    observed_mean = np.bincount(inverse, weights=observed, minlength=size) / n
+    ss_tot = np.bincount(inverse, weights=(observed - observed_mean[inverse]) ** 2, minlength=size)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = np.where(ss_tot > 0, 1.0 - ss_res / ss_tot, np.nan)
+    return {
+        "group": groups,
+        "count": counts,
+        "bias": np.bincount(inverse, weights=residuals, minlength=size) / n,
+        "rmse": np.sqrt(ss_res / n),
+        "mae": np.bincount(inverse, weights=np.abs(residuals), minlength=size) / n,
+        "r2": r2
+    }
+
+
+def _records(metrics: Dict[str, np.ndarray], labels) -> list:
+    def number(value: float) -> Optional[float]:
+        return float(value) if np.isfinite(value) else None
+
+    return [
+        {"group": label, "count": int(count), "bias": number(bias), "rmse": number(rmse), "mae": number(mae),
+         "r2": number(r2)}
+        for label, count, bias, rmse, mae, r2 in zip(labels, metrics["count"], metrics["bias"], metrics["rmse"],
+                                                    metrics["mae"], metrics["r2"])
+    ]
+
+
+async def _group_labels(db, group_by: str, representatives: np.ndarray) -> Dict[int, str]:
+    column = GROUP_COLUMNS[group_by]
+    result = await db.execute(
+        select(AirQualitySiteDB.id_no, column).where(AirQualitySiteDB.id_no.in_(representatives.tolist()))
+    )
+    return {id_no: label for id_no, label in result.all()}
+
+
+async def evaluate_model(model_code: str, db, group_by: str, from_date: Optional[datetime] = None,
+                         to_date: Optional[datetime] = None, filters: Optional[ReadingFilters] = None) -> dict:
+    """Overall and per-group metrics of the current model version; {} when the range has no readings."""
+    extra_columns = ()
+    if group_by in GROUP_COLUMNS:
+        # Smallest id_no of the row's group: an integer key, so the fetch stays fixed width
+        extra_columns = (
+            func.min(AirQualitySiteDB.id_no).over(partition_by=GROUP_COLUMNS[group_by]).label("group_key"),
+        )
+    df = await fetch_calibrated_frame(model_code, db, from_date, to_date, filters, pipeline="evaluate",
+                                      extra_columns=extra_columns)
+    prediction_rows.observe(len(df), pipeline="evaluate", model=model_code)
+    if df.empty:
+        return {}
+
+    with stage_timer("evaluate", model_code, "reduce"):
+        if group_by == "month":
+            keys = pd.to_datetime(df["Date"]).to_numpy().astype("datetime64[M]")
+        else:
+            keys = df["group_key"].to_numpy(dtype=np.int64)
+
+        predicted, observed = df["calibrated"].to_numpy(), df["FM"].to_numpy()
+        groups = grouped_metrics(keys, predicted, observed)
+        overall = grouped_metrics(np.zeros(len(df), dtype=np.int8), predicted, observed)
+
+    if group_by == "month":
+        labels = [str(month) for month in groups["group"]]
+    else:
+        names = await _group_labels(db, group_by, groups["group"])
+        labels = [names.get(int(key)) for key in groups["group"]]
+
+    data = sorted(_records(groups, labels), key=lambda record: record["group"] or "")
+    summary = _records(overall, [None])
+    return {
+        "count": int(overall["count"].sum()),
+        "overall": {k: v for k, v in summary[0].items() if k != "group"} if summary else None,
+        "groups": data
+    }
+
+
+class EvaluationCache:
+    """Least recently used in-memory cache of evaluation results."""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: Hashable, result: dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                "max_entries": self.max_entries}
+
+
+evaluation_cache = EvaluationCache(max_entries=settings.EVALUATION_CACHE_SIZE)
+
+
+async def evaluation_cache_key(model_code: str, db, group_by: str, from_date: Optional[datetime],
+                               to_date: Optional[datetime], filters: Optional[ReadingFilters] = None) -> tuple:
+    data_version = await fetch_data_version(db, from_date, to_date, filters)
+    return (model_code, registry.version(model_code), group_by, from_date, to_date, data_version,
+            filters.cache_key() if filters else "")
+
+
+async def cached_evaluation(model_code: str, db, group_by: str, from_date: Optional[datetime] = None,
+                            to_date: Optional[datetime] = None, filters: Optional[ReadingFilters] = None) -> dict:
+    with stage_timer("evaluate", model_code, "cache_key"):
+        key = await evaluation_cache_key(model_code, db, group_by, from_date, to_date, filters)
+    result = evaluation_cache.get(key)
+    if result is not None:
+        return {**result, "cached": True}
+
+    result = await evaluate_model(model_code, db, group_by, from_date, to_date, filters)
+    if result:
+        evaluation_cache.put(key, result)
+    return {**result, "cached": False} if result else result
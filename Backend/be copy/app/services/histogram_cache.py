@@ -0,0 +1,114 @@
+import os
+import hashlib
+import logging
+import threading
+import uuid
+from datetime import datetime
+from typing import Optional
+from app.core.config import settings
+
+# Setting up a simple logger
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_CACHE_DIR = "static/histograms/cache"
+HISTOGRAM_CACHE_URL = "/static/histograms/cache"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class HistogramCache:
+    """
+    Disk cache of rendered histogram PNGs named by a content key.
+
+    The key covers everything the image depends on (model version, date range,
+    data version), so a file is never overwritten with different content and
+    concurrent renders of the same key are harmless. Files are written under a
+    temporary name and moved into place atomically. When the directory grows
+    past max_bytes the least recently used files are removed.
+    """
+
+    def __init__(self, directory: str = HISTOGRAM_CACHE_DIR, max_bytes: int = 200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_code: str, model_version: str, from_date: Optional[datetime], to_date: Optional[datetime],
+            data_version: str, filters_key: str = "") -> str:
+        parts = [
+            model_code,
+            model_version,
+            from_date.isoformat() if from_date else "",
+            to_date.isoformat() if to_date else "",
+            data_version
+        ]
+        if filters_key:
+            # Only appended when set, so unfiltered keys stay as they were
+            parts.append(filters_key)
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]
+
+    @staticmethod
+    def etag(key: str) -> str:
+        return f'"{key}"'
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def url(self, key: str) -> str:
+        return f"{HISTOGRAM_CACHE_URL}/{key}.png"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path(key)
+        try:
+            # Bump the mtime so eviction treats this entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.url(key)
+
+    def temp_path(self, key: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.tmp.png")
+
+    def commit(self, key: str, temp_path: str) -> str:
+        os.replace(temp_path, self.path(key))
+        self.evict()
+        return self.url(key)
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".png") or name.startswith("."):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    total -= size
+                    logger.info(f"Evicted cached histogram {name}")
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "max_bytes": self.max_bytes}
+
+
+histogram_cache = HistogramCache(max_bytes=settings.HISTOGRAM_CACHE_MAX_BYTES)
@@ -0,0 +1,165 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+import numpy as np
+import pandas as pd
+from app.core.config import settings
+from app.services.model_registry import registry
+from app.services.dataset import FEATURE_COLUMNS
+
+# Setting up a simple logger
+logger = logging.getLogger(__name__)
+
+
+class InferenceTimeoutError(Exception):
+    """Custom exception for inference tasks that exceed the per-task timeout."""
+    pass
+
+
+def run_model(model, features: np.ndarray) -> np.ndarray:
+    # sklearn models fitted on DataFrames expect the same column names back
+    if hasattr(model, "feature_names_in_"):
+        features = pd.DataFrame(features, columns=list(model.feature_names_in_))
+    return np.asarray(model.predict(features), dtype=float).ravel()
+
+
+def _init_worker():
+    # Runs once in every worker process: load all models before the first task arrives
+    timings = registry.warm_up()
+    logger.info(f"Inference worker warmed models: {timings}")
+
+
+def predict_with_registry(model_code: str, features: np.ndarray, mode: str = "exact") -> np.ndarray:
+    model = registry.get(model_code)
+    if mode == "fast":
+        # Interpolate on the precomputed grid; rows outside it go to the real model
+        return registry.surrogate(model_code).predict(features, fallback=lambda X: run_model(model, X))
+    return run_model(model, features)
+
+
+def _predict_and_count(model_code: str, features: np.ndarray, mode: str = "exact"):
+    # The worker's model cache counters ride along with the result for /metrics
+    return predict_with_registry(model_code, features, mode), os.getpid(), registry.counters()
+
+
+class InferenceExecutor:
+    """
+    Runs model inference and plot rendering in a pool of pre-warmed worker
+    processes so CPU-bound work never blocks the event loop.
+
+    With max_workers=0 the work is pushed to the default thread pool instead,
+    which keeps the loop responsive without the process start-up cost.
+
+    A timeout (or a cancelled caller) only stops the wait: a task cannot be
+    interrupted once a worker has picked it up, so it runs to completion with
+    its result discarded. Such abandoned tasks stay counted in in_flight and
+    queue_depth until they actually finish, since they still hold a worker.
+    """
+
+    def __init__(self, max_workers: int, timeout: float, start_method: str = "spawn"):
+        self.max_workers = max(0, max_workers)
+        self.timeout = timeout
+        self.start_method = start_method
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        # Tasks whose caller stopped waiting but which still occupy a worker
+        self._abandoned = set()
+        # pid -> model cache counters last reported by that worker
+        self.worker_registry_counters: Dict[int, dict] = {}
+
+    def start(self):
+        if self._pool is not None or self.max_workers == 0:
+            return
+        context = multiprocessing.get_context(self.start_method)
+        if self.start_method == "fork":
+            # Forked workers inherit this process's models copy-on-write: load them once, before forking
+            registry.warm_up()
+        elif self.start_method == "forkserver":
+            # Workers fork from a server that already holds every model, sharing those pages
+            context.set_forkserver_preload(["app.services.model_preload"])
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=context,
+            initializer=_init_worker
+        )
+        # Force the workers to spawn (and warm their models) now rather than on first request
+        for _ in range(self.max_workers):
+            self._pool.submit(int)
+        logger.info(f"Inference executor started with {self.max_workers} workers")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def queue_depth(self) -> int:
+        # Tasks submitted but not yet picked up by a worker
+        return max(0, self.in_flight - max(self.max_workers, 1))
+
+    def _task_done(self, future: asyncio.Future):
+        self.in_flight -= 1
+        if future in self._abandoned:
+            self._abandoned.discard(future)
+            # Nobody awaits it any more; retrieve the outcome so asyncio does not log it as unhandled
+            if not future.cancelled() and future.exception() is not None:
+                logger.warning(f"Abandoned inference task failed: {future.exception()}")
+
+    def _abandon(self, future: asyncio.Future):
+        if not future.done():
+            self._abandoned.add(future)
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        future = loop.run_in_executor(self._pool, fn, *args)
+        future.add_done_callback(self._task_done)
+        try:
+            # Shielded so a timeout leaves the task's bookkeeping to _task_done rather than dropping it
+            result = await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+            self.completed += 1
+            return result
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._abandon(future)
+            raise InferenceTimeoutError(f"Inference task exceeded {timeout or self.timeout}s")
+        except asyncio.CancelledError:
+            self._abandon(future)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+
+    async def predict(self, model_code: str, features: np.ndarray, timeout: Optional[float] = None,
+                      mode: str = "exact") -> np.ndarray:
+        # Worker processes and the thread fallback both resolve the model from their own registry
+        features = np.ascontiguousarray(features, dtype=float)
+        predictions, pid, counters = await self.run(_predict_and_count, model_code, features, mode, timeout=timeout)
+        self.worker_registry_counters[pid] = counters
+        return predictions
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "mode": "process" if self._pool is not None else "thread",
+            "timeout_seconds": self.timeout,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "abandoned": len(self._abandoned)
+        }
+
+
+inference_executor = InferenceExecutor(
+    max_workers=settings.INFERENCE_WORKERS,
+    timeout=settings.INFERENCE_TIMEOUT,
+    start_method=settings.INFERENCE_START_METHOD
+)
@@ -0,0 +1,147 @@
+"""
+Compact serving index for the KNN calibration model.
+
+The pickled pipeline stores the whole training set plus sklearn's tree
+structures and input validation. export_knn_index() keeps only what
+prediction needs: the training points, the targets as float32, the
+SimpleImputer medians and the neighbour settings. KNNIndex rebuilds a scipy
+cKDTree over the 3-D (cf1, RH, TempC) space at load time and answers whole
+batches with one vectorized k-nearest query.
+
+The training set holds many duplicate points, so the k-th neighbour is often
+tied with the next one, and which of the tied points is used decides the
+prediction. sklearn settles this by its own tree's traversal order, so rows
+with a tie at the k-th distance are answered by the same sklearn search
+structure the pipeline was fitted with. This is why the points stay float64:
+rounding them changes which points tie.
+
+    python -m app.services.knn_index models/KNN_model_for_website.joblib
+"""
+import argparse
+from typing import Optional
+import numpy as np
+from scipy.spatial import cKDTree
+from sklearn.neighbors import NearestNeighbors
+from app.services.npz_mmap import load_npz
+
+
+# Relative gap between the k-th and next neighbour distance below which the rows count as tied
+TIE_TOLERANCE = 1e-9
+
+
+class KNNIndex:
+    """KD-tree over the training points with the imputer medians baked in."""
+
+    def __init__(self, points: np.ndarray, targets: np.ndarray, n_neighbors: int, weights: str = "uniform",
+                 p: float = 2.0, impute_values: Optional[np.ndarray] = None, workers: int = 1,
+                 algorithm: str = "kd_tree", leaf_size: int = 30):
+        if weights not in ("uniform", "distance"):
+            raise ValueError(f"Unsupported KNN weights: {weights}")
+
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        self.targets = np.ascontiguousarray(targets, dtype=np.float32)
+        self.n_neighbors = int(n_neighbors)
+        self.weights = weights
+        self.p = float(p)
+        self.impute_values = impute_values
+        self.workers = workers
+        self.n_features_in_ = self.points.shape[1]
+        self._tree = cKDTree(self.points, balanced_tree=True, compact_nodes=True)
+        # Same search structure as the fitted pipeline, so tied rows resolve the way it does
+        self._tie_breaker = NearestNeighbors(algorithm=algorithm, leaf_size=leaf_size, p=self.p).fit(self.points)
+
+    @classmethod
+    def from_npz(cls, path: str, workers: int = 1, mmap: bool = False) -> "KNNIndex":
+        # With mmap the points and targets stay in the page cache; cKDTree still builds its own copy
+        data = load_npz(path, mmap)
+        return cls(
+            points=data["points"],
+            targets=data["targets"],
+            n_neighbors=int(data["n_neighbors"]),
+            weights=str(data["weights"]),
+            p=float(data["p"]),
+            impute_values=data["impute_values"] if data["impute_values"].size else None,
+            workers=workers,
+            algorithm=str(data["algorithm"]),
+            leaf_size=int(data["leaf_size"])
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.points.nbytes + self.targets.nbytes
+
+    def kneighbors(self, X, n_neighbors: Optional[int] = None):
+        """Distances and indices of the nearest training points, closest first."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if self.impute_values is not None:
+            missing = np.isnan(X)
+            if missing.any():
+                X = np.where(missing, self.impute_values, X)
+
+        k = n_neighbors or self.n_neighbors
+        # One extra neighbour shows whether the k-th is tied with a point left out
+        distances, indices = self._tree.query(X, k=k + 1, p=self.p, workers=self.workers)
+        tied = distances[:, k] - distances[:, k - 1] <= TIE_TOLERANCE * np.maximum(distances[:, k - 1], 1.0)
+        distances, indices = distances[:, :k], indices[:, :k]
+        if tied.any():
+            distances[tied], indices[tied] = self._tie_breaker.kneighbors(X[tied], n_neighbors=k)
+        return distances, indices
+
+    def predict(self, X) -> np.ndarray:
+        distances, indices = self.kneighbors(X)
+
+        neighbour_targets = self.targets[indices].astype(np.float64)
+        if self.weights == "uniform":
+            return neighbour_targets.mean(axis=1)
+
+        # sklearn's distance weighting: exact matches take all the weight
+        with np.errstate(divide="ignore"):
+            inverse = 1.0 / distances
+        exact = np.isinf(inverse)
+        inverse = np.where(exact.any(axis=1, keepdims=True), exact.astype(np.float64), inverse)
+        return (neighbour_targets * inverse).sum(axis=1) / inverse.sum(axis=1)
+
+
+def export_knn_index(model, npz_path: str) -> str:
+    """Write the serving index for a fitted KNeighborsRegressor or imputer pipeline."""
+    impute_values = np.array([])
+    estimator = model
+    if hasattr(model, "steps"):
+        *preprocessors, (_, estimator) = model.steps
+        for _, step in preprocessors:
+            if type(step).__name__ != "SimpleImputer":
+                raise ValueError(f"Cannot export pipeline step {type(step).__name__}")
+            impute_values = np.asarray(step.statistics_, dtype=np.float64)
+
+    if type(estimator).__name__ != "KNeighborsRegressor":
+        raise ValueError(f"Cannot export {type(estimator).__name__} as a KNN index")
+    if estimator.effective_metric_ not in ("euclidean", "manhattan", "minkowski"):
+        raise ValueError(f"Unsupported KNN metric: {estimator.effective_metric_}")
+
+    p = {"euclidean": 2.0, "manhattan": 1.0}.get(estimator.effective_metric_, float(estimator.p))
+    np.savez(
+        npz_path,
+        points=np.asarray(estimator._fit_X, dtype=np.float64),
+        targets=np.asarray(estimator._y, dtype=np.float32).ravel(),
+        n_neighbors=np.array(estimator.n_neighbors),
+        weights=np.array(estimator.weights),
+        p=np.array(p),
+        impute_values=impute_values,
+        algorithm=np.array(estimator._fit_method),
+        leaf_size=np.array(estimator.leaf_size)
+    )
+    return npz_path
+
+
+if __name__ == "__main__":
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Export a fitted KNN pipeline into a compact serving index")
+    parser.add_argument("joblib_path")
+    parser.add_argument("--output", help="Destination (defaults to <name>.knn.npz next to the input)")
+    args = parser.parse_args()
+
+    output_path = args.output or args.joblib_path.rsplit(".", 1)[0] + ".knn.npz"
+    print(f"Wrote {export_knn_index(joblib.load(args.joblib_path), output_path)}")
@@ -0,0 +1,117 @@
+"""
+Memory of the serving process tree: the gunicorn master when there is one,
+its workers, and each worker's inference processes.
+
+RSS counts a shared page once in every process that maps it, so adding RSS
+up overstates what several workers cost. PSS splits shared pages between
+the processes mapping them, so the PSS total is the real footprint. USS
+(private pages) is roughly what one more worker would add. Linux only; the
+numbers come from /proc/<pid>/smaps_rollup.
+"""
+import os
+import logging
+from typing import Dict, List, Optional
+
+# Setting up a simple logger
+logger = logging.getLogger(__name__)
+
+_ROLLUP_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty"
+}
+
+
+def process_memory(pid: int) -> Optional[dict]:
+    """rss, pss, uss and shared bytes of one process; None if it is gone or unreadable."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in _ROLLUP_FIELDS:
+                    values[_ROLLUP_FIELDS[key]] = int(rest.split()[0]) * 1024
+    except OSError:
+        return None
+    return {
+        "rss": values.get("rss", 0),
+        "pss": values.get("pss", 0),
+        "uss": values.get("private_clean", 0) + values.get("private_dirty", 0),
+        "shared": values.get("shared_clean", 0) + values.get("shared_dirty", 0)
+    }
+
+
+def _command(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode(errors="replace").strip()[:200]
+    except OSError:
+        return ""
+
+
+def _children() -> Dict[int, List[int]]:
+    tree: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name is parenthesised and may contain spaces; ppid follows the state
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        tree.setdefault(ppid, []).append(int(entry))
+    return tree
+
+
+def server_root() -> int:
+    """The gunicorn master when this process is one of its workers, otherwise this process."""
+    parent = os.getppid()
+    return parent if "gunicorn" in _command(parent) else os.getpid()
+
+
+def memory_report() -> dict:
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        return {"supported": False}
+
+    root = server_root()
+    tree = _children()
+    processes = []
+
+    def walk(pid: int, depth: int, worker: Optional[int]):
+        memory = process_memory(pid)
+        if memory is None:
+            return
+        if depth == 0:
+            role = "master" if pid != os.getpid() else "server"
+        elif depth == 1 and root != os.getpid():
+            role = "worker"
+        else:
+            # Inference workers, their forkserver and the multiprocessing resource tracker
+            role = "subprocess"
+        processes.append({"pid": pid, "role": role, "worker": worker, "command": _command(pid), **memory})
+        for child in tree.get(pid, []):
+            walk(child, depth + 1, child if role == "master" else worker)
+
+    # Without a master, this process is the only worker
+    walk(root, 0, root if root == os.getpid() else None)
+
+    workers = {}
+    for process in processes:
+        if process["worker"] is not None:
+            cost = workers.setdefault(process["worker"], {"pss": 0, "uss": 0, "processes": 0})
+            cost["pss"] += process["pss"]
+            cost["uss"] += process["uss"]
+            cost["processes"] += 1
+
+    return {
+        "supported": True,
+        "root_pid": root,
+        "totals": {key: sum(p[key] for p in processes) for key in ("rss", "pss", "uss")},
+        # Each worker together with its own inference processes
+        "per_worker": {str(pid): cost for pid, cost in workers.items()},
+        "processes": processes
+    }
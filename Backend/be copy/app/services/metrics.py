@@ -0,0 +1,185 @@
+"""
+In-process metrics in the Prometheus text exposition format, served at /metrics.
+
+Counters and histograms are dicts keyed by label values and updated under a
+lock, about a microsecond per observation, so they stay on in production.
+Numbers owned by other components (model cache, inference pool, DB pool) are
+read by collectors only when /metrics is scraped.
+
+Every process keeps its own numbers. With several server workers, scrape
+each one separately (or run one worker per container).
+"""
+import math
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+# Seconds, from a cached lookup up to a full-table histogram render
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROW_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Starlette appends the charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class MetricFamily(NamedTuple):
+    """One metric as rendered: samples are (name suffix, labels, value)."""
+    name: str
+    kind: str
+    documentation: str
+    samples: List[Tuple[str, Dict[str, str], float]]
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> MetricFamily:
+        with self._lock:
+            values = list(self._values.items())
+        return MetricFamily(self.name, "counter", self.documentation, [
+            ("_total", dict(zip(self.labelnames, key)), value) for key, value in values
+        ])
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self) -> MetricFamily:
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+
+        samples = []
+        for key, counts, total in series:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return MetricFamily(self.name, "histogram", self.documentation, samples)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        """collector() is called on every scrape and returns MetricFamily values."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        families = [metric.collect() for metric in self._metrics]
+        for collector in self._collectors:
+            families.extend(collector())
+
+        lines = []
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for suffix, labels, value in family.samples:
+                label_text = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+                lines.append(f"{family.name}{suffix}{{{label_text}}} {_format_value(value)}" if label_text
+                             else f"{family.name}{suffix} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def gauge_family(name: str, documentation: str, samples: Dict[tuple, float], labelnames: Sequence[str] = ()) -> MetricFamily:
+    """Gauge family for collectors, from {label values: value}."""
+    return MetricFamily(name, "gauge", documentation, [
+        ("", dict(zip(labelnames, key)), value) for key, value in samples.items()
+    ])
+
+
+def counter_family(name: str, documentation: str, samples: Dict[tuple, float], labelnames: Sequence[str] = ()) -> MetricFamily:
+    """Counter family for collectors, from {label values: running total}."""
+    return MetricFamily(name, "counter", documentation, [
+        ("_total", dict(zip(labelnames, key)), value) for key, value in samples.items()
+    ])
+
+
+metrics = MetricsRegistry()
+
+request_seconds = metrics.histogram(
+    "http_request_duration_seconds",
+    "Time from request start to the last response byte",
+    ("method", "route", "status", "model")
+)
+stage_seconds = metrics.histogram(
+    "prediction_stage_duration_seconds",
+    "Time spent in each stage of the prediction and histogram pipelines",
+    ("pipeline", "model", "stage")
+)
+prediction_rows = metrics.histogram(
+    "prediction_rows",
+    "Rows calibrated per request",
+    ("pipeline", "model"),
+    buckets=ROW_BUCKETS
+)
+
+
+def stage_timer(pipeline: str, model_code: str, stage: str):
+    """with stage_timer("predict", "GB", "db_query"): ..."""
+    return stage_seconds.time(pipeline=pipeline, model=model_code, stage=stage)
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from typing import Dict, List, Set, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.inference import inference_executor
+from app.services.metrics import metrics
+
+# Setting up a simple logger
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+QUEUE_WAIT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+batch_rows = metrics.histogram(
+    "micro_batch_rows",
+    "Single-point requests answered by one micro-batched predict call",
+    ("model", "mode"),
+    buckets=BATCH_SIZE_BUCKETS
+)
+queue_wait_seconds = metrics.histogram(
+    "micro_batch_queue_wait_seconds",
+    "Time a single-point request waited for its micro-batch to be dispatched",
+    ("model", "mode"),
+    buckets=QUEUE_WAIT_BUCKETS
+)
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent single-row predictions for the same model into one
+    vectorized predict call.
+
+    The first row for a (model, mode) pair opens a batch and starts a max_wait
+    timer. The batch is dispatched when the timer fires or when it reaches
+    max_rows, whichever comes first. Each waiting coroutine then gets its own
+    value back, or the batch's exception; if the batch task is cancelled, so are
+    its waiters. Rows arriving while a batch is being predicted open the next
+    batch, so under load batches grow with concurrency.
+    """
+
+    def __init__(self, max_wait: float, max_rows: int):
+        self.max_wait = max(0.0, max_wait)
+        self.max_rows = max(1, max_rows)
+        self._pending: Dict[Tuple[str, str], List[Tuple[np.ndarray, asyncio.Future, float]]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._running: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self.full_batches = 0
+        self.failed_batches = 0
+
+    async def predict(self, model_code: str, row: np.ndarray, mode: str = "exact") -> float:
+        loop = asyncio.get_running_loop()
+        key = (model_code, mode)
+        future = loop.create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((np.asarray(row, dtype=np.float64), future, loop.time()))
+        self.requests += 1
+
+        if len(pending) >= self.max_rows:
+            self.full_batches += 1
+            self._dispatch(key)
+        elif len(pending) == 1:
+            self._timers[key] = loop.call_later(self.max_wait, self._dispatch, key)
+        return await future
+
+    def _dispatch(self, key: Tuple[str, str]):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, [])
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._run(key, batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        task.add_done_callback(lambda _: self._release(batch))
+
+    @staticmethod
+    def _release(batch: List[Tuple[np.ndarray, asyncio.Future, float]]):
+        # The batch task was cancelled (possibly before it started) or ended without answering everyone:
+        # cancel the remaining waiters instead of leaving them pending forever
+        for _, future, _ in batch:
+            if not future.done():
+                future.cancel()
+
+    async def _run(self, key: Tuple[str, str], batch: List[Tuple[np.ndarray, asyncio.Future, float]]):
+        model_code, mode = key
+        now = asyncio.get_running_loop().time()
+        self.batches += 1
+        self.rows += len(batch)
+        batch_rows.observe(len(batch), model=model_code, mode=mode)
+        for _, _, enqueued in batch:
+            queue_wait_seconds.observe(now - enqueued, model=model_code, mode=mode)
+
+        try:
+            predictions = await inference_executor.predict(model_code, np.vstack([row for row, _, _ in batch]), mode=mode)
+            predictions = np.asarray(predictions, dtype=np.float64).ravel()
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"Micro-batch of {len(batch)} rows for {model_code} failed: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Waiters that gave up (client disconnect, timeout) have cancelled futures
+        for (_, future, _), value in zip(batch, predictions):
+            if not future.done():
+                future.set_result(float(value))
+
+    def stats(self) -> dict:
+        return {
+            "max_wait_ms": self.max_wait * 1000,
+            "max_rows": self.max_rows,
+            "requests": self.requests,
+            "batches": self.batches,
+            "full_batches": self.full_batches,
+            "failed_batches": self.failed_batches,
+            "mean_batch_rows": self.rows / self.batches if self.batches else None,
+            "pending": sum(len(rows) for rows in self._pending.values())
+        }
+
+
+micro_batcher = MicroBatcher(
+    max_wait=settings.MICRO_BATCH_MAX_WAIT_MS / 1000,
+    max_rows=settings.MICRO_BATCH_MAX_ROWS
+)
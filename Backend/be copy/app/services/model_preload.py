@@ -0,0 +1,16 @@
+"""
+Imported once by the gunicorn master (gunicorn.conf.py) and by the inference
+forkserver (INFERENCE_START_METHOD="forkserver"). Loading every model here,
+before any fork, means the children start with the models already in memory
+and share those pages copy-on-write instead of each loading its own copy.
+A forkserver is per process that starts one, so under gunicorn each worker's
+server would hold its own copy; gunicorn.conf.py uses "fork" instead.
+"""
+import logging
+from app.services.model_registry import registry
+
+# Setting up a simple logger
+logger = logging.getLogger(__name__)
+
+timings = registry.warm_up()
+logger.info(f"Preloaded models before fork: {timings}")
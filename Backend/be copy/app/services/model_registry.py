@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import resource
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+import joblib
+from app.core.config import settings
+from app.services.nn_numpy import NumpyMLP
+from app.services.knn_index import KNNIndex
+from app.services.surrogate import SurrogateGrid
+from app.services.tree_ensemble import is_tree_ensemble, compile_tree_ensemble
+
+# Setting up a simple logger
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = "models"
+
+# Candidate artifacts per model code, in order of preference. NN and KNN are
+# served from their NumPy exports when present and fall back to the originals.
+MODEL_FILES = {
+    "GB": ["GB_model_for_website.joblib"],
+    "KNN": ["KNN_model_for_website.knn.npz", "KNN_model_for_website.joblib"],
+    "LR": ["LR_model_for_website.joblib"],
+    "NN": ["NN_model_for_website.npz", "NN_model_for_website.h5"],
+    "RF": ["RF_model_for_website.joblib"]
+}
+
+# Fast-mode interpolation grids sit next to the model, e.g. GB_model_for_website.grid.npz
+SURROGATE_SUFFIX = ".grid.npz"
+
+# Written by python -m app.training; its files for a code take precedence over MODEL_FILES
+MANIFEST_FILE = "manifest.json"
+
+
+class ModelNotFoundError(Exception):
+    """Custom exception for unknown model codes or missing model artifacts."""
+    pass
+
+
+@dataclass
+class ModelEntry:
+    code: str
+    path: str
+    model: Any
+    sha256: str
+    mtime: float
+    size: int
+    load_seconds: float
+    memory_bytes: int
+    loaded_at: datetime = field(default_factory=datetime.now)
+
+    @property
+    def version(self) -> str:
+        return self.sha256[:12]
+
+    def to_dict(self) -> dict:
+        return {
+            "code": self.code,
+            "path": self.path,
+            "version": self.version,
+            "sha256": self.sha256,
+            "size_bytes": self.size,
+            "load_seconds": round(self.load_seconds, 4),
+            "memory_bytes": self.memory_bytes,
+            "loaded_at": self.loaded_at.isoformat()
+        }
+
+
+def _current_rss_bytes() -> int:
+    # /proc gives the current resident set; fall back to the peak on other platforms
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(model_dir: str = MODEL_DIR) -> dict:
+    try:
+        with open(os.path.join(model_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"models": {}}
+
+
+def load_artifact(path: str):
+    # MODEL_MMAP: arrays stay in the page cache, shared by every process serving the same file
+    mmap = settings.MODEL_MMAP
+    if path.endswith(SURROGATE_SUFFIX):
+        return SurrogateGrid.from_npz(path, mmap=mmap)
+    if path.endswith(".knn.npz"):
+        return KNNIndex.from_npz(path, workers=settings.KNN_QUERY_WORKERS, mmap=mmap)
+    if path.endswith(".npz"):
+        return NumpyMLP.from_npz(
+            path,
+            dtype=settings.NN_INFERENCE_DTYPE,
+            batch_size=settings.NN_INFERENCE_BATCH_SIZE,
+            mmap=mmap
+        )
+    if path.endswith(".h5"):
+        # Only pull TensorFlow in when a Keras artifact is actually requested
+        from tensorflow.keras.models import load_model as load_keras_model
+        return load_keras_model(path, compile=False)
+
+    # Only arrays joblib pickles as plain ndarrays are mapped; sklearn trees copy their nodes on load
+    model = joblib.load(path, mmap_mode="r" if mmap else None)
+    if settings.TREE_BACKEND == "compiled" and is_tree_ensemble(model):
+        # Serve GB/RF from packed node arrays instead of sklearn's per-tree predict
+        return compile_tree_ensemble(
+            model,
+            batch_size=settings.TREE_BATCH_SIZE,
+            keep_fallback=True,
+            fallback_min_rows=settings.TREE_FALLBACK_MIN_ROWS
+        )
+    return model
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of deserialized models keyed by model code.
+
+    Artifacts are loaded once and kept in a bounded LRU. Every lookup stats the
+    file; when the mtime or size changes the file is re-hashed and reloaded if
+    its content actually differs. Fast-mode grids are cached the same way under
+    "<CODE>:fast".
+    """
+
+    def __init__(self, model_dir: str = MODEL_DIR, max_models: int = len(MODEL_FILES)):
+        self.model_dir = model_dir
+        self.max_models = max(1, max_models)
+        self._entries: "OrderedDict[str, ModelEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._manifest: dict = {"models": {}}
+        self._manifest_mtime: Optional[float] = None
+        # path -> ((mtime, size), sha256), so versions are known without deserializing the model
+        self._hashes: Dict[str, Tuple[Tuple[float, int], str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    @property
+    def codes(self) -> list:
+        return list(MODEL_FILES)
+
+    def manifest(self) -> dict:
+        """The training manifest, re-read whenever the file changes."""
+        path = os.path.join(self.model_dir, MANIFEST_FILE)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+
+        with self._lock:
+            if mtime != self._manifest_mtime:
+                self._manifest = read_manifest(self.model_dir) if mtime is not None else {"models": {}}
+                self._manifest_mtime = mtime
+            return self._manifest
+
+    def candidate_paths(self, code: str) -> list:
+        filenames = MODEL_FILES.get(code.upper())
+        if not filenames:
+            raise ModelNotFoundError(f"Unknown model code: {code}")
+        # Trained versions listed in the manifest first, then the bundled artifacts
+        trained = self.manifest()["models"].get(code.upper(), {}).get("files", [])
+        return [os.path.join(self.model_dir, filename) for filename in trained + filenames]
+
+    def path_for(self, code: str) -> str:
+        paths = self.candidate_paths(code)
+        # First artifact that exists; the preferred one otherwise so errors name it
+        return next((path for path in paths if os.path.exists(path)), paths[0])
+
+    def exists(self, code: str) -> bool:
+        try:
+            return os.path.exists(self.path_for(code))
+        except ModelNotFoundError:
+            return False
+
+    def surrogate_path(self, code: str) -> str:
+        filenames = MODEL_FILES.get(code.upper())
+        if not filenames:
+            raise ModelNotFoundError(f"Unknown model code: {code}")
+        grid = self.manifest()["models"].get(code.upper(), {}).get("grid")
+        if grid:
+            return os.path.join(self.model_dir, grid)
+        return os.path.join(self.model_dir, filenames[0].split(".")[0] + SURROGATE_SUFFIX)
+
+    def surrogate_exists(self, code: str) -> bool:
+        try:
+            return os.path.exists(self.surrogate_path(code))
+        except ModelNotFoundError:
+            return False
+
+    def get(self, code: str):
+        return self.entry(code).model
+
+    def sha256(self, code: str) -> str:
+        """Content hash of the artifact a code is served from; the model itself is not loaded."""
+        path = self.path_for(code)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise ModelNotFoundError(f"Model file not found: {path}")
+        return self._hash(path, stat)
+
+    def version(self, code: str) -> str:
+        return self.sha256(code)[:12]
+
+    def _hash(self, path: str, stat: os.stat_result) -> str:
+        # Re-hashed only when the file's mtime or size changes
+        key = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            cached = self._hashes.get(path)
+            if cached and cached[0] == key:
+                return cached[1]
+            sha256 = _file_sha256(path)
+            self._hashes[path] = (key, sha256)
+            return sha256
+
+    def surrogate(self, code: str) -> SurrogateGrid:
+        """
+        Fast-mode grid for a model. It is only valid for the exact artifact it
+        was built from, so a grid left over from an older model is refused.
+        """
+        grid = self._cached(f"{code.upper()}:fast", self.surrogate_path(code)).model
+        if grid.source_sha256 != self.sha256(code):
+            raise ModelNotFoundError(f"Surrogate grid for {code} was built from a different model version")
+        return grid
+
+    def entry(self, code: str) -> ModelEntry:
+        return self._cached(code.upper(), self.path_for(code))
+
+    def _cached(self, code: str, path: str) -> ModelEntry:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise ModelNotFoundError(f"Model file not found: {path}")
+
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry and entry.path == path and entry.mtime == stat.st_mtime and entry.size == stat.st_size:
+                self._entries.move_to_end(code)
+                self.hits += 1
+                return entry
+
+            if entry:
+                # The file was touched; only reload when the content really changed
+                sha256 = self._hash(path, stat)
+                if sha256 == entry.sha256:
+                    entry.mtime, entry.size = stat.st_mtime, stat.st_size
+                    self._entries.move_to_end(code)
+                    self.hits += 1
+                    return entry
+                logger.info(f"Model {code} changed on disk, reloading {path}")
+                self.reloads += 1
+            else:
+                sha256 = self._hash(path, stat)
+
+            self.misses += 1
+            entry = self._load(code, path, stat, sha256)
+            self._entries[code] = entry
+            self._entries.move_to_end(code)
+
+            # Models and fast-mode grids each get max_models slots
+            is_grid = code.endswith(":fast")
+            same_kind = [key for key in self._entries if key.endswith(":fast") == is_grid]
+            while len(same_kind) > self.max_models:
+                evicted_code = same_kind.pop(0)
+                del self._entries[evicted_code]
+                self.evictions += 1
+                logger.info(f"Evicted model {evicted_code} from the registry")
+
+            return entry
+
+    def _load(self, code: str, path: str, stat: os.stat_result, sha256: str) -> ModelEntry:
+        rss_before = _current_rss_bytes()
+        started = time.perf_counter()
+        model = load_artifact(path)
+        load_seconds = time.perf_counter() - started
+        memory_bytes = max(0, _current_rss_bytes() - rss_before)
+
+        if not hasattr(model, "predict"):
+            raise ModelNotFoundError(f"Invalid model or missing predict method: {path}")
+
+        logger.info(f"Loaded model {code} from {path} in {load_seconds:.3f}s")
+        return ModelEntry(
+            code=code,
+            path=path,
+            model=model,
+            sha256=sha256,
+            mtime=stat.st_mtime,
+            size=stat.st_size,
+            load_seconds=load_seconds,
+            memory_bytes=memory_bytes
+        )
+
+    def warm_up(self, codes: Optional[Iterable[str]] = None) -> Dict[str, Optional[float]]:
+        """
+        Load the given (or all) models up front. Missing artifacts are logged and
+        skipped so one absent file does not stop the app from starting.
+        """
+        timings = {}
+        for code in codes or self.codes:
+            try:
+                timings[code] = self.entry(code).load_seconds
+            except Exception as e:
+                logger.warning(f"Could not warm model {code}: {e}")
+                timings[code] = None
+        return timings
+
+    def invalidate(self, code: Optional[str] = None):
+        with self._lock:
+            if code is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(code.upper(), None)
+                self._entries.pop(f"{code.upper()}:fast", None)
+
+    def counters(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "reloads": self.reloads, "evictions": self.evictions}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_models": self.max_models,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "trained_versions": {code: m.get("version") for code, m in self.manifest()["models"].items()},
+                "models": {code: entry.to_dict() for code, entry in self._entries.items()}
+            }
+
+
+registry = ModelRegistry(max_models=settings.MODEL_CACHE_SIZE)
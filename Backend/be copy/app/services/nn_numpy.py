@@ -0,0 +1,163 @@
+"""
+TensorFlow-free inference for the dense NN calibration model.
+
+The Keras .h5 artifact is converted once into an .npz holding the kernel and
+bias of every Dense layer plus its activation. NumpyMLP replays the forward
+pass with plain matrix products, so serving the NN code needs only NumPy.
+
+Convert (and check against Keras when TensorFlow is installed):
+
+    python -m app.services.nn_numpy models/NN_model_for_website.h5 --verify dataset.csv
+"""
+import sys
+import json
+import argparse
+from typing import List, Optional
+import numpy as np
+from app.services.npz_mmap import load_npz
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "tanh": np.tanh
+}
+
+
+class NumpyMLP:
+    """Forward pass of a stack of Dense layers, evaluated in row batches."""
+
+    def __init__(self, kernels: List[np.ndarray], biases: List[np.ndarray], activations: List[str],
+                 dtype: str = "float64", batch_size: Optional[int] = None):
+        unknown = [a for a in activations if a not in ACTIVATIONS]
+        if unknown:
+            raise ValueError(f"Unsupported activations: {unknown}")
+
+        self.dtype = np.dtype(dtype)
+        self.kernels = [np.ascontiguousarray(k, dtype=self.dtype) for k in kernels]
+        self.biases = [np.ascontiguousarray(b, dtype=self.dtype) for b in biases]
+        self.activations = list(activations)
+        self.batch_size = batch_size
+        self.n_features_in_ = self.kernels[0].shape[0]
+
+    @classmethod
+    def from_npz(cls, path: str, dtype: str = "float64", batch_size: Optional[int] = None,
+                 mmap: bool = False) -> "NumpyMLP":
+        # Mapped weights are only shared when dtype matches the stored one; otherwise they are converted
+        data = load_npz(path, mmap)
+        activations = [str(a) for a in data["activations"]]
+        kernels = [data[f"kernel_{i}"] for i in range(len(activations))]
+        biases = [data[f"bias_{i}"] for i in range(len(activations))]
+        return cls(kernels, biases, activations, dtype=dtype, batch_size=batch_size)
+
+    def _forward(self, x: np.ndarray) -> np.ndarray:
+        for kernel, bias, activation in zip(self.kernels, self.biases, self.activations):
+            x = x @ kernel
+            x += bias
+            x = ACTIVATIONS[activation](x)
+        return x
+
+    def predict(self, X, batch_size: Optional[int] = None) -> np.ndarray:
+        """Same (n_rows, n_outputs) shape as keras Model.predict."""
+        X = np.asarray(X, dtype=self.dtype)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        batch_size = batch_size or self.batch_size
+        if not batch_size or len(X) <= batch_size:
+            return self._forward(X)
+
+        # Bound the size of the hidden-layer intermediates on very large inputs
+        output = np.empty((len(X), self.kernels[-1].shape[1]), dtype=self.dtype)
+        for start in range(0, len(X), batch_size):
+            output[start:start + batch_size] = self._forward(X[start:start + batch_size])
+        return output
+
+
+def convert_keras_h5(h5_path: str, npz_path: Optional[str] = None) -> str:
+    """
+    Extract Dense layer weights from a Keras .h5 file into an .npz. Reads the
+    file with h5py only; TensorFlow is not needed.
+    """
+    import h5py
+
+    npz_path = npz_path or h5_path.rsplit(".", 1)[0] + ".npz"
+
+    with h5py.File(h5_path, "r") as f:
+        config = json.loads(f.attrs["model_config"])
+        weights = f["model_weights"]
+
+        arrays, activations = {}, []
+        for layer in config["config"]["layers"]:
+            class_name, layer_config = layer["class_name"], layer["config"]
+            if class_name == "InputLayer":
+                continue
+            if class_name != "Dense":
+                raise ValueError(f"Unsupported layer type for NumPy inference: {class_name}")
+
+            group = weights[layer_config["name"]]
+            weight_names = [n.decode() if isinstance(n, bytes) else n for n in group.attrs["weight_names"]]
+            kernel_name = next(n for n in weight_names if n.split("/")[-1].startswith("kernel"))
+            index = len(activations)
+            arrays[f"kernel_{index}"] = group[kernel_name][()]
+
+            if layer_config.get("use_bias", True):
+                bias_name = next(n for n in weight_names if n.split("/")[-1].startswith("bias"))
+                arrays[f"bias_{index}"] = group[bias_name][()]
+            else:
+                arrays[f"bias_{index}"] = np.zeros(arrays[f"kernel_{index}"].shape[1], dtype=np.float32)
+
+            activations.append(layer_config.get("activation", "linear"))
+
+    np.savez(npz_path, activations=np.array(activations), **arrays)
+    return npz_path
+
+
+def _load_verification_inputs(csv_path: Optional[str], rows: int) -> np.ndarray:
+    if csv_path:
+        from app.services.dataset import load_dataset
+        return load_dataset(csv_path)[["cf1", "RH", "TempC"]].to_numpy(dtype=np.float32)
+
+    rng = np.random.default_rng(0)
+    low, high = np.array([0.0, 0.0, -30.0]), np.array([500.0, 100.0, 45.0])
+    return (low + rng.random((rows, 3)) * (high - low)).astype(np.float32)
+
+
+def verify_against_keras(h5_path: str, npz_path: str, csv_path: Optional[str] = None,
+                         rows: int = 10000, tolerance: float = 1e-3) -> dict:
+    """Compare the NumPy forward pass with Keras on the same inputs."""
+    from tensorflow.keras.models import load_model as load_keras_model
+
+    X = _load_verification_inputs(csv_path, rows)
+    expected = load_keras_model(h5_path, compile=False).predict(X, verbose=0).ravel()
+
+    report = {"rows": len(X), "tolerance": tolerance}
+    for dtype in ("float64", "float32"):
+        actual = NumpyMLP.from_npz(npz_path, dtype=dtype, batch_size=4096).predict(X).ravel()
+        error = np.abs(actual.astype(np.float64) - expected)
+        scale = np.maximum(np.abs(expected), 1.0)
+        report[dtype] = {
+            "max_abs_error": float(error.max()),
+            "max_rel_error": float((error / scale).max()),
+            "passed": bool(((error / scale) <= tolerance).all())
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a Keras .h5 MLP into an .npz for NumPy inference")
+    parser.add_argument("h5_path")
+    parser.add_argument("--output", help="Destination .npz (defaults to the .h5 path with an .npz suffix)")
+    parser.add_argument("--verify", nargs="?", const="", metavar="CSV",
+                        help="Check against Keras on a CSV of cf1/PA, RH, TempC (random inputs if omitted)")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    output_path = convert_keras_h5(args.h5_path, args.output)
+    print(f"Wrote {output_path}")
+
+    if args.verify is not None:
+        result = verify_against_keras(args.h5_path, output_path, args.verify or None, tolerance=args.tolerance)
+        print(json.dumps(result, indent=2))
+        if not all(result[dtype]["passed"] for dtype in ("float64", "float32")):
+            sys.exit(1)
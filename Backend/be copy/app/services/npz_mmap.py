@@ -0,0 +1,57 @@
+"""
+Read .npz artifacts with their arrays memory-mapped in place.
+
+np.load ignores mmap_mode for .npz archives, but np.savez stores members
+uncompressed, so each .npy member is one contiguous run of bytes inside the
+zip. Mapping that run read-only gives arrays backed by the page cache: every
+process serving the same file shares one physical copy instead of holding
+its own.
+"""
+import struct
+import zipfile
+import numpy as np
+
+# Smaller arrays are read normally; a mapping costs at least a page anyway
+MMAP_MIN_BYTES = 1 << 16
+
+# Fixed part of a zip local file header; name and extra field lengths are its last two fields
+_LOCAL_HEADER_SIZE = 30
+
+
+def _read_header(f):
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    return np.lib.format.read_array_header_2_0(f)
+
+
+def load_npz(path: str, mmap: bool = False) -> dict:
+    """name -> array for every member; with mmap, large uncompressed members are read-only memmaps."""
+    if not mmap:
+        with np.load(path, allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+
+            f.seek(info.header_offset + _LOCAL_HEADER_SIZE - 4)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length)
+            shape, fortran_order, dtype = _read_header(f)
+
+            if dtype.hasobject:
+                raise ValueError(f"{path}:{name} holds Python objects and cannot be memory-mapped")
+            if int(np.prod(shape)) * dtype.itemsize < MMAP_MIN_BYTES:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                     order="F" if fortran_order else "C")
+    return arrays
@@ -1,15 +1,31 @@
 import os
+import asyncio
 import logging
-from typing import Optional
+from typing import Optional, Sequence
 import pandas as pd
-import joblib
 import numpy as np
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_
-from app.db.air_quality_sites import AirQualitySiteDB
-from tensorflow.keras.models import load_model as load_keras_model
+from sqlalchemy import and_, func, literal, Float
+from app.db.air_quality_sites import (
+    AirQualitySiteDB,
+    fetch_columns,
+    fetch_data_version,
+    fetch_column_histograms,
+    filter_readings,
+    ReadingFilters
+)
+from app.db.base import AsyncSessionLocal
+from app.db.calibrated_predictions import CalibratedPredictionDB, save_calibrated_predictions
+from app.services.model_registry import registry
+from app.services.inference import inference_executor, FEATURE_COLUMNS
+from app.services.histogram_cache import histogram_cache
+from app.services.metrics import stage_timer, prediction_rows
+from app.services.drift import update_residual_stats
+from app.core.config import settings
+import matplotlib
+matplotlib.use("Agg")  # Plots are rendered in worker processes, never on a display
 import matplotlib.pyplot as plt
 
 # Setting up a simple logger
@@ -21,10 +37,13 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-def load_model(model_path: str):
-    if model_path.endswith(".h5"):
-        return load_keras_model(model_path, compile=False)
-    return joblib.load(model_path)
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv"
+STREAM_CHUNK_SIZE = settings.PREDICTION_STREAM_CHUNK_SIZE
+
+def load_model(model_code: str):
+    # Served from the in-process registry instead of re-reading the file
+    return registry.get(model_code)
 
 async def fetch_latest_data(session: AsyncSession, limit: int = 10):
     result = await session.execute(
@@ -38,100 +57,340 @@ async def fetch_latest_data(session: AsyncSession, limit: int = 10):
         "FM": r.FM
     } for r in records])
 
-async def predict_with_model(model_path: str, db, from_date: Optional[datetime], to_date: Optional[datetime]):
-    query = select(AirQualitySiteDB)
+async def materialize_predictions(db: AsyncSession, records: list, model_codes: Optional[list] = None):
+    """
+    Compute and store calibrated values for freshly inserted readings with every
+    available model, so later reads do not have to run the models again.
+    """
+    if not records:
+        return
+
+    ids = [r.id_no for r in records]
+    features = np.array([[r.cf1, r.RH, r.TempC] for r in records], dtype=float)
+    site_ids = [r.ID for r in records]
+    observed = np.array([r.FM for r in records], dtype=float)
+
+    for model_code in model_codes or registry.codes:
+        if not registry.exists(model_code):
+            continue
+        model_version = registry.version(model_code)
+        predictions = await inference_executor.predict(model_code, features)
+        await save_calibrated_predictions(db, model_code, model_version, ids, predictions)
+        # Same transaction, so the drift statistics never count a prediction that was not stored
+        await update_residual_stats(db, model_code, model_version, site_ids, observed, predictions)
+
+    await db.commit()
+
+
+# Reading columns fetched next to the calibrated value unless a caller narrows them
+READING_COLUMNS = ["id_no", "Date", "cf1", "RH", "TempC", "FM"]
+
+
+def _calibrated_query(model_code: str, model_version: str, from_date: Optional[datetime], to_date: Optional[datetime],
+                      filters: Optional[ReadingFilters] = None, extra_columns: Sequence = (),
+                      columns: Sequence[str] = READING_COLUMNS):
+    query = select(
+        *[getattr(AirQualitySiteDB, name) for name in columns],
+        # NaN instead of NULL keeps every row fixed width for the columnar fetch
+        func.coalesce(CalibratedPredictionDB.calibrated, literal(float("nan"), Float)).label("calibrated"),
+        *extra_columns
+    ).outerjoin(
+        CalibratedPredictionDB,
+        and_(
+            CalibratedPredictionDB.id_no == AirQualitySiteDB.id_no,
+            CalibratedPredictionDB.model_code == model_code,
+            CalibratedPredictionDB.model_version == model_version
+        )
+    )
+
+    return filter_readings(query, from_date, to_date, filters)
 
-    if from_date and to_date:
-        query = query.where(
-            and_(
-                AirQualitySiteDB.Date >= from_date,
-                AirQualitySiteDB.Date <= to_date
-            )
+
+def _readings_query(from_date: Optional[datetime], to_date: Optional[datetime], filters: Optional[ReadingFilters] = None):
+    query = select(
+        AirQualitySiteDB.id_no,
+        AirQualitySiteDB.Date,
+        AirQualitySiteDB.cf1,
+        AirQualitySiteDB.RH,
+        AirQualitySiteDB.TempC,
+        AirQualitySiteDB.FM
+    )
+    return filter_readings(query, from_date, to_date, filters)
+
+
+async def _fetch_stale_features(db: AsyncSession, ids: np.ndarray, stale_query) -> np.ndarray:
+    # Features of the stale rows of a frame fetched without them, in the order of ids
+    fetched = await fetch_columns(db, stale_query)
+    if not np.isin(ids, fetched["id_no"]).all():
+        # A prediction was stored in between; look the rows up by id instead
+        fetched = await fetch_columns(db, select(
+            AirQualitySiteDB.id_no, *[getattr(AirQualitySiteDB, name) for name in FEATURE_COLUMNS]
+        ).where(AirQualitySiteDB.id_no.in_(ids.tolist())))
+    order = np.argsort(fetched["id_no"])
+    positions = order[np.searchsorted(fetched["id_no"], ids, sorter=order)]
+    return np.column_stack([np.asarray(fetched[name], dtype=np.float64)[positions] for name in FEATURE_COLUMNS])
+
+
+async def _fill_stale_predictions(df: pd.DataFrame, model_code: str, model_version: str, db: AsyncSession,
+                                  pipeline: str = "stream", stale_query=None):
+    """
+    Run the model only for rows with no stored value for this version and
+    persist the results. A frame without the feature columns passes
+    stale_query, which selects id_no and the features of its stale rows.
+    """
+    df["calibrated"] = df["calibrated"].astype(float)
+    stale = df["calibrated"].isna().to_numpy()
+    if not stale.any():
+        return
+
+    logger.info(f"Recomputing {int(stale.sum())} stale {model_code} predictions for version {model_version}")
+    if stale_query is None:
+        features = df.loc[stale, FEATURE_COLUMNS].to_numpy()
+    else:
+        with stage_timer(pipeline, model_code, "db_query"):
+            features = await _fetch_stale_features(db, df.loc[stale, "id_no"].to_numpy(), stale_query)
+    with stage_timer(pipeline, model_code, "predict"):
+        predictions = await inference_executor.predict(model_code, features)
+    df.loc[stale, "calibrated"] = predictions
+    with stage_timer(pipeline, model_code, "store"):
+        await save_calibrated_predictions(db, model_code, model_version, df.loc[stale, "id_no"].to_numpy(), predictions)
+        await db.commit()
+
+
+async def fetch_calibrated_frame(model_code: str, db, from_date: Optional[datetime], to_date: Optional[datetime],
+                                 filters: Optional[ReadingFilters] = None, pipeline: str = "predict",
+                                 extra_columns: Sequence = (), columns: Sequence[str] = READING_COLUMNS) -> pd.DataFrame:
+    """
+    Read readings together with their stored calibrated value for the current
+    model version. Only rows with no value for that version are run through the
+    model, and the results are written back. columns narrows the reading
+    columns (id_no is always needed); the features of stale rows are then
+    fetched separately. extra_columns are selected alongside; keep them fixed
+    width so the binary COPY path still applies.
+    """
+    model_version = registry.version(model_code)
+    columns = ["id_no"] + [name for name in columns if name != "id_no"]
+
+    # Only the needed columns, fetched straight into NumPy arrays
+    with stage_timer(pipeline, model_code, "db_query"):
+        fetched = await fetch_columns(
+            db, _calibrated_query(model_code, model_version, from_date, to_date, filters, extra_columns, columns)
         )
+    with stage_timer(pipeline, model_code, "to_frame"):
+        df = pd.DataFrame(fetched)
+
+    if not df.empty:
+        stale_query = None
+        if not set(FEATURE_COLUMNS) <= set(columns):
+            stale_query = _calibrated_query(
+                model_code, model_version, from_date, to_date, filters, columns=["id_no"] + FEATURE_COLUMNS
+            ).where(CalibratedPredictionDB.calibrated.is_(None))
+        await _fill_stale_predictions(df, model_code, model_version, db, pipeline, stale_query)
+
+    return df
+
+
+async def fetch_fast_frame(model_code: str, db, from_date: Optional[datetime], to_date: Optional[datetime],
+                           filters: Optional[ReadingFilters] = None, pipeline: str = "predict") -> pd.DataFrame:
+    """
+    Readings calibrated on the fly with the model's interpolation grid. Nothing
+    is read from or written to the materialized predictions.
+    """
+    with stage_timer(pipeline, model_code, "db_query"):
+        columns = await fetch_columns(db, _readings_query(from_date, to_date, filters))
+    with stage_timer(pipeline, model_code, "to_frame"):
+        df = pd.DataFrame(columns)
+
+    if not df.empty:
+        with stage_timer(pipeline, model_code, "predict"):
+            df["calibrated"] = await inference_executor.predict(model_code, df[FEATURE_COLUMNS].to_numpy(), mode="fast")
+
+    return df
+
+
+async def stream_predictions(model_code: str, from_date: Optional[datetime], to_date: Optional[datetime],
+                             media_type: str = NDJSON_MEDIA_TYPE, mode: str = "exact",
+                             filters: Optional[ReadingFilters] = None):
+    """
+    Yield calibrated rows as NDJSON or CSV, one chunk at a time.
+
+    Rows are read through a server-side cursor in STREAM_CHUNK_SIZE partitions,
+    so memory stays flat regardless of the date range. The generator owns its
+    sessions because it outlives the request handler; stale predictions are
+    written back on a second session while the cursor holds the first.
+    """
+    model_version = registry.version(model_code)
+    if mode == "fast":
+        query = _readings_query(from_date, to_date, filters)
+    else:
+        query = _calibrated_query(model_code, model_version, from_date, to_date, filters)
+    query = query.execution_options(yield_per=STREAM_CHUNK_SIZE)
+
+    async with AsyncSessionLocal() as db, AsyncSessionLocal() as writer:
+        result = await db.stream(query)
+        columns = [c for c in result.keys() if c != "id_no"]
+        if mode == "fast":
+            columns.append("calibrated")
+        first_chunk = True
+
+        async for rows in result.partitions():
+            df = pd.DataFrame(rows, columns=list(result.keys()))
+            if mode == "fast":
+                df["calibrated"] = await inference_executor.predict(
+                    model_code, df[FEATURE_COLUMNS].to_numpy(dtype=float), mode="fast"
+                )
+            else:
+                await _fill_stale_predictions(df, model_code, model_version, writer)
+            df = df.drop(columns=["id_no"])
+
+            if media_type == CSV_MEDIA_TYPE:
+                yield df.to_csv(index=False, header=first_chunk, date_format="%Y-%m-%dT%H:%M:%S")
+            else:
+                chunk = df.to_json(orient="records", lines=True, date_format="iso")
+                yield chunk if chunk.endswith("\n") else chunk + "\n"
+            first_chunk = False
+
+        # An empty CSV result still gets its header row
+        if first_chunk and media_type == CSV_MEDIA_TYPE:
+            yield ",".join(columns) + "\n"
+
+
+async def predict_with_model(model_code: str, db, from_date: Optional[datetime], to_date: Optional[datetime],
+                             mode: str = "exact", filters: Optional[ReadingFilters] = None) -> dict:
+    """
+    Calibrated rows plus the keyset cursor for the next page. next_after is only
+    set when a limit was given and the page came back full.
+    """
+    if mode == "fast":
+        df = await fetch_fast_frame(model_code, db, from_date, to_date, filters)
+    else:
+        df = await fetch_calibrated_frame(model_code, db, from_date, to_date, filters)
 
-    result = await db.execute(query)
-    records = result.scalars().all()
+    prediction_rows.observe(len(df), pipeline="predict", model=model_code)
+    if df.empty:
+        return {"data": [], "next_after": None}
 
-    if not records:
-        return []
+    next_after = None
+    if filters and filters.limit is not None and len(df) == filters.limit:
+        next_after = int(df["id_no"].iloc[-1])
 
-    # Convert to DataFrame
-    df = pd.DataFrame([{
-        "Date": row.Date,
-        "cf1": row.cf1,
-        "RH": row.RH,
-        "TempC": row.TempC,
-        "FM": row.FM
-    } for row in records])
+    # Final JSON rendering happens in the route; it is the rest of http_request_duration_seconds
+    with stage_timer("predict", model_code, "encode"):
+        json_response = df.drop(columns=["id_no"]).to_dict(orient="records")
 
-    features = df[["cf1", "RH", "TempC"]]
+    return {"data": json_response, "next_after": next_after}
 
-    model = load_model(model_path)
 
-    if hasattr(model, "predict"):
-        predictions = model.predict(features)
-    else:
-        raise Exception("Invalid model or prediction method")
-    
-    df["calibrated"] = predictions
+def _regression_metrics(predicted: np.ndarray, observed: np.ndarray) -> dict:
+    residuals = predicted - observed
+    ss_res = float(np.dot(residuals, residuals))
+    ss_tot = float(np.sum((observed - observed.mean()) ** 2))
+    return {
+        "rmse": float(np.sqrt(ss_res / len(observed))),
+        "r2": 1.0 - ss_res / ss_tot if ss_tot else None
+    }
 
-    json_response = df.to_dict(orient="records")
 
-    return json_response
+async def compare_models(model_codes: list, db, from_date: Optional[datetime], to_date: Optional[datetime],
+                         include_metrics: bool = False) -> dict:
+    """
+    Score several models over one shared feature matrix. The range is read
+    once, and the models run concurrently in the inference pool.
+    """
+    df = pd.DataFrame(await fetch_columns(db, _readings_query(from_date, to_date)))
 
+    if df.empty:
+        return {}
 
-async def predict_and_generate_histograms(model_path: str, db, from_date: Optional[datetime], to_date: Optional[datetime]):
-    query = select(AirQualitySiteDB)
+    df = df.drop(columns=["id_no"])
 
-    if from_date and to_date:
-        query = query.where(
-            and_(
-                AirQualitySiteDB.Date >= from_date,
-                AirQualitySiteDB.Date <= to_date
-            )
-        )
+    features = df[FEATURE_COLUMNS].to_numpy()
+    predictions = await asyncio.gather(*[
+        inference_executor.predict(model_code, features) for model_code in model_codes
+    ])
 
-    result = await db.execute(query)
-    records = result.scalars().all()
+    for model_code, predicted in zip(model_codes, predictions):
+        df[f"calibrated_{model_code}"] = predicted
 
-    if not records:
+    response = {"count": len(df), "data": df.to_dict(orient="records")}
+
+    if include_metrics:
+        observed = df["FM"].to_numpy(dtype=float)
+        response["metrics"] = {
+            model_code: _regression_metrics(predicted, observed)
+            for model_code, predicted in zip(model_codes, predictions)
+        }
+
+    return response
+
+
+async def histogram_cache_key(model_code: str, db, from_date: Optional[datetime], to_date: Optional[datetime],
+                              filters: Optional[ReadingFilters] = None) -> str:
+    data_version = await fetch_data_version(db, from_date, to_date, filters)
+    return histogram_cache.key(
+        model_code,
+        registry.version(model_code),
+        from_date,
+        to_date,
+        data_version,
+        filters.cache_key() if filters else ""
+    )
+
+
+async def predict_and_generate_histograms(model_code: str, db, from_date: Optional[datetime], to_date: Optional[datetime],
+                                          cache_key: Optional[str] = None, filters: Optional[ReadingFilters] = None):
+    if not cache_key:
+        with stage_timer("histogram", model_code, "cache_key"):
+            cache_key = await histogram_cache_key(model_code, db, from_date, to_date, filters)
+
+    # Same model version, range and data: the rendered image is still valid
+    cached_url = histogram_cache.get(cache_key)
+    if cached_url:
+        return {"image_url": cached_url, "etag": histogram_cache.etag(cache_key)}
+
+    df = await fetch_calibrated_frame(model_code, db, from_date, to_date, filters, pipeline="histogram")
+    prediction_rows.observe(len(df), pipeline="histogram", model=model_code)
+
+    if df.empty:
         return {}
 
-    # Create DataFrame
-    df = pd.DataFrame([{
-        "cf1": r.cf1,
-        "RH": r.RH,
-        "TempC": r.TempC,
-        "FM": r.FM
-    } for r in records])
+    # Save the histogram image (matplotlib rendering is CPU bound, so it goes to the pool too)
+    temp_path = histogram_cache.temp_path(cache_key)
+    with stage_timer("histogram", model_code, "render"):
+        await inference_executor.run(save_histogram_plot, df, model_code, temp_path)
+    image_url = histogram_cache.commit(cache_key, temp_path)
+    logging.info(f"image path: {image_url}")
 
-    # Load model
-    model = load_model(model_path)
-    if not hasattr(model, "predict"):
-        raise Exception("Invalid model or missing predict method")
-
-    # Predict calibrated values
-    df["calibrated"] = model.predict(df[["cf1", "RH", "TempC"]])
-
-    # Save the histogram image
-    model_code = os.path.splitext(os.path.basename(model_path))[0].split('_')[0]  # Extract model code like "GB"
-    image_path = save_histogram_plot(df, model_code) 
-    logging.info(f"image path: {image_path}")
-
-    # Generate histograms
-    histogram_data = {}
-    for col in ["cf1", "RH", "FM", "calibrated"]:
-        hist = pd.cut(df[col], bins=10).value_counts().sort_index()
-        histogram_data[col] = {
-            str(interval): int(count)
-            for interval, count in hist.items()
-        }
+    return {
+        "image_url": image_url,
+        "etag": histogram_cache.etag(cache_key)
+    }
+
+
+async def compute_histogram_data(model_code: str, db, from_date: Optional[datetime], to_date: Optional[datetime],
+                                 bins: int = 10) -> dict:
+    """
+    Bin counts for cf1, RH, FM and calibrated, shaped for the frontend charts.
+    The raw columns are binned in Postgres; calibrated values come from the
+    materialized predictions, fetched alone, and are binned with one
+    numpy.histogram pass.
+    """
+    histograms = await fetch_column_histograms(db, ["cf1", "RH", "FM"], bins, from_date, to_date)
+
+    df = await fetch_calibrated_frame(model_code, db, from_date, to_date, pipeline="histogram_data", columns=["id_no"])
+    if df.empty:
+        return {}
 
-    # return transpose_histogram_data(histogram_data)
+    counts, edges = np.histogram(df["calibrated"].to_numpy(), bins=bins)
+    histograms["calibrated"] = (edges, counts)
 
     return {
-        # "histogram_data": transpose_histogram_data(histogram_data),
-        "image_url": f"/static/histograms/{model_code}_histogram.png"
+        "bins": bins,
+        "edges": {col: [float(e) for e in edges] for col, (edges, _) in histograms.items()},
+        "histogram_data": transpose_histogram_data({
+            col: {i + 1: int(c) for i, c in enumerate(counts)}
+            for col, (_, counts) in histograms.items()
+        })
     }
 
 def transpose_histogram_data(histograms: dict) -> list:
@@ -159,7 +418,7 @@ def transpose_histogram_data(histograms: dict) -> list:
     return transposed
 
 #Save histogram image
-def save_histogram_plot(df: pd.DataFrame, model_code: str) -> str:
+def save_histogram_plot(df: pd.DataFrame, model_code: str, output_path: Optional[str] = None) -> str:
     plt.figure(figsize=(14, 8), dpi=300)
     plt.hist(df['FM'], bins=30, alpha=0.5, label='Original FM', color='#00008B')
     plt.hist(df['calibrated'], bins=30, alpha=0.5, label='Calibrated FM', color='#8B0000')
@@ -172,11 +431,12 @@ def save_histogram_plot(df: pd.DataFrame, model_code: str) -> str:
     plt.yticks(fontsize=12)
     plt.tight_layout()
 
-    # Save to static directory
-    output_dir = "static/histograms"
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"{model_code}_histogram.png")
-    plt.savefig(output_path)
+    # Save to static directory unless the caller picked the file
+    if output_path is None:
+        output_dir = "static/histograms"
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, f"{model_code}_histogram.png")
+    plt.savefig(output_path, format="png")
     plt.close()
 
     return output_path
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""
+Interpolation-grid surrogate for the calibration models ("fast" mode).
+
+Every model maps the same three inputs (cf1, RH, TempC) to a calibrated value,
+and those inputs stay in narrow physical ranges. build_surrogate() evaluates a
+model once on a dense 3-D grid over the observed ranges and stores the values
+as float32. SurrogateGrid.predict() then answers by trilinear interpolation
+between the eight surrounding grid points. Rows outside the grid (or with
+missing values) are handed to the real model.
+
+Each axis mixes evenly spaced knots with knots at evenly spaced quantiles of
+the training data: the quantile knots keep the error low where readings are
+dense, the even ones bound it in the sparse tails.
+
+Build a grid and print its error against the real model:
+
+    python -m app.services.surrogate GB --dataset dataset.csv --points 64
+"""
+import json
+import time
+import argparse
+from typing import Callable, List, Optional
+import numpy as np
+from app.services.npz_mmap import load_npz
+
+
+class SurrogateGrid:
+    """Model values on a rectilinear (cf1, RH, TempC) grid."""
+
+    def __init__(self, axes: List[np.ndarray], values: np.ndarray, model_code: str = "",
+                 source_sha256: str = "", report: Optional[dict] = None):
+        self.axes = [np.ascontiguousarray(a, dtype=np.float64) for a in axes]
+        self.values = np.ascontiguousarray(values, dtype=np.float32).reshape([len(a) for a in self.axes])
+        self.model_code = model_code
+        self.source_sha256 = source_sha256
+        self.report = report or {}
+        self.n_features_in_ = len(self.axes)
+        self.lows = np.array([a[0] for a in self.axes])
+        self.highs = np.array([a[-1] for a in self.axes])
+        # Flat-index stride of each axis
+        self._strides = np.array([int(np.prod(self.values.shape[d + 1:])) for d in range(len(self.axes))])
+        self._flat = self.values.ravel()
+
+    @classmethod
+    def from_npz(cls, path: str, mmap: bool = False) -> "SurrogateGrid":
+        data = load_npz(path, mmap)
+        return cls(
+            axes=[data[f"axis_{d}"] for d in range(int(data["n_axes"]))],
+            values=data["values"],
+            model_code=str(data["model_code"]),
+            source_sha256=str(data["source_sha256"]),
+            report=json.loads(str(data["report"]))
+        )
+
+    def save(self, path: str) -> str:
+        np.savez(
+            path,
+            n_axes=np.array(len(self.axes)),
+            values=self.values,
+            model_code=np.array(self.model_code),
+            source_sha256=np.array(self.source_sha256),
+            report=np.array(json.dumps(self.report)),
+            **{f"axis_{d}": a for d, a in enumerate(self.axes)}
+        )
+        return path
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + sum(a.nbytes for a in self.axes)
+
+    def contains(self, X: np.ndarray) -> np.ndarray:
+        # NaN compares False, so rows with missing values count as outside
+        return ((X >= self.lows) & (X <= self.highs)).all(axis=1)
+
+    def interpolate(self, X: np.ndarray) -> np.ndarray:
+        """Trilinear interpolation; X must lie inside the grid."""
+        base = np.zeros(len(X), dtype=np.int64)
+        fractions = []
+        for d, axis in enumerate(self.axes):
+            cell = np.clip(np.searchsorted(axis, X[:, d], side="right") - 1, 0, len(axis) - 2)
+            fractions.append((X[:, d] - axis[cell]) / (axis[cell + 1] - axis[cell]))
+            base += cell * self._strides[d]
+
+        # Accumulate the 2^d corners, each weighted by its share of the cell
+        output = np.zeros(len(X), dtype=np.float64)
+        for corner in range(1 << len(self.axes)):
+            offset, weight = 0, 1.0
+            for d, fraction in enumerate(fractions):
+                upper = (corner >> (len(self.axes) - 1 - d)) & 1
+                offset += upper * self._strides[d]
+                weight = weight * (fraction if upper else 1.0 - fraction)
+            output += weight * self._flat[base + offset]
+        return output
+
+    def predict(self, X, fallback: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        inside = self.contains(X)
+        if inside.all():
+            return self.interpolate(X)
+
+        output = np.full(len(X), np.nan)
+        output[inside] = self.interpolate(X[inside])
+        if fallback is not None:
+            output[~inside] = fallback(X[~inside])
+        return output
+
+
+def grid_axes(X: np.ndarray, points: int) -> List[np.ndarray]:
+    """Per-feature knots: half evenly spaced over [min, max], half at quantiles."""
+    axes = []
+    for d in range(X.shape[1]):
+        column = X[:, d][~np.isnan(X[:, d])]
+        uniform = np.linspace(column.min(), column.max(), max(2, points // 2))
+        quantiles = np.quantile(column, np.linspace(0.0, 1.0, max(2, points - points // 2)))
+        axes.append(np.unique(np.concatenate([uniform, quantiles])))
+    return axes
+
+
+def build_surrogate(predict_fn: Callable[[np.ndarray], np.ndarray], X: np.ndarray, points: int = 64,
+                    model_code: str = "", source_sha256: str = "") -> SurrogateGrid:
+    """Evaluate predict_fn on a grid covering the observed range of X."""
+    axes = grid_axes(X, points)
+    grid_points = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, len(axes))
+    values = np.asarray(predict_fn(grid_points), dtype=np.float64).ravel()
+    return SurrogateGrid(axes, values, model_code=model_code, source_sha256=source_sha256)
+
+
+def surrogate_error_report(grid: SurrogateGrid, predict_fn: Callable[[np.ndarray], np.ndarray],
+                           X: np.ndarray, timing_rows: int = 1_000_000) -> dict:
+    """Interpolation error against the real model on X, plus throughput."""
+    inside = grid.contains(X)
+    error = np.abs(grid.interpolate(X[inside]) - np.asarray(predict_fn(X[inside]), dtype=np.float64).ravel())
+
+    rng = np.random.default_rng(0)
+    sample = grid.lows + rng.random((timing_rows, len(grid.axes))) * (grid.highs - grid.lows)
+    started = time.perf_counter()
+    grid.interpolate(sample)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "rows": len(X),
+        "rows_inside_grid": int(inside.sum()),
+        "max_abs_error": float(error.max()) if len(error) else None,
+        "mean_abs_error": float(error.mean()) if len(error) else None,
+        "p99_abs_error": float(np.quantile(error, 0.99)) if len(error) else None,
+        "grid_shape": list(grid.values.shape),
+        "grid_bytes": grid.nbytes,
+        "seconds_per_million_rows": elapsed * 1_000_000 / timing_rows
+    }
+
+
+if __name__ == "__main__":
+    from app.services.dataset import load_dataset, FEATURE_COLUMNS
+    from app.services.model_registry import registry
+    from app.services.inference import run_model
+
+    parser = argparse.ArgumentParser(description="Build the fast-mode interpolation grid for a model")
+    parser.add_argument("code", help="Model code, e.g. GB")
+    parser.add_argument("--dataset", default="dataset.csv", help="CSV the grid ranges and error report come from")
+    parser.add_argument("--points", type=int, default=64, help="Approximate knots per axis")
+    args = parser.parse_args()
+
+    entry = registry.entry(args.code)
+    predict_fn = lambda X: run_model(entry.model, X)
+    X = load_dataset(args.dataset)[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+
+    started = time.perf_counter()
+    surrogate = build_surrogate(predict_fn, X, args.points, model_code=entry.code, source_sha256=entry.sha256)
+    surrogate.report = {
+        "build_seconds": time.perf_counter() - started,
+        **surrogate_error_report(surrogate, predict_fn, X)
+    }
+    output_path = surrogate.save(registry.surrogate_path(entry.code))
+    print(f"Wrote {output_path}")
+    print(json.dumps(surrogate.report, indent=2))
@@ -0,0 +1,178 @@
+"""
+Array-based evaluator for the GB and RF tree ensembles.
+
+compile_tree_ensemble() lowers a fitted GradientBoostingRegressor or
+RandomForestRegressor (optionally behind a SimpleImputer pipeline) into flat
+node arrays shared by all trees. CompiledTreeEnsemble.predict() then walks
+every tree for a whole batch at once, one tree level per step, instead of
+visiting the trees one by one.
+
+The win is the per-call overhead: small batches (map clicks, single sensors)
+are an order of magnitude faster than sklearn's predict. On very large batches
+sklearn's compiled tree loop is faster than NumPy gathers, so batches of at
+least fallback_min_rows are handed back to the original estimator when one is
+kept (see benchmarks/tree_ensemble.py for the crossover).
+"""
+from collections import deque
+from typing import Optional
+import numpy as np
+
+
+class UnsupportedModelError(Exception):
+    """Raised when a model cannot be lowered into packed tree arrays."""
+    pass
+
+
+class CompiledTreeEnsemble:
+    """
+    All trees packed into one set of node arrays.
+
+    Node ids are global across trees and laid out breadth first so the right
+    child always follows the left one: the next node is first_child + (x > t).
+    Leaves compare against +inf and are their own first child, so after
+    max_depth steps every walk has settled on its leaf without any per-row
+    branching.
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, first_child: np.ndarray, value: np.ndarray,
+                 roots: np.ndarray, max_depth: int, scale: float, bias: float, n_features: int,
+                 impute_values: Optional[np.ndarray] = None, batch_size: int = 4096,
+                 fallback=None, fallback_min_rows: Optional[int] = None):
+        self.feature = feature
+        self.threshold = threshold
+        self.first_child = first_child
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.scale = scale
+        self.bias = bias
+        self.n_features_in_ = n_features
+        self.impute_values = impute_values
+        self.batch_size = batch_size
+        self.fallback = fallback
+        self.fallback_min_rows = fallback_min_rows
+        if hasattr(fallback, "feature_names_in_"):
+            # Lets callers hand over a DataFrame, which the fallback estimator expects
+            self.feature_names_in_ = fallback.feature_names_in_
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.first_child, self.value, self.roots))
+
+    def _predict_batch(self, X: np.ndarray) -> np.ndarray:
+        flat = X.ravel()
+        row_offsets = (np.arange(len(X), dtype=np.int64) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            go_right = flat[row_offsets + self.feature[nodes]] > self.threshold[nodes]
+            nodes = self.first_child[nodes] + go_right
+        return self.value[nodes].sum(axis=1)
+
+    def predict(self, X) -> np.ndarray:
+        if self.fallback is not None and self.fallback_min_rows and len(X) >= self.fallback_min_rows:
+            return np.asarray(self.fallback.predict(X), dtype=np.float64)
+
+        # sklearn trees compare float32 inputs against float64 thresholds; do the same
+        X = np.ascontiguousarray(np.asarray(X, dtype=np.float32), dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if self.impute_values is not None:
+            missing = np.isnan(X)
+            if missing.any():
+                X = np.where(missing, self.impute_values, X)
+
+        output = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), self.batch_size):
+            output[start:start + self.batch_size] = self._predict_batch(X[start:start + self.batch_size])
+        return output * self.scale + self.bias
+
+
+def _unwrap_pipeline(model):
+    impute_values = None
+    if hasattr(model, "steps"):
+        *preprocessors, (_, estimator) = model.steps
+        for _, step in preprocessors:
+            if type(step).__name__ != "SimpleImputer":
+                raise UnsupportedModelError(f"Cannot compile pipeline step {type(step).__name__}")
+            impute_values = np.asarray(step.statistics_, dtype=np.float64)
+        return estimator, impute_values
+    return model, impute_values
+
+
+def is_tree_ensemble(model) -> bool:
+    try:
+        estimator, _ = _unwrap_pipeline(model)
+    except UnsupportedModelError:
+        return False
+    return type(estimator).__name__ in ("GradientBoostingRegressor", "RandomForestRegressor", "ExtraTreesRegressor")
+
+
+def _breadth_first_order(tree) -> np.ndarray:
+    # Original node ids in an order where every node's two children are adjacent
+    order = [0]
+    queue = deque([0])
+    left, right = tree.children_left, tree.children_right
+    while queue:
+        node = queue.popleft()
+        if left[node] != -1:
+            order.extend((left[node], right[node]))
+            queue.extend((left[node], right[node]))
+    return np.array(order, dtype=np.int64)
+
+
+def compile_tree_ensemble(model, batch_size: int = 4096, keep_fallback: bool = False,
+                          fallback_min_rows: Optional[int] = None) -> CompiledTreeEnsemble:
+    estimator, impute_values = _unwrap_pipeline(model)
+    kind = type(estimator).__name__
+
+    if kind == "GradientBoostingRegressor":
+        trees = [t.tree_ for t in np.ravel(estimator.estimators_)]
+        scale = float(estimator.learning_rate)
+        if estimator.init_ == "zero":
+            bias = 0.0
+        else:
+            n_features = estimator.n_features_in_
+            bias = float(np.ravel(estimator.init_.predict(np.zeros((1, n_features))))[0])
+    elif kind in ("RandomForestRegressor", "ExtraTreesRegressor"):
+        trees = [t.tree_ for t in estimator.estimators_]
+        scale = 1.0 / len(trees)
+        bias = 0.0
+    else:
+        raise UnsupportedModelError(f"Cannot compile {kind}")
+
+    features, thresholds, first_children, values, roots = [], [], [], [], []
+    offset = 0
+    for tree in trees:
+        order = _breadth_first_order(tree)
+        new_ids = np.empty(tree.node_count, dtype=np.int64)
+        new_ids[order] = np.arange(tree.node_count) + offset
+
+        is_leaf = tree.children_left[order] == -1
+        features.append(np.where(is_leaf, 0, tree.feature[order]).astype(np.int32))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold[order]))
+        first_children.append(
+            np.where(is_leaf, new_ids[order], new_ids[np.where(is_leaf, 0, tree.children_left[order])]).astype(np.int32)
+        )
+        values.append(tree.value.reshape(tree.node_count, -1)[order, 0].astype(np.float64))
+        roots.append(offset)
+        offset += tree.node_count
+
+    return CompiledTreeEnsemble(
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        first_child=np.concatenate(first_children),
+        value=np.concatenate(values),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=max(tree.max_depth for tree in trees),
+        scale=scale,
+        bias=bias,
+        n_features=int(estimator.n_features_in_),
+        impute_values=impute_values,
+        batch_size=batch_size,
+        fallback=model if keep_fallback else None,
+        fallback_min_rows=fallback_min_rows
+    )
@@ -0,0 +1,78 @@
+"""
+Train the calibration models and publish them to models/:
+
+    python -m app.training --dataset ../../dataset.csv
+    python -m app.training --models GB,KNN --from-db --workers 2
+
+Training NN needs TensorFlow: pip install -r requirements-training.txt
+"""
+import sys
+import json
+import argparse
+import logging
+from app.services.model_registry import MODEL_DIR
+from app.training.data import load_csv_table, load_db_table, row_watermark
+from app.training.recipes import RECIPES, TRAINING_REQUIREMENTS, tensorflow_available
+from app.training.runner import train_models
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.training", description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--dataset", default="dataset.csv", help="Measurement CSV (cf1/PA, RH, TempC, FM)")
+    source.add_argument("--from-db", action="store_true", help="Train on a snapshot of the air_quality_sites table")
+    parser.add_argument("--models", default=",".join(RECIPES), help="Comma separated model codes")
+    parser.add_argument("--output-dir", default=MODEL_DIR)
+    parser.add_argument("--workers", type=int, help="Training processes (defaults to one per core)")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--nn-epochs", type=int, default=100)
+    parser.add_argument("--no-grids", action="store_true", help="Skip building the fast-mode interpolation grids")
+    args = parser.parse_args(argv)
+
+    codes = [c.strip().upper() for c in args.models.split(",") if c.strip()]
+    unknown = [c for c in codes if c not in RECIPES]
+    if unknown:
+        parser.error(f"Unknown model codes {unknown}. Choose from {list(RECIPES)}")
+    if "NN" in codes and not tensorflow_available():
+        parser.error(f"Training NN needs TensorFlow (pip install -r {TRAINING_REQUIREMENTS}); "
+                     f"leave NN out with --models")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    if args.from_db:
+        # Incremental runs (python -m app.training.incremental) continue after the last row seen here
+        table, positions = load_db_table()
+        watermark = row_watermark(*positions, len(table) - 1)
+    else:
+        table, watermark = load_csv_table(args.dataset), None
+
+    result = train_models(
+        table,
+        codes,
+        output_dir=args.output_dir,
+        source="database" if args.from_db else args.dataset,
+        workers=args.workers,
+        test_size=args.test_size,
+        build_grids=not args.no_grids,
+        options={"NN": {"epochs": args.nn_epochs}},
+        watermark=watermark
+    )
+
+    print(json.dumps({
+        "version": result["version"],
+        "wall_seconds": round(result["wall_seconds"], 2),
+        "models": {
+            code: {
+                "files": entry["files"],
+                "metrics": entry["metrics"],
+                "train_seconds": round(entry["train_seconds"], 2),
+                "wall_seconds": round(entry["wall_seconds"], 2)
+            }
+            for code, entry in result["models"].items()
+        },
+        "failed": result["failed"]
+    }, indent=2))
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
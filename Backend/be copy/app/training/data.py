@@ -0,0 +1,98 @@
+"""
+Training data for app.training: read once, shared with every worker.
+
+The (cf1, RH, TempC, FM) table is copied into a single shared-memory block.
+Worker processes attach to it by name and wrap the same pages in NumPy views,
+so the data is neither re-read nor pickled once per model.
+"""
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
+from app.services.dataset import load_dataset, FEATURE_COLUMNS, TARGET_COLUMN
+
+TABLE_COLUMNS = FEATURE_COLUMNS + [TARGET_COLUMN]
+
+
+def load_csv_table(path: str) -> np.ndarray:
+    return load_dataset(path)[TABLE_COLUMNS].to_numpy(dtype=np.float64)
+
+
+async def _fetch_db_table(since: Optional[dict]) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    from sqlalchemy import select, tuple_, literal
+    from app.db.base import AsyncSessionLocal
+    from app.db.air_quality_sites import AirQualitySiteDB, fetch_columns
+
+    position = tuple_(AirQualitySiteDB.created_at, AirQualitySiteDB.id_no)
+    query = select(
+        *[getattr(AirQualitySiteDB, name) for name in TABLE_COLUMNS],
+        AirQualitySiteDB.created_at,
+        AirQualitySiteDB.id_no
+    ).order_by(AirQualitySiteDB.created_at, AirQualitySiteDB.id_no)
+    if since:
+        query = query.where(position > tuple_(
+            literal(datetime.fromisoformat(since["created_at"])),
+            literal(int(since["id_no"]))
+        ))
+
+    async with AsyncSessionLocal() as db:
+        columns = await fetch_columns(db, query)
+
+    table = np.column_stack([np.asarray(columns[name], dtype=np.float64) for name in TABLE_COLUMNS]) \
+        if len(columns["id_no"]) else np.empty((0, len(TABLE_COLUMNS)))
+    return table, (columns["created_at"], columns["id_no"])
+
+
+def row_watermark(created_at, id_no, row: int) -> Optional[dict]:
+    """JSON-friendly (created_at, id_no) position of one row; None before the first row."""
+    if row < 0:
+        return None
+    return {"created_at": pd.Timestamp(created_at[row]).isoformat(), "id_no": int(id_no[row])}
+
+
+def load_db_table(since: Optional[dict] = None) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Readings from the air_quality_sites table in (created_at, id_no) order, with
+    their (created_at, id_no) columns. With since, only rows after that position.
+    """
+    return asyncio.run(_fetch_db_table(since))
+
+
+def table_sha256(table: np.ndarray) -> str:
+    return hashlib.sha256(np.ascontiguousarray(table).tobytes()).hexdigest()
+
+
+@dataclass(frozen=True)
+class SharedTableSpec:
+    """What a worker needs to find the shared table."""
+    name: str
+    rows: int
+
+
+class SharedTrainingTable:
+    """Owner side of the shared block; use as a context manager so it is always unlinked."""
+
+    def __init__(self, table: np.ndarray):
+        table = np.ascontiguousarray(table, dtype=np.float64)
+        self._memory = shared_memory.SharedMemory(create=True, size=max(table.nbytes, 1))
+        np.ndarray(table.shape, dtype=np.float64, buffer=self._memory.buf)[:] = table
+        self.spec = SharedTableSpec(name=self._memory.name, rows=len(table))
+
+    def __enter__(self) -> "SharedTrainingTable":
+        return self
+
+    def __exit__(self, *exc_info):
+        self._memory.close()
+        self._memory.unlink()
+
+
+def attach_table(spec: SharedTableSpec) -> Tuple[shared_memory.SharedMemory, np.ndarray, np.ndarray]:
+    """Worker side: (handle, X, y) views onto the shared block. Close the handle when done."""
+    # Workers share the owner's resource tracker, so only the owner's unlink frees the block
+    memory = shared_memory.SharedMemory(name=spec.name)
+    table = np.ndarray((spec.rows, len(TABLE_COLUMNS)), dtype=np.float64, buffer=memory.buf)
+    return memory, table[:, :len(FEATURE_COLUMNS)], table[:, len(FEATURE_COLUMNS)]
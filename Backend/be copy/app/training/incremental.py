@@ -0,0 +1,281 @@
+"""
+Incremental retraining from readings added since the last published version.
+
+    python -m app.training.incremental
+    python -m app.training.incremental --models GB,LR --dataset new_batch.csv
+
+Only rows after each model's watermark, the (created_at, id_no) of the last
+row it was trained on, are read from the database. A CSV passed with
+--dataset is treated as a batch of new rows instead. Each model is then
+updated from those rows alone:
+
+    GB, RF  warm start with extra estimators fitted on the new rows
+    KNN     new points appended to the stored training points
+    LR      exact refit from running sufficient statistics (A^T A, A^T y)
+    NN      a few low learning rate epochs from the saved weights
+
+The newest validation_fraction of the new rows is held out. The current and
+updated models are both scored on it, and the update is only published when
+its RMSE does not regress. The watermark moves to the last row used for
+training, so the held-out rows are trained on by the next run. A CSV batch
+has no watermark; its held-out rows are only used for validation.
+
+Updating NN needs TensorFlow, which is in requirements-training.txt rather
+than the serving requirements.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime, timezone
+from typing import Optional
+import joblib
+import numpy as np
+import pandas as pd
+from app.services.dataset import FEATURE_COLUMNS
+from app.services.model_registry import MODEL_DIR, ModelRegistry, load_artifact, _file_sha256
+from app.services.inference import run_model
+from app.training.data import load_csv_table, load_db_table, row_watermark
+from app.training.recipes import (
+    RECIPES,
+    TRAINING_REQUIREMENTS,
+    import_tensorflow,
+    linear_state,
+    save_artifacts,
+    tensorflow_available
+)
+from app.training.runner import regression_metrics, write_manifest, _build_grid, _json_params
+
+# Setting up a simple logger
+logger = logging.getLogger(__name__)
+
+
+class IncrementalUpdateError(Exception):
+    """Custom exception for models that cannot be updated incrementally."""
+    pass
+
+
+def _split_pipeline(model):
+    # (preprocessing applied to raw features, final estimator)
+    if hasattr(model, "steps"):
+        return model[:-1].transform, model.steps[-1][1]
+    return (lambda X: X), model
+
+
+def update_trees(model, X: pd.DataFrame, y: np.ndarray, extra_estimators: int = 10):
+    """GB and RF: keep every fitted tree and add extra_estimators trained on the new rows."""
+    transform, estimator = _split_pipeline(model)
+    estimator.set_params(warm_start=True, n_estimators=estimator.n_estimators + extra_estimators)
+    estimator.fit(transform(X), y)
+    estimator.set_params(warm_start=False)
+    return model
+
+
+def update_knn(model, X: pd.DataFrame, y: np.ndarray):
+    """Append the new rows to the stored training points; imputer medians are kept."""
+    transform, estimator = _split_pipeline(model)
+    points = np.vstack([estimator._fit_X, np.asarray(transform(X), dtype=np.float64)])
+    targets = np.concatenate([np.ravel(estimator._y), y])
+    estimator.fit(points, targets)
+    return model
+
+
+def update_lr(model, X: pd.DataFrame, y: np.ndarray, state: dict):
+    """Add the new rows to the sufficient statistics and solve the normal equations again."""
+    transform, estimator = _split_pipeline(model)
+    new_state = linear_state(np.asarray(transform(X), dtype=np.float64), y)
+    state = {key: state[key] + new_state[key] for key in new_state}
+
+    solution = np.linalg.lstsq(state["xtx"], state["xty"], rcond=None)[0]
+    estimator.intercept_, estimator.coef_ = float(solution[0]), solution[1:]
+    return model, state
+
+
+def update_nn(h5_path: str, X: pd.DataFrame, y: np.ndarray, epochs: int = 5, learning_rate: float = 1e-4):
+    """Fine-tune the Keras model from its saved weights."""
+    tf = import_tensorflow()
+
+    model = tf.keras.models.load_model(h5_path, compile=False)
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate), loss="mse")
+    model.fit(X.to_numpy(dtype=np.float32), np.asarray(y, dtype=np.float32), epochs=epochs, batch_size=32, verbose=0)
+    return model
+
+
+def _source_path(registry: ModelRegistry, code: str, suffix: str) -> str:
+    # The trainable original (joblib / h5), not the serving export
+    for path in registry.candidate_paths(code):
+        if path.endswith(suffix) and not path.endswith(".state.npz") and os.path.exists(path):
+            return path
+    raise IncrementalUpdateError(f"No {suffix} artifact for {code}")
+
+
+def _rows_after(positions, watermark: Optional[dict]) -> np.ndarray:
+    created_at, id_no = positions
+    if watermark is None:
+        return np.ones(len(id_no), dtype=bool)
+    created_at = pd.to_datetime(created_at).to_numpy()
+    since = np.datetime64(datetime.fromisoformat(watermark["created_at"]))
+    id_no = np.asarray(id_no, dtype=np.int64)
+    return (created_at > since) | ((created_at == since) & (id_no > int(watermark["id_no"])))
+
+
+def update_model(code: str, registry: ModelRegistry, table: np.ndarray, positions, output_dir: str, version: str,
+                 min_rows: int = 50, validation_fraction: float = 0.2, tolerance: float = 0.0,
+                 build_grid: bool = True, options: Optional[dict] = None) -> dict:
+    """Update one model from new rows and publish it if validation RMSE does not regress."""
+    started = time.perf_counter()
+    options = options or {}
+    manifest_entry = registry.manifest()["models"].get(code, {})
+
+    if positions is not None:
+        after = _rows_after(positions, manifest_entry.get("watermark"))
+        table, positions = table[after], tuple(np.asarray(p)[after] for p in positions)
+    if len(table) < min_rows:
+        return {"status": "skipped", "reason": f"{len(table)} new rows, need {min_rows}"}
+
+    split = int(round(len(table) * (1.0 - validation_fraction)))
+    X = pd.DataFrame(table[:, :len(FEATURE_COLUMNS)], columns=FEATURE_COLUMNS)
+    y = table[:, len(FEATURE_COLUMNS)]
+    X_train, y_train, X_val, y_val = X.iloc[:split], y[:split], X.iloc[split:], y[split:]
+
+    baseline = regression_metrics(run_model(registry.get(code), X_val.to_numpy()), y_val)
+
+    fit_started = time.perf_counter()
+    state = None
+    if code in ("GB", "RF"):
+        updated = update_trees(joblib.load(_source_path(registry, code, ".joblib")), X_train, y_train,
+                               options.get("extra_estimators", 10))
+    elif code == "KNN":
+        updated = update_knn(joblib.load(_source_path(registry, code, ".joblib")), X_train, y_train)
+    elif code == "LR":
+        if not manifest_entry.get("state"):
+            raise IncrementalUpdateError("LR has no sufficient statistics yet; run python -m app.training once")
+        with np.load(os.path.join(registry.model_dir, manifest_entry["state"])) as saved:
+            previous_state = {key: saved[key] for key in saved.files}
+        updated, state = update_lr(joblib.load(_source_path(registry, code, ".joblib")), X_train, y_train,
+                                   previous_state)
+    elif code == "NN":
+        updated = update_nn(_source_path(registry, code, ".h5"), X_train, y_train,
+                            options.get("epochs", 5), options.get("learning_rate", 1e-4))
+    else:
+        raise IncrementalUpdateError(f"No incremental update for {code}")
+    train_seconds = time.perf_counter() - fit_started
+
+    files = save_artifacts(code, updated, output_dir, version)
+    served_path = os.path.join(output_dir, files[0])
+    candidate = regression_metrics(run_model(load_artifact(served_path), X_val.to_numpy()), y_val)
+
+    result = {
+        "new_rows": len(table),
+        "train_rows": split,
+        "validation_rows": len(table) - split,
+        "baseline": baseline,
+        "candidate": candidate,
+        "train_seconds": train_seconds
+    }
+    if candidate["rmse"] > baseline["rmse"] * (1.0 + tolerance):
+        for filename in files:
+            os.remove(os.path.join(output_dir, filename))
+        return {"status": "rejected", **result}
+
+    state_file = None
+    if state is not None:
+        state_file = f"LR_model_for_website.{version}.state.npz"
+        np.savez(os.path.join(output_dir, state_file), **state)
+
+    grid = None
+    if build_grid:
+        grid = _build_grid(code, output_dir, version, served_path, X.to_numpy())
+
+    entry = {
+        "version": version,
+        "files": files,
+        "grid": grid,
+        "state": state_file,
+        "sha256": _file_sha256(served_path),
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "incremental": {"base_version": manifest_entry.get("version", "bundled"), **result},
+        "metrics": candidate,
+        "params": _json_params(updated),
+        "train_seconds": train_seconds,
+        "wall_seconds": time.perf_counter() - started
+    }
+    # Held-out rows stay after the watermark and are trained on next time
+    watermark = row_watermark(*positions, split - 1) if positions is not None else manifest_entry.get("watermark")
+    write_manifest(output_dir, {code: entry}, {"source": options.get("source", "database"), "rows": len(table)},
+                   watermark)
+    return {"status": "published", **entry}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.training.incremental",
+                                     description="Update the calibration models from newly ingested readings")
+    parser.add_argument("--models", default=",".join(RECIPES), help="Comma separated model codes")
+    parser.add_argument("--dataset", help="CSV of new rows to use instead of reading the database")
+    parser.add_argument("--output-dir", default=MODEL_DIR)
+    parser.add_argument("--min-rows", type=int, default=50, help="Skip a model with fewer new rows than this")
+    parser.add_argument("--validation-fraction", type=float, default=0.2)
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Allowed relative RMSE increase")
+    parser.add_argument("--extra-estimators", type=int, default=10, help="Trees added to GB and RF")
+    parser.add_argument("--nn-epochs", type=int, default=5)
+    parser.add_argument("--nn-learning-rate", type=float, default=1e-4)
+    parser.add_argument("--no-grids", action="store_true")
+    args = parser.parse_args(argv)
+
+    codes = [c.strip().upper() for c in args.models.split(",") if c.strip()]
+    unknown = [c for c in codes if c not in RECIPES]
+    if unknown:
+        parser.error(f"Unknown model codes {unknown}. Choose from {list(RECIPES)}")
+    if "NN" in codes and not tensorflow_available():
+        parser.error(f"Updating NN needs TensorFlow (pip install -r {TRAINING_REQUIREMENTS}); "
+                     f"leave NN out with --models")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    registry = ModelRegistry(args.output_dir)
+
+    if args.dataset:
+        table, positions = load_csv_table(args.dataset), None
+    else:
+        # One read from the oldest watermark among the selected models; each model then filters its own rows
+        watermarks = [registry.manifest()["models"].get(code, {}).get("watermark") for code in codes]
+        if any(w is None for w in watermarks):
+            logger.warning("Some models have no watermark yet; reading every row for them")
+            since = None
+        else:
+            since = min(watermarks, key=lambda w: (w["created_at"], w["id_no"]))
+        table, positions = load_db_table(since)
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    options = {
+        "GB": {"extra_estimators": args.extra_estimators},
+        "RF": {"extra_estimators": args.extra_estimators},
+        "NN": {"epochs": args.nn_epochs, "learning_rate": args.nn_learning_rate}
+    }
+
+    results = {}
+    for code in codes:
+        try:
+            results[code] = update_model(
+                code, registry, table, positions, args.output_dir, version,
+                min_rows=args.min_rows,
+                validation_fraction=args.validation_fraction,
+                tolerance=args.tolerance,
+                build_grid=not args.no_grids,
+                options={**options.get(code, {}), "source": args.dataset or "database"}
+            )
+        except Exception as e:
+            logger.error(f"Incremental update of {code} failed: {e}")
+            results[code] = {"status": "failed", "reason": str(e)}
+
+    print(json.dumps({
+        code: {k: v for k, v in result.items() if k in ("status", "reason", "new_rows", "baseline", "candidate",
+                                                         "train_seconds", "files")}
+        for code, result in results.items()
+    }, indent=2))
+    return 1 if any(r["status"] == "failed" for r in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Model definitions for app.training, one per model code.
+
+Each recipe reproduces the estimator, hyperparameters and train/test split
+seed of its notebook in MODELS/ (kartikgb.py, kartikknn.py, ...), so a
+retrained artifact is comparable with the one it replaces. The NN notebook
+trains two architectures back to back and keeps the second; only that one is
+trained here.
+
+TensorFlow is only imported by the NN recipe and is not part of the serving
+requirements; install requirements-training.txt to train NN.
+"""
+import os
+import importlib.util
+from dataclasses import dataclass
+from typing import Callable, List
+import joblib
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Recipe:
+    code: str
+    fit: Callable
+    # random_state of the notebook's train_test_split
+    split_seed: int
+    # Relative training cost, used to start the slowest models first
+    cost: int
+
+
+def fit_gb(X: pd.DataFrame, y: np.ndarray):
+    from sklearn.ensemble import GradientBoostingRegressor
+    return GradientBoostingRegressor(n_estimators=100, learning_rate=0.1, max_depth=3, random_state=42).fit(X, y)
+
+
+def _imputer_pipeline(regressor):
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline
+    return Pipeline(steps=[("imputer", SimpleImputer(strategy="median")), ("regressor", regressor)])
+
+
+def fit_knn(X: pd.DataFrame, y: np.ndarray):
+    from sklearn.neighbors import KNeighborsRegressor
+    return _imputer_pipeline(KNeighborsRegressor(n_neighbors=10)).fit(X, y)
+
+
+def fit_lr(X: pd.DataFrame, y: np.ndarray):
+    from sklearn.linear_model import LinearRegression
+    return _imputer_pipeline(LinearRegression()).fit(X, y)
+
+
+def fit_rf(X: pd.DataFrame, y: np.ndarray):
+    from sklearn.ensemble import RandomForestRegressor
+    return _imputer_pipeline(RandomForestRegressor(n_estimators=100, random_state=0)).fit(X, y)
+
+
+TRAINING_REQUIREMENTS = "requirements-training.txt"
+
+
+def tensorflow_available() -> bool:
+    # Checked without importing, which takes seconds
+    return importlib.util.find_spec("tensorflow") is not None
+
+
+def import_tensorflow():
+    try:
+        import tensorflow as tf
+    except ImportError as e:
+        raise ImportError(f"Training the NN model needs TensorFlow: pip install -r {TRAINING_REQUIREMENTS}") from e
+    return tf
+
+
+def build_nn(n_features: int):
+    tf = import_tensorflow()
+    model = tf.keras.models.Sequential([
+        tf.keras.layers.Input(shape=(n_features,)),
+        tf.keras.layers.Dense(128, activation="relu"),
+        tf.keras.layers.Dense(128, activation="relu"),
+        tf.keras.layers.Dense(1)
+    ])
+    model.compile(optimizer="adam", loss="mse")
+    return model
+
+
+def fit_nn(X: pd.DataFrame, y: np.ndarray, epochs: int = 100, batch_size: int = 32, seed: int = 42):
+    # TensorFlow is a training-only dependency; serving uses the NumPy export
+    tf = import_tensorflow()
+
+    tf.keras.utils.set_random_seed(seed)
+    model = build_nn(X.shape[1])
+    model.fit(X.to_numpy(dtype=np.float32), np.asarray(y, dtype=np.float32),
+              epochs=epochs, batch_size=batch_size, verbose=0, validation_split=0.2)
+    return model
+
+
+RECIPES = {
+    "GB": Recipe("GB", fit_gb, split_seed=42, cost=2),
+    "KNN": Recipe("KNN", fit_knn, split_seed=0, cost=1),
+    "LR": Recipe("LR", fit_lr, split_seed=0, cost=0),
+    "NN": Recipe("NN", fit_nn, split_seed=42, cost=4),
+    "RF": Recipe("RF", fit_rf, split_seed=0, cost=3)
+}
+
+
+def save_artifacts(code: str, model, output_dir: str, version: str) -> List[str]:
+    """
+    Write the model under versioned names, returning file names in the order
+    the registry should try them (its serving format first).
+    """
+    from app.services.knn_index import export_knn_index
+    from app.services.nn_numpy import convert_keras_h5
+
+    stem = os.path.join(output_dir, f"{code}_model_for_website.{version}")
+
+    if code == "NN":
+        model.save(f"{stem}.h5")
+        paths = [convert_keras_h5(f"{stem}.h5", f"{stem}.npz"), f"{stem}.h5"]
+    else:
+        joblib.dump(model, f"{stem}.joblib")
+        paths = [f"{stem}.joblib"]
+        if code == "KNN":
+            paths.insert(0, export_knn_index(model, f"{stem}.knn.npz"))
+
+    return [os.path.basename(path) for path in paths]
+
+
+def linear_state(X: np.ndarray, y: np.ndarray) -> dict:
+    """Sufficient statistics of least squares with an intercept: A^T A and A^T y for A = [1, X]."""
+    A = np.column_stack([np.ones(len(X)), np.asarray(X, dtype=np.float64)])
+    y = np.asarray(y, dtype=np.float64)
+    return {"xtx": A.T @ A, "xty": A.T @ y, "rows": np.array(len(X))}
+
+
+def save_linear_state(model, X: pd.DataFrame, y: np.ndarray, output_dir: str, version: str) -> str:
+    # Statistics are taken after imputation, on exactly what the regressor saw
+    imputed = model[:-1].transform(X) if hasattr(model, "steps") else np.asarray(X)
+    path = os.path.join(output_dir, f"LR_model_for_website.{version}.state.npz")
+    np.savez(path, **linear_state(imputed, y))
+    return os.path.basename(path)
+
@@ -0,0 +1,171 @@
+"""
+Parallel training of the calibration models.
+
+train_models() puts the data into shared memory once and trains every
+selected model in its own process. Each worker writes versioned artifacts,
+scores the exported (served) artifact on the held-out split and, optionally,
+builds its fast-mode grid. The manifest in the output directory is only
+rewritten after all workers finish, so the registry never sees a half-written
+version.
+"""
+import os
+import json
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+from app.services.dataset import FEATURE_COLUMNS
+from app.services.model_registry import MANIFEST_FILE, SURROGATE_SUFFIX, load_artifact, read_manifest, _file_sha256
+from app.training.data import SharedTableSpec, SharedTrainingTable, attach_table, table_sha256
+from app.training.recipes import RECIPES, save_artifacts, save_linear_state
+
+# Setting up a simple logger
+logger = logging.getLogger(__name__)
+
+
+def regression_metrics(predicted: np.ndarray, observed: np.ndarray) -> dict:
+    residuals = predicted - observed
+    ss_res = float(np.dot(residuals, residuals))
+    ss_tot = float(np.sum((observed - observed.mean()) ** 2))
+    return {
+        "rmse": float(np.sqrt(ss_res / len(observed))),
+        "mae": float(np.abs(residuals).mean()),
+        "r2": 1.0 - ss_res / ss_tot if ss_tot else None
+    }
+
+
+def _json_params(model) -> dict:
+    # Hyperparameters that survive a JSON round trip
+    if not hasattr(model, "get_params"):
+        return {}
+    return {
+        k: v for k, v in model.get_params().items()
+        if isinstance(v, (int, float, str, bool, type(None))) and not (isinstance(v, float) and not np.isfinite(v))
+    }
+
+
+def _build_grid(code: str, output_dir: str, version: str, served_path: str, X: np.ndarray) -> str:
+    from app.services.inference import run_model
+    from app.services.surrogate import build_surrogate
+
+    served = load_artifact(served_path)
+    grid = build_surrogate(lambda features: run_model(served, features), X, model_code=code,
+                           source_sha256=_file_sha256(served_path))
+    return os.path.basename(grid.save(os.path.join(output_dir, f"{code}_model_for_website.{version}{SURROGATE_SUFFIX}")))
+
+
+def train_one(code: str, spec: SharedTableSpec, output_dir: str, version: str, test_size: float,
+              build_grid: bool, options: Optional[dict] = None) -> dict:
+    """Train, export and score one model. Runs inside a worker process."""
+    from sklearn.model_selection import train_test_split
+    from app.services.inference import run_model
+
+    started = time.perf_counter()
+    recipe = RECIPES[code]
+    memory, X, y = attach_table(spec)
+    try:
+        frame = pd.DataFrame(X, columns=FEATURE_COLUMNS, copy=False)
+        X_train, X_test, y_train, y_test = train_test_split(frame, y, test_size=test_size, random_state=recipe.split_seed)
+
+        fit_started = time.perf_counter()
+        model = recipe.fit(X_train, y_train, **(options or {}))
+        train_seconds = time.perf_counter() - fit_started
+
+        files = save_artifacts(code, model, output_dir, version)
+        served_path = os.path.join(output_dir, files[0])
+        # LR keeps its sufficient statistics so incremental runs can refit it exactly
+        state = save_linear_state(model, X_train, y_train, output_dir, version) if code == "LR" else None
+
+        # Score what the registry will actually serve, not the in-memory estimator
+        predicted = run_model(load_artifact(served_path), X_test.to_numpy())
+        grid = _build_grid(code, output_dir, version, served_path, X) if build_grid else None
+
+        return {
+            "version": version,
+            "files": files,
+            "grid": grid,
+            "state": state,
+            "sha256": _file_sha256(served_path),
+            "trained_at": datetime.now(timezone.utc).isoformat(),
+            "split": {
+                "test_size": test_size,
+                "random_state": recipe.split_seed,
+                "train_rows": len(X_train),
+                "test_rows": len(X_test)
+            },
+            "metrics": regression_metrics(predicted, np.asarray(y_test, dtype=np.float64)),
+            "params": _json_params(model),
+            "train_seconds": train_seconds,
+            "wall_seconds": time.perf_counter() - started
+        }
+    finally:
+        memory.close()
+
+
+def write_manifest(output_dir: str, models: dict, dataset: dict, watermark: Optional[dict] = None) -> dict:
+    """
+    Merge freshly trained entries into the manifest and replace it atomically.
+    watermark is the (created_at, id_no) of the last database row the models
+    have seen, where incremental training picks up.
+    """
+    manifest = read_manifest(output_dir)
+    for code, entry in models.items():
+        manifest.setdefault("models", {})[code] = {**entry, "dataset": dataset, "watermark": watermark}
+    manifest["updated_at"] = datetime.now(timezone.utc).isoformat()
+
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+    return manifest
+
+
+def train_models(table: np.ndarray, codes: Iterable[str], output_dir: str, source: str,
+                 workers: Optional[int] = None, test_size: float = 0.2, build_grids: bool = True,
+                 options: Optional[dict] = None, start_method: str = "spawn",
+                 watermark: Optional[dict] = None) -> dict:
+    """
+    Train the given model codes in parallel on a (cf1, RH, TempC, FM) table.
+    Returns {"version", "wall_seconds", "models": {code: entry}, "failed": {code: error}}.
+    """
+    codes = sorted(dict.fromkeys(c.upper() for c in codes), key=lambda c: -RECIPES[c].cost)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(codes)))
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    dataset = {"source": source, "rows": len(table), "sha256": table_sha256(table)}
+    os.makedirs(output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    results, failed = {}, {}
+    with SharedTrainingTable(table) as shared, ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(start_method)
+    ) as pool:
+        # Slowest models are submitted first so they do not end up last in the queue
+        futures = {
+            pool.submit(train_one, code, shared.spec, output_dir, version, test_size, build_grids,
+                        (options or {}).get(code)): code
+            for code in codes
+        }
+        for future in as_completed(futures):
+            code = futures[future]
+            try:
+                results[code] = future.result()
+                logger.info(f"Trained {code} in {results[code]['wall_seconds']:.1f}s")
+            except Exception as e:
+                logger.error(f"Training {code} failed: {e}")
+                failed[code] = str(e)
+
+    if results:
+        write_manifest(output_dir, results, dataset, watermark)
+
+    return {
+        "version": version,
+        "wall_seconds": time.perf_counter() - started,
+        "models": results,
+        "failed": failed
+    }
@@ -0,0 +1,95 @@
+"""
+Memory, latency and equivalence of the compact KNN index against the pickled
+KNN pipeline:
+
+    python -m benchmarks.knn_index --dataset ../../dataset.csv
+
+Export the index first with python -m app.services.knn_index.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import joblib
+import numpy as np
+from app.services.dataset import load_dataset, FEATURE_COLUMNS
+from app.services.knn_index import KNNIndex
+from benchmarks.models import time_predict
+
+BATCH_SIZES = [1, 10, 100, 1_000, 10_000, 100_000, 1_000_000]
+
+
+def _load_measured(loader) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    model = loader()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return model, {"load_seconds": seconds, "resident_bytes": current, "peak_load_bytes": peak}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the KNN index against the pickled pipeline")
+    parser.add_argument("--dataset", default="dataset.csv")
+    parser.add_argument("--pipeline", default="models/KNN_model_for_website.joblib")
+    parser.add_argument("--index", default="models/KNN_model_for_website.knn.npz")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    data = load_dataset(args.dataset)
+
+    # Import sklearn up front so the pipeline's memory figure excludes module loading
+    import sklearn.impute, sklearn.neighbors  # noqa: F401
+    frame = data[FEATURE_COLUMNS]
+
+    pipeline, pipeline_memory = _load_measured(lambda: joblib.load(args.pipeline))
+    index, index_memory = _load_measured(lambda: KNNIndex.from_npz(args.index))
+
+    expected = pipeline.predict(frame)
+    actual = index.predict(frame.to_numpy())
+    error = np.abs(expected - actual)
+
+    # Rows whose k-th neighbour is tied with the next one go through the pipeline's own tree
+    k = index.n_neighbors
+    expected_distances, _ = pipeline.steps[-1][1].kneighbors(pipeline[:-1].transform(frame), n_neighbors=k + 1)
+    distances, _ = index.kneighbors(frame.to_numpy())
+    distance_error = np.abs(expected_distances[:, :k] - distances)
+    boundary_tie = np.isclose(expected_distances[:, k - 1], expected_distances[:, k], rtol=0, atol=1e-9)
+
+    rng = np.random.default_rng(0)
+    latency = []
+    for rows in args.batch_sizes:
+        batch = frame.iloc[rng.integers(0, len(frame), rows)].reset_index(drop=True)
+        batch_array = batch.to_numpy()
+        pipeline_ms = time_predict(pipeline.predict, batch, seconds_budget=1.0, max_repeats=50)["min_ms"]
+        index_ms = time_predict(index.predict, batch_array, seconds_budget=1.0, max_repeats=50)["min_ms"]
+        latency.append({
+            "rows": rows,
+            "pipeline_ms": pipeline_ms,
+            "index_ms": index_ms,
+            "speedup": pipeline_ms / index_ms
+        })
+
+    report = {
+        "artifact_bytes": {"pipeline": os.path.getsize(args.pipeline), "index": os.path.getsize(args.index)},
+        "memory": {"pipeline": pipeline_memory, "index": index_memory},
+        "equivalence": {
+            "rows": len(frame),
+            "max_neighbour_distance_error": float(distance_error.max()),
+            "rows_with_boundary_ties": int(boundary_tie.sum()),
+            "max_abs_error_tied": float(error[boundary_tie].max()) if boundary_tie.any() else 0.0,
+            "max_abs_error": float(error.max()),
+            "mean_abs_error": float(error.mean()),
+            "passed": bool(distance_error.max() <= args.tolerance and error.max() <= args.tolerance)
+        },
+        "latency": latency
+    }
+    print(json.dumps(report, indent=2))
+
+    if not report["equivalence"]["passed"]:
+        sys.exit(1)
@@ -0,0 +1,296 @@
+"""
+Serving cost of every calibration model artifact: cold load time, resident
+memory, and predict latency and throughput from 1 to 1,000,000 rows.
+
+From the backend directory:
+
+    python -m benchmarks.models
+    python -m benchmarks.models --models GB,KNN --max-rows 100000
+    TREE_BACKEND=compiled python -m benchmarks.models --output results/compiled --compare results/models.json
+
+Every artifact found in models/ is measured, including the ones the registry
+only falls back to (the pickled KNN pipeline, the Keras NN), each in a fresh
+spawned process so load time and memory are cold. Loading goes through
+load_artifact, so TREE_BACKEND, NN_INFERENCE_DTYPE, MODEL_MMAP and friends
+apply exactly as in the server. Inputs are cf1/RH/TempC rows resampled with
+replacement from dataset.csv.
+
+Writes <output>.json and a Markdown report, <output>.md, that has tables
+for load cost, p50 latency and throughput.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import multiprocessing
+from datetime import datetime, timezone
+from typing import List, Optional
+import numpy as np
+from benchmarks.api import _rss_mb, _git_commit
+
+BATCH_SIZES = [1, 10, 100, 1_000, 10_000, 100_000, 1_000_000]
+SETTINGS_REPORTED = ["TREE_BACKEND", "TREE_BATCH_SIZE", "NN_INFERENCE_DTYPE", "NN_INFERENCE_BATCH_SIZE",
+                     "KNN_QUERY_WORKERS", "MODEL_MMAP"]
+
+
+def _reset_peak_rss() -> bool:
+    # Writing 5 to clear_refs resets VmHWM (Linux 4.0+), so peaks can be taken per batch size
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def time_predict(predict, features: np.ndarray, seconds_budget: float, min_repeats: int = 3,
+                 max_repeats: int = 200) -> dict:
+    timings = []
+    while len(timings) < min_repeats or (len(timings) < max_repeats and sum(timings) < seconds_budget):
+        started = time.perf_counter()
+        predict(features)
+        timings.append(time.perf_counter() - started)
+    ms = np.asarray(timings) * 1000.0
+    p50 = float(np.percentile(ms, 50))
+    return {
+        "rows": len(features),
+        "repeats": len(timings),
+        "min_ms": float(ms.min()),
+        "p50_ms": p50,
+        "p95_ms": float(np.percentile(ms, 95)),
+        "rows_per_second": len(features) / (p50 / 1000.0) if p50 else None
+    }
+
+
+def measure_artifact(path: str, dataset: str, batch_sizes: List[int], seed: int, seconds_budget: float) -> dict:
+    """Runs in a fresh process: load the artifact cold, then sweep the batch sizes."""
+    from app.services.dataset import load_dataset, FEATURE_COLUMNS
+    from app.services.inference import run_model
+    from app.services.model_registry import load_artifact
+
+    features = load_dataset(dataset)[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    inputs = {rows: features[rng.integers(0, len(features), rows)] for rows in batch_sizes}
+
+    # The cold load includes importing whatever the artifact needs (sklearn submodules,
+    # TensorFlow). A second copy, loaded while the first is kept, is the model's own cost.
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    cold = load_artifact(path)
+    cold_seconds = time.perf_counter() - started
+    rss_cold = _rss_mb()
+    started = time.perf_counter()
+    model = load_artifact(path)
+    warm_seconds = time.perf_counter() - started
+    rss_warm = _rss_mb()
+    del cold
+
+    # The first call pays lazy initialisation (TensorFlow graph tracing, thread pools); report it apart
+    started = time.perf_counter()
+    run_model(model, inputs[batch_sizes[0]])
+    first_call_ms = (time.perf_counter() - started) * 1000.0
+
+    latency = []
+    for rows in batch_sizes:
+        resettable = _reset_peak_rss()
+        baseline = _rss_mb()
+        result = time_predict(lambda X: run_model(model, X), inputs[rows], seconds_budget)
+        # Working memory the predict calls needed on top of what was resident before them
+        result["peak_extra_mb"] = max(0.0, _rss_mb(field="VmHWM") - baseline) if resettable else None
+        latency.append(result)
+
+    return {
+        "artifact": os.path.basename(path),
+        "artifact_bytes": os.path.getsize(path),
+        "model_type": type(model).__name__,
+        "cold_load_seconds": cold_seconds,
+        "cold_load_mb": rss_cold - rss_before,
+        "load_seconds": warm_seconds,
+        "resident_mb": rss_warm - rss_cold,
+        "first_call_ms": first_call_ms,
+        "latency": latency
+    }
+
+
+def artifacts(codes: List[str], served_only: bool) -> List[tuple]:
+    """(code, path, served) for every artifact on disk; served marks the one the registry would pick."""
+    from app.services.model_registry import registry
+
+    found = []
+    for code in codes:
+        served = registry.path_for(code)
+        for path in dict.fromkeys(registry.candidate_paths(code)):
+            if os.path.exists(path) and (path == served or not served_only):
+                found.append((code, path, path == served))
+    return found
+
+
+def run(args) -> dict:
+    from app.core.config import settings
+    from app.services.model_registry import registry
+
+    codes = [c.strip().upper() for c in args.models.split(",")] if args.models else registry.codes
+    batch_sizes = [rows for rows in args.batch_sizes if rows <= args.max_rows]
+    context = multiprocessing.get_context("spawn")
+
+    results, missing = [], [code for code in codes if not registry.exists(code)]
+    for code, path, served in artifacts(codes, args.served_only):
+        print(f"{code:4s} {os.path.basename(path)}", file=sys.stderr)
+        with context.Pool(1) as pool:
+            try:
+                measured = pool.apply(measure_artifact, (path, args.dataset, batch_sizes, args.seed, args.seconds))
+            except Exception as e:
+                measured = {"artifact": os.path.basename(path), "error": repr(e)}
+        results.append({"model": code, "served": served, **measured})
+
+    import sklearn
+    return {
+        "run": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "dataset": args.dataset,
+            "seed": args.seed,
+            "seconds_per_batch_size": args.seconds,
+            "batch_sizes": batch_sizes,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "sklearn": sklearn.__version__,
+            "settings": {name: getattr(settings, name) for name in SETTINGS_REPORTED}
+        },
+        "missing_models": missing,
+        "artifacts": results
+    }
+
+
+def _key(result: dict) -> str:
+    return f"{result['model']}/{result['artifact']}"
+
+
+def compare(previous: dict, current: dict) -> dict:
+    """Ratio current / previous of cold load time, memory and p50 latency per artifact both runs measured."""
+    before = {_key(r): r for r in previous.get("artifacts", []) if "error" not in r}
+    changes = {}
+    for result in current["artifacts"]:
+        old = before.get(_key(result))
+        if old is None or "error" in result:
+            continue
+        old_p50 = {entry["rows"]: entry["p50_ms"] for entry in old["latency"]}
+        changes[_key(result)] = {
+            "cold_load_seconds": result["cold_load_seconds"] / old["cold_load_seconds"]
+            if old["cold_load_seconds"] else None,
+            # RSS deltas below a megabyte are page-granularity noise
+            "resident_mb": result["resident_mb"] / old["resident_mb"] if old["resident_mb"] >= 1.0 else None,
+            "p50_ms": {
+                entry["rows"]: entry["p50_ms"] / old_p50[entry["rows"]]
+                for entry in result["latency"] if old_p50.get(entry["rows"])
+            }
+        }
+    return changes
+
+
+def _rows_label(rows: int) -> str:
+    for size, suffix in ((1_000_000, "M"), (1_000, "k")):
+        if rows >= size and rows % size == 0:
+            return f"{rows // size}{suffix}"
+    return str(rows)
+
+
+def _number(value: Optional[float], digits: int = 3) -> str:
+    if value is None:
+        return "-"
+    if abs(value) >= 1000:
+        return f"{value:,.0f}"
+    return f"{value:.{digits}g}"
+
+
+def markdown_report(results: dict) -> str:
+    run_info = results["run"]
+    measured = [r for r in results["artifacts"] if "error" not in r]
+    sizes = run_info["batch_sizes"]
+
+    def name(r: dict) -> str:
+        return f"{r['model']} `{r['artifact']}`" + (" (served)" if r["served"] else "")
+
+    lines = [
+        "# Model serving benchmark",
+        "",
+        f"{run_info['timestamp']}, commit `{(run_info['git_commit'] or 'unknown')[:12]}`, "
+        f"{run_info['cpu_count']} CPUs ({run_info['machine']}), Python {run_info['python']}, "
+        f"NumPy {run_info['numpy']}, scikit-learn {run_info['sklearn']}.",
+        "",
+        "Settings: " + ", ".join(f"{k}={v}" for k, v in run_info["settings"].items()),
+        "",
+        "## Load",
+        "",
+        "Cold figures include importing the libraries the artifact needs; warm load and resident",
+        "memory are those of a second copy loaded in the same process.",
+        "",
+        "| Model | Artifact MB | Cold load ms | Cold load MB | Warm load ms | Resident MB | First call ms |",
+        "|---|---:|---:|---:|---:|---:|---:|"
+    ]
+    for r in measured:
+        lines.append(f"| {name(r)} | {r['artifact_bytes'] / 2**20:.2f} | {r['cold_load_seconds'] * 1000:.1f} | "
+                     f"{r['cold_load_mb']:.1f} | {r['load_seconds'] * 1000:.1f} | {r['resident_mb']:.1f} | "
+                     f"{r['first_call_ms']:.1f} |")
+
+    header = "| Model | " + " | ".join(_rows_label(rows) for rows in sizes) + " |"
+    rule = "|---|" + "---:|" * len(sizes)
+    for title, field in (("p50 latency (ms)", "p50_ms"), ("Throughput (rows/s at p50)", "rows_per_second"),
+                         ("Peak working memory over resident (MB)", "peak_extra_mb")):
+        lines += ["", f"## {title}", "", header, rule]
+        for r in measured:
+            by_rows = {entry["rows"]: entry.get(field) for entry in r["latency"]}
+            lines.append(f"| {name(r)} | " + " | ".join(_number(by_rows.get(rows)) for rows in sizes) + " |")
+
+    failed = [r for r in results["artifacts"] if "error" in r]
+    if failed or results["missing_models"]:
+        lines += ["", "## Not measured", ""]
+        lines += [f"- {r['model']} `{r['artifact']}`: {r['error']}" for r in failed]
+        lines += [f"- {code}: no artifact in models/" for code in results["missing_models"]]
+
+    if "comparison" in results:
+        lines += ["", f"## Against {results['comparison']['baseline']} (ratio, lower is better)", "",
+                  "| Model | Load | Resident | " + " | ".join(f"p50 {_rows_label(rows)}" for rows in sizes) + " |",
+                  "|---|---:|---:|" + "---:|" * len(sizes)]
+        for key, change in results["comparison"]["ratios"].items():
+            lines.append(f"| {key} | {_number(change['cold_load_seconds'])} | {_number(change['resident_mb'])} | "
+                         + " | ".join(_number(change["p50_ms"].get(rows)) for rows in sizes) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.models", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--models", help="Comma separated model codes (default: all five)")
+    parser.add_argument("--served-only", action="store_true", help="Only the artifact the registry serves per model")
+    parser.add_argument("--dataset", default="../../dataset.csv")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--max-rows", type=int, default=max(BATCH_SIZES), help="Drop batch sizes above this")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Time budget per batch size (at least 3 calls)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="model_benchmark", help="Writes <output>.json and <output>.md")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.compare:
+        with open(args.compare) as f:
+            results["comparison"] = {"baseline": args.compare, "ratios": compare(json.load(f), results)}
+
+    output = args.output[:-5] if args.output.endswith(".json") else args.output
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output + ".json", "w") as f:
+        json.dump(results, f, indent=2)
+    report = markdown_report(results)
+    with open(output + ".md", "w") as f:
+        f.write(report)
+    print(report)
+    return 1 if any("error" in r for r in results["artifacts"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Synthetic measurement tables shaped like dataset.csv, at any size.
+
+Readings are drawn by resampling real (cf1, RH, TempC, FM) rows and adding a
+little Gaussian noise (5% of each column's spread), which keeps the joint
+distribution and the PA/FM relationship the models were trained on. Sites
+are copies of the real ones with suffixed IDs and jittered coordinates, so
+regions and AQS IDs stay realistic while the number of site IDs scales with
+the row count. Tables are produced in chunks, so 10M rows never have to fit
+in memory at once.
+"""
+from typing import Iterator, Optional
+import numpy as np
+import pandas as pd
+from app.services.dataset import load_dataset, FEATURE_COLUMNS, TARGET_COLUMN
+
+READING_COLUMNS = FEATURE_COLUMNS + [TARGET_COLUMN]
+SITE_COLUMNS = ["region", "ID", "AQS_Site_ID", "Latitude", "Longitude"]
+NOISE_SCALE = 0.05
+
+
+def default_site_count(rows: int) -> int:
+    return int(np.clip(rows // 2000, 50, 5000))
+
+
+class SyntheticDataset:
+    """Generator of synthetic air_quality_sites rows modelled on one real dataset."""
+
+    def __init__(self, data: pd.DataFrame, sites: int, seed: int = 0):
+        self.readings = data[READING_COLUMNS].to_numpy(dtype=np.float64)
+        self.noise = self.readings.std(axis=0) * NOISE_SCALE
+        self.low = np.minimum(self.readings.min(axis=0), 0.0)
+
+        dates = pd.to_datetime(data["Date"], format="mixed")
+        self.first_day = dates.min().normalize()
+        self.days = max(1, (dates.max() - dates.min()).days + 1)
+
+        rng = np.random.default_rng(seed)
+        real_sites = data[SITE_COLUMNS].drop_duplicates("ID").reset_index(drop=True)
+        template = real_sites.iloc[np.arange(sites) % len(real_sites)].reset_index(drop=True)
+        copy_number = np.arange(sites) // len(real_sites)
+        self.sites = template.assign(
+            ID=[f"{site_id}-S{n}" if n else site_id for site_id, n in zip(template["ID"], copy_number)],
+            Latitude=template["Latitude"] + np.where(copy_number > 0, rng.normal(0, 0.05, sites), 0.0),
+            Longitude=template["Longitude"] + np.where(copy_number > 0, rng.normal(0, 0.05, sites), 0.0)
+        )
+
+    @classmethod
+    def from_csv(cls, path: str, sites: int, seed: int = 0) -> "SyntheticDataset":
+        return cls(load_dataset(path), sites, seed)
+
+    def sample(self, rows: int, rng: np.random.Generator) -> pd.DataFrame:
+        readings = self.readings[rng.integers(0, len(self.readings), rows)]
+        readings = readings + rng.normal(0.0, 1.0, readings.shape) * self.noise
+        readings = np.maximum(readings, self.low)
+        readings[:, FEATURE_COLUMNS.index("RH")] = np.clip(readings[:, FEATURE_COLUMNS.index("RH")], 0.0, 100.0)
+
+        frame = pd.DataFrame(readings, columns=READING_COLUMNS)
+        frame["Date"] = self.first_day + pd.to_timedelta(rng.integers(0, self.days, rows), unit="D")
+        sites = self.sites.iloc[rng.integers(0, len(self.sites), rows)].reset_index(drop=True)
+        return pd.concat([frame, sites], axis=1)
+
+    def chunks(self, rows: int, chunk_size: int = 200_000, seed: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        rng = np.random.default_rng(seed)
+        for start in range(0, rows, chunk_size):
+            yield self.sample(min(chunk_size, rows - start), rng)
@@ -0,0 +1,103 @@
+"""
+Equivalence check and latency benchmark for the compiled tree evaluator.
+
+Compares CompiledTreeEnsemble with sklearn's predict for the GB artifact and
+the RF pipeline, on dataset.csv and on batches resampled from it, from a
+single row up to a million rows:
+
+    python -m benchmarks.tree_ensemble --dataset ../../dataset.csv
+
+When models/RF_model_for_website.joblib is absent, an RF pipeline is fitted
+with the settings from MODELS/kartikrf.py so the comparison still runs.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+from app.services.dataset import load_dataset, FEATURE_COLUMNS, TARGET_COLUMN
+from app.services.tree_ensemble import compile_tree_ensemble
+from benchmarks.models import time_predict
+
+BATCH_SIZES = [1, 10, 100, 1_000, 10_000, 100_000, 1_000_000]
+
+
+def _fit_rf(data: pd.DataFrame):
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.impute import SimpleImputer
+    from sklearn.model_selection import train_test_split
+    from sklearn.pipeline import Pipeline
+
+    X_train, _, y_train, _ = train_test_split(data[FEATURE_COLUMNS], data[TARGET_COLUMN], test_size=0.2, random_state=0)
+    pipeline = Pipeline(steps=[
+        ("imputer", SimpleImputer(strategy="median")),
+        ("regressor", RandomForestRegressor(n_estimators=100, random_state=0))
+    ])
+    return pipeline.fit(X_train, y_train)
+
+
+def benchmark(name: str, model, data: pd.DataFrame, batch_sizes: list, tolerance: float) -> dict:
+    started = time.perf_counter()
+    compiled = compile_tree_ensemble(model)
+    compile_seconds = time.perf_counter() - started
+    frame = data[FEATURE_COLUMNS]
+
+    expected = model.predict(frame)
+    actual = compiled.predict(frame.to_numpy())
+    max_abs_error = float(np.abs(expected - actual).max())
+
+    rng = np.random.default_rng(0)
+    latency = []
+    for rows in batch_sizes:
+        batch = frame.iloc[rng.integers(0, len(frame), rows)].reset_index(drop=True)
+        batch_array = batch.to_numpy()
+        sklearn_ms = time_predict(model.predict, batch, seconds_budget=1.0, max_repeats=50)["min_ms"]
+        compiled_ms = time_predict(compiled.predict, batch_array, seconds_budget=1.0, max_repeats=50)["min_ms"]
+        latency.append({
+            "rows": rows,
+            "sklearn_ms": sklearn_ms,
+            "compiled_ms": compiled_ms,
+            "speedup": sklearn_ms / compiled_ms
+        })
+
+    faster = [entry["rows"] for entry in latency if entry["speedup"] < 1.0]
+    return {
+        "model": name,
+        "trees": compiled.n_trees,
+        "nodes": int(len(compiled.value)),
+        "max_depth": compiled.max_depth,
+        "packed_bytes": compiled.nbytes,
+        "compile_seconds": compile_seconds,
+        "equivalence": {
+            "rows": len(frame),
+            "max_abs_error": max_abs_error,
+            "passed": max_abs_error <= tolerance
+        },
+        "latency": latency,
+        # Smallest measured batch where sklearn wins: a starting point for TREE_FALLBACK_MIN_ROWS
+        "sklearn_faster_from_rows": min(faster) if faster else None
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark compiled tree ensembles against sklearn")
+    parser.add_argument("--dataset", default="dataset.csv")
+    parser.add_argument("--models-dir", default="models")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    args = parser.parse_args()
+
+    data = load_dataset(args.dataset)
+
+    models = {"GB": joblib.load(os.path.join(args.models_dir, "GB_model_for_website.joblib"))}
+    rf_path = os.path.join(args.models_dir, "RF_model_for_website.joblib")
+    models["RF"] = joblib.load(rf_path) if os.path.exists(rf_path) else _fit_rf(data)
+
+    results = [benchmark(name, model, data, args.batch_sizes, args.tolerance) for name, model in models.items()]
+    print(json.dumps(results, indent=2))
+
+    if not all(r["equivalence"]["passed"] for r in results):
+        sys.exit(1)
@@ -0,0 +1,4 @@
+import os
+
+# settings reads ./config/config.json and models load from ./models, both relative to the backend directory
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
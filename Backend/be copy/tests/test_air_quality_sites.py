@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime
+import pytest
+from sqlalchemy import Float, func, literal, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.db.air_quality_sites import AirQualitySiteDB, ColumnarFetchUnsupported, _check_binary_copy, insert_readings
+
+
+def test_fixed_width_not_null_columns_use_binary_copy():
+    _check_binary_copy(select(
+        AirQualitySiteDB.id_no,
+        AirQualitySiteDB.Date,
+        AirQualitySiteDB.cf1.label("PA"),
+        func.coalesce(AirQualitySiteDB.FM, literal(float("nan"), Float)).label("calibrated"),
+        func.min(AirQualitySiteDB.id_no).over(partition_by=AirQualitySiteDB.region).label("group_key")
+    ))
+
+
+@pytest.mark.parametrize("column", [
+    AirQualitySiteDB.created_at,                   # nullable DateTime
+    AirQualitySiteDB.updated_at.label("updated"),  # nullable, behind a label
+    AirQualitySiteDB.region                        # variable width
+])
+def test_undecodable_columns_skip_binary_copy(column):
+    with pytest.raises(ColumnarFetchUnsupported):
+        _check_binary_copy(select(AirQualitySiteDB.id_no, column))
+
+
+def _upload(site: str, day: int, cf1: float) -> dict:
+    return {
+        "Date": datetime(2024, 1, day), "FM": 10.0, "cf1": cf1, "TempC": 20.0, "RH": 40.0, "region": "north",
+        "ID": site, "AQS_Site_ID": "19-153-0001", "Latitude": 41.6, "Longitude": -93.6,
+        "created_at": datetime(2024, 2, 1), "updated_at": datetime(2024, 2, 1)
+    }
+
+
+def test_insert_readings_returns_inserted_rows(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'readings.db'}")
+    # A unique key an operator might add; readings that hit it are skipped, not raised
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(AirQualitySiteDB.__table__.create)
+            await conn.execute(text('CREATE UNIQUE INDEX ix_site_date ON air_quality_sites ("ID", "Date")'))
+        async with AsyncSession(engine) as db:
+            first = await insert_readings(db, [_upload("IA1", day, float(day)) for day in (1, 2, 3)])
+            second = await insert_readings(db, [_upload("IA1", 2, 99.0), _upload("IA2", 2, 5.0),
+                                                _upload("IA2", 2, 6.0)])
+            empty = await insert_readings(db, [])
+            await db.commit()
+            stored = (await db.execute(select(AirQualitySiteDB.id_no, AirQualitySiteDB.ID, AirQualitySiteDB.cf1)
+                                       .order_by(AirQualitySiteDB.id_no))).all()
+        await engine.dispose()
+        return first, second, empty, stored
+
+    first, second, empty, stored = asyncio.run(run())
+
+    assert [tuple(row) for row in first] == [(1, 1.0, 40.0, 20.0, 10.0, "IA1"), (2, 2.0, 40.0, 20.0, 10.0, "IA1"),
+                                             (3, 3.0, 40.0, 20.0, 10.0, "IA1")]
+    assert [(row.id_no, row.ID, row.cf1) for row in second] == [(4, "IA2", 5.0)]
+    assert empty == []
+    assert [tuple(row) for row in stored] == [(1, "IA1", 1.0), (2, "IA1", 2.0), (3, "IA1", 3.0), (4, "IA2", 5.0)]
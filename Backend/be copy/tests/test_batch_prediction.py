@@ -0,0 +1,138 @@
+import io
+import json
+import asyncio
+import numpy as np
+import pandas as pd
+import pytest
+from app.core.config import settings
+from app.services import batch_prediction
+from app.services.batch_prediction import (
+    ARROW_FILE_MEDIA_TYPE,
+    ARROW_STREAM_MEDIA_TYPE,
+    CSV_MEDIA_TYPE,
+    JSON_MEDIA_TYPE,
+    NPY_MEDIA_TYPE,
+    BatchTooLargeError,
+    decode_features,
+    encode_predictions,
+    predict_batch
+)
+from app.services.dataset import FEATURE_COLUMNS
+
+FEATURES = np.array([
+    [12.5, 40.0, 21.0],
+    [np.nan, 55.0, 18.5],
+    [3.0, 80.0, -4.25]
+])
+
+
+def _encode_features(features: np.ndarray, media_type: str) -> bytes:
+    columns = dict(zip(FEATURE_COLUMNS, features.T))
+    if media_type == JSON_MEDIA_TYPE:
+        return json.dumps({name: [None if np.isnan(v) else v for v in values]
+                           for name, values in columns.items()}).encode()
+    if media_type == CSV_MEDIA_TYPE:
+        return pd.DataFrame(columns).to_csv(index=False).encode()
+    if media_type == NPY_MEDIA_TYPE:
+        output = io.BytesIO()
+        np.save(output, features)
+        return output.getvalue()
+
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+    table = pa.table(columns)
+    output = pa.BufferOutputStream()
+    writer = pa.ipc.new_stream(output, table.schema) if media_type == ARROW_STREAM_MEDIA_TYPE \
+        else pa.ipc.new_file(output, table.schema)
+    with writer:
+        writer.write_table(table)
+    return output.getvalue().to_pybytes()
+
+
+def _decode_predictions(body: bytes, media_type: str) -> list:
+    if media_type == JSON_MEDIA_TYPE:
+        return json.loads(body)["calibrated"]
+    if media_type == CSV_MEDIA_TYPE:
+        return pd.read_csv(io.BytesIO(body))["calibrated"].tolist()
+    if media_type == NPY_MEDIA_TYPE:
+        return np.load(io.BytesIO(body)).tolist()
+
+    import pyarrow.ipc
+    reader = pyarrow.ipc.open_stream(body) if media_type == ARROW_STREAM_MEDIA_TYPE else pyarrow.ipc.open_file(body)
+    return reader.read_all().column("calibrated").to_pylist()
+
+
+class FakeExecutor:
+    max_workers = 1
+
+    async def predict(self, model_code: str, X: np.ndarray, mode: str = "exact") -> np.ndarray:
+        assert np.isfinite(X).all()
+        return X.sum(axis=1)
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    monkeypatch.setattr(batch_prediction, "inference_executor", FakeExecutor())
+
+
+MEDIA_TYPES = [JSON_MEDIA_TYPE, CSV_MEDIA_TYPE, NPY_MEDIA_TYPE, ARROW_STREAM_MEDIA_TYPE, ARROW_FILE_MEDIA_TYPE]
+
+
+@pytest.mark.parametrize("media_type", MEDIA_TYPES)
+def test_decode_features(media_type):
+    decoded = decode_features(_encode_features(FEATURES, media_type), media_type)
+    np.testing.assert_array_equal(decoded, FEATURES)
+
+
+@pytest.mark.parametrize("media_type", MEDIA_TYPES)
+def test_round_trip_returns_missing_rows_as_null(executor, media_type):
+    body = _encode_features(FEATURES, media_type)
+    content, returned_type = asyncio.run(predict_batch("GB", body, f"{media_type}; charset=utf-8"))
+
+    assert returned_type == media_type
+    calibrated = _decode_predictions(content, media_type)
+    assert len(calibrated) == len(FEATURES)
+    assert calibrated[0] == pytest.approx(FEATURES[0].sum())
+    assert calibrated[2] == pytest.approx(FEATURES[2].sum())
+    if media_type == JSON_MEDIA_TYPE:
+        assert calibrated[1] is None
+    else:
+        assert calibrated[1] is None or np.isnan(calibrated[1])
+
+
+def test_json_null_is_literal_null():
+    content, _ = encode_predictions(np.array([1.0, np.nan, np.inf]), JSON_MEDIA_TYPE)
+    assert json.loads(content) == {"count": 3, "calibrated": [1.0, None, None]}
+
+
+def test_body_over_byte_limit_is_refused_before_decoding(executor, monkeypatch):
+    monkeypatch.setattr(settings, "PREDICT_BATCH_MAX_BYTES", 16)
+    with pytest.raises(BatchTooLargeError):
+        # Not valid JSON either: the size check has to come first
+        asyncio.run(predict_batch("GB", b"{" * 17, JSON_MEDIA_TYPE))
+
+
+def test_npy_rows_are_checked_from_the_header(monkeypatch):
+    monkeypatch.setattr(settings, "PREDICT_BATCH_MAX_ROWS", 2)
+    monkeypatch.setattr(np, "load", lambda *args, **kwargs: pytest.fail("array data was read"))
+    with pytest.raises(BatchTooLargeError):
+        decode_features(_encode_features(FEATURES, NPY_MEDIA_TYPE), NPY_MEDIA_TYPE)
+
+
+def test_route_refuses_large_content_length(executor, monkeypatch):
+    httpx = pytest.importorskip("httpx")
+    from fastapi import FastAPI
+    from app.api.routes import prediction
+
+    body = _encode_features(FEATURES, JSON_MEDIA_TYPE)
+    monkeypatch.setattr(settings, "PREDICT_BATCH_MAX_BYTES", len(body))
+    app = FastAPI()
+    app.include_router(prediction.router, prefix="/predictors")
+
+    async def post(body: bytes):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/predictors/predict-batch", params={"code": "GB"}, content=body,
+                                     headers={"content-type": JSON_MEDIA_TYPE})
+
+    assert asyncio.run(post(body)).json()["count"] == len(FEATURES)
+    assert asyncio.run(post(body + b" ")).status_code == 413
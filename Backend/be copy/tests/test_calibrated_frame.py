@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from app.db.air_quality_sites import AirQualitySiteDB
+from app.db.calibrated_predictions import CalibratedPredictionDB
+from app.services import prediction
+
+VERSION = "v2"
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.calls = []
+
+    async def predict(self, model_code: str, features: np.ndarray) -> np.ndarray:
+        self.calls.append(features)
+        # cf1 + RH + TempC, so a row's prediction reveals which features it was given
+        return features.sum(axis=1)
+
+
+def _reading(i: int) -> dict:
+    return {
+        "id_no": i, "Date": datetime(2024, 1, i), "FM": 10.0, "cf1": float(i), "TempC": 20.0, "RH": 100.0 * i,
+        "region": "north", "ID": "IA1", "AQS_Site_ID": "19-153-0001",
+        "Latitude": 41.6, "Longitude": -93.6, "created_at": datetime(2024, 1, 1), "updated_at": datetime(2024, 1, 1)
+    }
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    executor = FakeExecutor()
+    monkeypatch.setattr(prediction, "inference_executor", executor)
+    monkeypatch.setattr(prediction.registry, "version", lambda code: VERSION)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'readings.db'}")
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(AirQualitySiteDB.__table__.create)
+            await conn.run_sync(CalibratedPredictionDB.__table__.create)
+            await conn.execute(AirQualitySiteDB.__table__.insert(), [_reading(i) for i in range(1, 6)])
+            # Reading 2 is current, reading 3 only has a value from an older version
+            await conn.execute(CalibratedPredictionDB.__table__.insert(), [
+                {"id_no": 2, "model_code": "KNN", "model_version": VERSION, "calibrated": -1.0},
+                {"id_no": 3, "model_code": "KNN", "model_version": "v1", "calibrated": -2.0},
+            ])
+
+    asyncio.run(setup())
+    yield async_sessionmaker(engine, expire_on_commit=False), executor
+    asyncio.run(engine.dispose())
+
+
+def _expected(i: int) -> float:
+    return i + 100.0 * i + 20.0
+
+
+async def _stored(factory) -> dict:
+    async with factory() as db:
+        rows = (await db.execute(select(CalibratedPredictionDB.id_no, CalibratedPredictionDB.calibrated).where(
+            CalibratedPredictionDB.model_version == VERSION))).all()
+    return dict(rows)
+
+
+def test_narrow_frame_fetches_features_of_stale_rows_only(session_factory):
+    factory, executor = session_factory
+
+    async def run():
+        async with factory() as db:
+            return await prediction.fetch_calibrated_frame("KNN", db, None, None, columns=["id_no"])
+
+    df = asyncio.run(run())
+
+    assert list(df.columns) == ["id_no", "calibrated"]
+    assert dict(zip(df["id_no"], df["calibrated"])) == {1: _expected(1), 2: -1.0, 3: _expected(3),
+                                                        4: _expected(4), 5: _expected(5)}
+    assert len(executor.calls) == 1 and len(executor.calls[0]) == 4
+    assert asyncio.run(_stored(factory)) == {1: _expected(1), 2: -1.0, 3: _expected(3), 4: _expected(4), 5: _expected(5)}
+
+
+def test_outer_join_keeps_readings_without_a_prediction(session_factory):
+    factory, executor = session_factory
+
+    async def run():
+        async with factory() as db:
+            query = prediction._calibrated_query("KNN", VERSION, None, None).order_by(AirQualitySiteDB.id_no)
+            return (await db.execute(query)).all()
+
+    rows = asyncio.run(run())
+
+    assert [row.id_no for row in rows] == [1, 2, 3, 4, 5]
+    calibrated = {row.id_no: row.calibrated for row in rows}
+    assert calibrated[2] == -1.0
+    # Readings with no value, or only an older version's value, come back missing rather than dropped
+    # (NaN on Postgres; SQLite has no NaN and stores the literal as NULL)
+    assert all(pd.isna(calibrated[i]) for i in (1, 3, 4, 5))
+    assert executor.calls == []
+
+
+def test_stale_rows_are_predicted_once_and_stored(session_factory):
+    factory, executor = session_factory
+
+    async def run():
+        async with factory() as db:
+            return await prediction.fetch_calibrated_frame("KNN", db, datetime(2024, 1, 1), datetime(2024, 1, 3))
+
+    df = asyncio.run(run())
+
+    assert list(df["id_no"]) == [1, 2, 3]
+    assert list(df["calibrated"]) == [_expected(1), -1.0, _expected(3)]
+    np.testing.assert_array_equal(executor.calls[0], [[1.0, 100.0, 20.0], [3.0, 300.0, 20.0]])
+    assert asyncio.run(_stored(factory)) == {1: _expected(1), 2: -1.0, 3: _expected(3)}
+
+    # Now materialized: a second read runs no model
+    df = asyncio.run(run())
+    assert list(df["calibrated"]) == [_expected(1), -1.0, _expected(3)]
+    assert len(executor.calls) == 1
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from app.db.residual_stats import ResidualStatsDB
+from app.services.drift import append_window, group_residuals, merge_stats, summarize, WINDOW_DTYPE
+
+SITES = np.array(["IA1", "IA2", "IA3"], dtype=object)
+
+
+def _fold(chunks) -> dict:
+    # What update_residual_stats does to the stored rows, one ingest batch at a time
+    state = {}
+    for site_ids, residuals in chunks:
+        for site, stats in group_residuals(site_ids, residuals).items():
+            state[site] = merge_stats(*state.get(site, (0, 0.0, 0.0, 0.0)),
+                                      stats["count"], stats["mean"], stats["m2"], stats["abs_mean"])
+    return state
+
+
+def _chunks(site_ids: np.ndarray, residuals: np.ndarray, sizes) -> list:
+    bounds = np.cumsum([0] + list(sizes))
+    assert bounds[-1] == len(residuals)
+    return [(site_ids[a:b], residuals[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    site_ids = SITES[rng.integers(0, len(SITES), 1000)]
+    # A large offset makes a naive sum-of-squares variance lose precision
+    residuals = rng.normal(1e6, 3.0, len(site_ids))
+    residuals[rng.random(len(residuals)) < 0.03] = np.nan
+    return site_ids, residuals
+
+
+@pytest.mark.parametrize("sizes", [
+    [1000],
+    [1] * 1000,
+    [0, 1, 0, 499, 0, 1, 499, 0],
+    [3, 997],
+])
+def test_chunked_merge_matches_numpy(data, sizes):
+    site_ids, residuals = data
+    state = _fold(_chunks(site_ids, residuals, sizes))
+
+    assert sorted(state) == sorted(SITES)
+    for site in SITES:
+        values = residuals[(site_ids == site) & np.isfinite(residuals)]
+        count, mean, m2, abs_mean = state[site]
+        assert count == len(values)
+        assert mean == pytest.approx(np.mean(values), rel=1e-12)
+        assert m2 / count == pytest.approx(np.var(values), rel=1e-6)
+        assert abs_mean == pytest.approx(np.mean(np.abs(values)), rel=1e-12)
+
+
+def test_merge_with_empty_sides():
+    assert merge_stats(0, 0.0, 0.0, 0.0, 0, 0.0, 0.0, 0.0) == (0, 0.0, 0.0, 0.0)
+    assert merge_stats(0, 0.0, 0.0, 0.0, 3, 2.0, 8.0, 2.5) == (3, 2.0, 8.0, 2.5)
+    assert merge_stats(3, 2.0, 8.0, 2.5, 0, 0.0, 0.0, 0.0) == (3, 2.0, 8.0, 2.5)
+
+
+def test_one_element_batches():
+    values = np.array([4.0, -2.0, 7.5])
+    state = _fold([(["IA1"], values[i:i + 1]) for i in range(len(values))])
+    count, mean, m2, abs_mean = state["IA1"]
+    assert (count, mean, abs_mean) == (3, pytest.approx(np.mean(values)), pytest.approx(np.mean(np.abs(values))))
+    assert m2 / (count - 1) == pytest.approx(np.var(values, ddof=1))
+
+
+def test_group_residuals_keeps_input_order():
+    batch = group_residuals(["IA2", "IA1", "IA2", "IA1", "IA2"], np.array([1.0, 2.0, np.nan, 4.0, 5.0]))
+    np.testing.assert_array_equal(batch["IA1"]["residuals"], [2.0, 4.0])
+    np.testing.assert_array_equal(batch["IA2"]["residuals"], [1.0, 5.0])
+    assert group_residuals(["IA1"], np.array([np.nan])) == {}
+
+
+def test_summary_uses_sample_variance():
+    values = np.array([1.0, 2.0, 4.0, 7.0])
+    count, mean, m2, abs_mean = _fold([(["IA1"] * len(values), values)])["IA1"]
+    row = ResidualStatsDB(site_id="IA1", model_code="GB", model_version="v1", count=count, mean=mean, m2=m2,
+                          abs_mean=abs_mean, recent=append_window(b"", values, 3))
+
+    summary = summarize(row)
+    assert summary["variance"] == pytest.approx(np.var(values, ddof=1))
+    assert summary["rmse"] == pytest.approx(np.sqrt(np.mean(values ** 2)))
+    assert summary["window"]["count"] == 3
+    assert summary["window"]["bias"] == pytest.approx(np.mean(values[-3:].astype(WINDOW_DTYPE)))
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.services.evaluation import grouped_metrics
+
+
+def _naive(keys: np.ndarray, predicted: np.ndarray, observed: np.ndarray) -> pd.DataFrame:
+    df = pd.DataFrame({"key": keys, "predicted": predicted, "observed": observed}).dropna()
+    rows = {}
+    for key, group in df.groupby("key"):
+        residuals = group["predicted"] - group["observed"]
+        ss_tot = ((group["observed"] - group["observed"].mean()) ** 2).sum()
+        rows[key] = {
+            "count": len(group),
+            "bias": residuals.mean(),
+            "rmse": np.sqrt((residuals ** 2).mean()),
+            "mae": residuals.abs().mean(),
+            "r2": 1.0 - (residuals ** 2).sum() / ss_tot if ss_tot > 0 else np.nan
+        }
+    return pd.DataFrame.from_dict(rows, orient="index").sort_index()
+
+
+@pytest.fixture
+def rows():
+    rng = np.random.default_rng(0)
+    keys = rng.integers(0, 6, 500)
+    observed = rng.normal(12.0, 5.0, len(keys))
+    predicted = observed + rng.normal(1.0, 2.0, len(keys))
+    predicted[rng.random(len(keys)) < 0.05] = np.nan
+    observed[rng.random(len(keys)) < 0.05] = np.nan
+    # Key 6 has a single row, key 7 only rows with a missing value, key 8 constant observations
+    keys = np.concatenate([keys, [6, 7, 7, 8, 8, 8]])
+    observed = np.concatenate([observed, [10.0, np.nan, 3.0, 5.0, 5.0, 5.0]])
+    predicted = np.concatenate([predicted, [12.5, 4.0, np.nan, 4.0, 6.0, 5.5]])
+    return keys, predicted, observed
+
+
+def test_matches_pandas_groupby(rows):
+    metrics = grouped_metrics(*rows)
+    expected = _naive(*rows)
+
+    np.testing.assert_array_equal(metrics["group"], expected.index.to_numpy())
+    np.testing.assert_array_equal(metrics["count"], expected["count"].to_numpy())
+    for name in ("bias", "rmse", "mae", "r2"):
+        np.testing.assert_allclose(metrics[name], expected[name].to_numpy(), rtol=1e-10, atol=1e-12, err_msg=name)
+
+
+def test_edge_groups(rows):
+    metrics = {name: dict(zip(grouped_metrics(*rows)["group"], values))
+               for name, values in grouped_metrics(*rows).items()}
+
+    assert metrics["count"][6] == 1
+    assert metrics["bias"][6] == pytest.approx(2.5)
+    assert metrics["rmse"][6] == pytest.approx(2.5)
+    assert metrics["mae"][6] == pytest.approx(2.5)
+    assert np.isnan(metrics["r2"][6])
+    # A group with no complete row is left out rather than reported with zero counts
+    assert 7 not in metrics["count"]
+    assert np.isnan(metrics["r2"][8])
+
+
+def test_empty_input():
+    metrics = grouped_metrics(np.array([], dtype=np.int64), np.array([]), np.array([]))
+    assert all(len(values) == 0 for values in metrics.values())
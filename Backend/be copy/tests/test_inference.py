@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import pytest
+from app.services.inference import InferenceExecutor, InferenceTimeoutError
+
+
+def test_timed_out_task_stays_in_flight_until_it_finishes():
+    executor = InferenceExecutor(max_workers=0, timeout=0.05)
+    release = threading.Event()
+
+    async def run():
+        with pytest.raises(InferenceTimeoutError):
+            await executor.run(release.wait, 5)
+        # The thread is still blocked: it keeps counting against the pool
+        assert executor.stats()["in_flight"] == 1
+        assert executor.stats()["abandoned"] == 1
+
+        release.set()
+        for _ in range(100):
+            if executor.in_flight == 0:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    stats = executor.stats()
+    assert stats["in_flight"] == 0
+    assert stats["abandoned"] == 0
+    assert stats["timeouts"] == 1
+
+
+def test_completed_and_failed_tasks_leave_the_count():
+    executor = InferenceExecutor(max_workers=0, timeout=5)
+
+    async def run():
+        assert await executor.run(sum, [1, 2, 3]) == 6
+        with pytest.raises(ZeroDivisionError):
+            await executor.run(divmod, 1, 0)
+
+    asyncio.run(run())
+    stats = executor.stats()
+    assert (stats["in_flight"], stats["completed"], stats["failed"]) == (0, 1, 1)
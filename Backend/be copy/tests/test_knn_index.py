@@ -0,0 +1,55 @@
+import os
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.impute import SimpleImputer
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.pipeline import Pipeline
+from app.services.dataset import FEATURE_COLUMNS, load_dataset
+from app.services.knn_index import KNNIndex, export_knn_index
+
+KNN_PATH = "models/KNN_model_for_website.joblib"
+DATASET_PATH = "../../dataset.csv"
+
+
+@pytest.fixture(scope="module")
+def dataset_frame() -> pd.DataFrame:
+    if not os.path.exists(DATASET_PATH):
+        pytest.skip(f"{DATASET_PATH} not found")
+    return load_dataset(DATASET_PATH)[FEATURE_COLUMNS]
+
+
+def _export(model, tmp_path) -> KNNIndex:
+    return KNNIndex.from_npz(export_knn_index(model, str(tmp_path / "model.knn.npz")))
+
+
+def test_matches_pipeline_on_dataset(dataset_frame, tmp_path):
+    if not os.path.exists(KNN_PATH):
+        pytest.skip(f"{KNN_PATH} not found")
+    pipeline = joblib.load(KNN_PATH)
+    index = _export(pipeline, tmp_path)
+
+    # Rows whose k-th neighbour is tied included: the training set has many duplicate points
+    expected = pipeline.predict(dataset_frame)
+    np.testing.assert_allclose(index.predict(dataset_frame.to_numpy()), expected, rtol=1e-6, atol=1e-6)
+    np.testing.assert_allclose(index.predict(dataset_frame.to_numpy()[0]), expected[:1], rtol=1e-6, atol=1e-6)
+
+
+@pytest.mark.parametrize("weights", ["uniform", "distance"])
+def test_matches_pipeline_with_duplicates_and_missing_values(tmp_path, weights):
+    rng = np.random.default_rng(0)
+    # Coarse integer points: lots of exact duplicates and equidistant neighbours
+    X = rng.integers(0, 6, (600, len(FEATURE_COLUMNS))).astype(np.float64)
+    y = rng.normal(20, 5, len(X))
+    X[::11, 2] = np.nan
+    pipeline = Pipeline([
+        ("imputer", SimpleImputer(strategy="median")),
+        ("regressor", KNeighborsRegressor(n_neighbors=7, weights=weights))
+    ]).fit(pd.DataFrame(X, columns=FEATURE_COLUMNS), y)
+    index = _export(pipeline, tmp_path)
+
+    queries = rng.integers(0, 6, (500, len(FEATURE_COLUMNS))).astype(np.float64)
+    queries[::7, 0] = np.nan
+    expected = pipeline.predict(pd.DataFrame(queries, columns=FEATURE_COLUMNS))
+    np.testing.assert_allclose(index.predict(queries), expected, rtol=1e-6, atol=1e-6)
@@ -0,0 +1,110 @@
+import asyncio
+import numpy as np
+import pytest
+from app.services import micro_batch
+from app.services.micro_batch import MicroBatcher
+
+
+class FakeExecutor:
+    """Stands in for the inference pool: returns the row sums and records each call."""
+
+    def __init__(self, error: Exception = None, delay: float = 0.0):
+        self.error = error
+        self.delay = delay
+        self.calls = []
+
+    async def predict(self, model_code: str, X: np.ndarray, mode: str = "exact") -> np.ndarray:
+        self.calls.append((model_code, mode, len(X)))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return X.sum(axis=1)
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    fake = FakeExecutor()
+    monkeypatch.setattr(micro_batch, "inference_executor", fake)
+    return fake
+
+
+def _rows(n: int) -> np.ndarray:
+    return np.arange(n * 3, dtype=np.float64).reshape(n, 3)
+
+
+def _histogram_count(histogram, model_code: str) -> int:
+    family = histogram.collect()
+    return sum(value for suffix, labels, value in family.samples
+               if suffix == "_count" and labels["model"] == model_code)
+
+
+def test_concurrent_requests_share_one_call(executor):
+    batcher = MicroBatcher(max_wait=0.01, max_rows=64)
+    rows = _rows(10)
+
+    async def run():
+        return await asyncio.gather(*[batcher.predict("T1", row) for row in rows])
+
+    results = asyncio.run(run())
+    assert results == [float(row.sum()) for row in rows]
+    assert executor.calls == [("T1", "exact", 10)]
+    assert batcher.stats()["batches"] == 1
+    assert _histogram_count(micro_batch.batch_rows, "T1") == 1
+    assert _histogram_count(micro_batch.queue_wait_seconds, "T1") == 10
+
+
+def test_full_batch_dispatches_without_waiting(executor):
+    # max_wait far beyond the test timeout: only the max_rows trigger can answer in time
+    batcher = MicroBatcher(max_wait=60.0, max_rows=4)
+    rows = _rows(8)
+
+    async def run():
+        return await asyncio.wait_for(asyncio.gather(*[batcher.predict("T2", row) for row in rows]), timeout=5)
+
+    results = asyncio.run(run())
+    assert results == [float(row.sum()) for row in rows]
+    assert executor.calls == [("T2", "exact", 4), ("T2", "exact", 4)]
+    assert batcher.stats()["full_batches"] == 2
+
+
+def test_modes_are_batched_separately(executor):
+    batcher = MicroBatcher(max_wait=0.01, max_rows=64)
+    rows = _rows(4)
+
+    async def run():
+        return await asyncio.gather(*[batcher.predict("T3", row, mode=mode)
+                                      for row, mode in zip(rows, ["exact", "grid", "exact", "grid"])])
+
+    asyncio.run(run())
+    assert sorted(executor.calls) == [("T3", "exact", 2), ("T3", "grid", 2)]
+
+
+def test_exception_reaches_every_waiter(executor):
+    executor.error = RuntimeError("model failed")
+    batcher = MicroBatcher(max_wait=0.01, max_rows=64)
+
+    async def run():
+        return await asyncio.gather(*[batcher.predict("T4", row) for row in _rows(5)], return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert len(executor.calls) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert batcher.stats()["failed_batches"] == 1
+
+
+@pytest.mark.parametrize("started", [False, True])
+def test_cancelled_batch_releases_waiters(executor, started):
+    executor.delay = 60.0
+    batcher = MicroBatcher(max_wait=0.0, max_rows=64)
+
+    async def run():
+        waiters = [asyncio.ensure_future(batcher.predict("T5", row)) for row in _rows(3)]
+        while not (executor.calls if started else batcher._running):
+            await asyncio.sleep(0)
+        for task in list(batcher._running):
+            task.cancel()
+        return await asyncio.wait_for(asyncio.gather(*waiters, return_exceptions=True), timeout=5)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
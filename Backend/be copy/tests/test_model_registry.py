@@ -0,0 +1,39 @@
+import hashlib
+import os
+import shutil
+import pytest
+from app.services.model_registry import ModelNotFoundError, ModelRegistry
+
+LR_FILE = "LR_model_for_website.joblib"
+
+
+@pytest.fixture
+def model_dir(tmp_path) -> str:
+    if not os.path.exists(os.path.join("models", LR_FILE)):
+        pytest.skip(f"models/{LR_FILE} not found")
+    shutil.copy(os.path.join("models", LR_FILE), tmp_path / LR_FILE)
+    return str(tmp_path)
+
+
+def test_version_does_not_load_the_model(model_dir):
+    registry = ModelRegistry(model_dir=model_dir)
+    with open(os.path.join(model_dir, LR_FILE), "rb") as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    assert registry.sha256("LR") == sha256
+    assert registry.version("LR") == sha256[:12]
+    assert registry.stats()["models"] == {}
+    assert registry.entry("LR").sha256 == sha256
+
+
+def test_version_follows_the_file(model_dir):
+    registry = ModelRegistry(model_dir=model_dir)
+    before = registry.version("LR")
+    with open(os.path.join(model_dir, LR_FILE), "ab") as f:
+        f.write(b"\0")
+    assert registry.version("LR") != before
+
+
+def test_missing_artifact(model_dir):
+    with pytest.raises(ModelNotFoundError):
+        ModelRegistry(model_dir=model_dir).version("GB")
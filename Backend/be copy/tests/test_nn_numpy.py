@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import pytest
+from app.services.dataset import FEATURE_COLUMNS, load_dataset
+from app.services.nn_numpy import NumpyMLP, convert_keras_h5
+
+H5_PATH = "models/NN_model_for_website.h5"
+DATASET_PATH = "../../dataset.csv"
+
+
+@pytest.fixture(scope="module")
+def keras_model():
+    tf = pytest.importorskip("tensorflow")
+    return tf.keras.models.load_model(H5_PATH, compile=False)
+
+
+@pytest.fixture(scope="module")
+def dataset_rows() -> np.ndarray:
+    if not os.path.exists(DATASET_PATH):
+        pytest.skip(f"{DATASET_PATH} not found")
+    return load_dataset(DATASET_PATH)[FEATURE_COLUMNS].to_numpy(dtype=np.float32)
+
+
+@pytest.fixture(scope="module")
+def npz_path(tmp_path_factory) -> str:
+    return convert_keras_h5(H5_PATH, str(tmp_path_factory.mktemp("nn") / "model.npz"))
+
+
+@pytest.mark.parametrize("dtype, batch_size", [("float64", None), ("float32", 1000)])
+def test_matches_keras(keras_model, dataset_rows, npz_path, dtype, batch_size):
+    expected = keras_model.predict(dataset_rows, verbose=0)
+    model = NumpyMLP.from_npz(npz_path, dtype=dtype, batch_size=batch_size)
+    actual = model.predict(dataset_rows)
+
+    assert actual.shape == expected.shape
+    assert actual.dtype == np.dtype(dtype)
+    assert np.allclose(actual, expected, rtol=1e-5, atol=1e-4)
+
+
+def test_single_row(keras_model, dataset_rows, npz_path):
+    row = dataset_rows[0]
+    expected = keras_model.predict(row.reshape(1, -1), verbose=0)
+    assert np.allclose(NumpyMLP.from_npz(npz_path).predict(row), expected, rtol=1e-5, atol=1e-4)
@@ -0,0 +1,79 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import Column, MetaData, Table, create_engine, inspect, select
+from app.db.air_quality_sites import AirQualitySiteDB, ReadingFilters, filter_readings
+from app.db.base import create_missing_indexes
+
+SITES = ["IA1", "IA2", "IA3"]
+
+
+def _reading(i: int) -> dict:
+    return {
+        "id_no": i, "Date": datetime(2024, 1, 1 + i % 28), "FM": 10.0, "cf1": 12.0, "TempC": 20.0, "RH": 40.0,
+        "region": "north" if i % 2 else "south", "ID": SITES[i % 3], "AQS_Site_ID": f"19-153-{i % 3:04d}",
+        "Latitude": 41.6, "Longitude": -93.6, "created_at": datetime(2024, 1, 1), "updated_at": datetime(2024, 1, 1)
+    }
+
+
+@pytest.fixture
+def database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'readings.db'}")
+    AirQualitySiteDB.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(AirQualitySiteDB.__table__.insert(), [_reading(i) for i in range(1, 61)])
+    yield engine
+    engine.dispose()
+
+
+def _ids(engine, filters: ReadingFilters) -> list:
+    query = filter_readings(select(AirQualitySiteDB.id_no), None, None, filters)
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(query)]
+
+
+def test_keyset_pages_cover_every_row_once(database):
+    seen, after = [], None
+    while True:
+        page = _ids(database, ReadingFilters(site_id="IA2", after=after, limit=7))
+        if not page:
+            break
+        assert page == sorted(page)
+        seen.extend(page)
+        after = page[-1]
+
+    assert seen == [i for i in range(1, 61) if SITES[i % 3] == "IA2"]
+
+
+def test_filters_combine(database):
+    ids = _ids(database, ReadingFilters(region="north", aqs_site_id="19-153-0001"))
+    assert sorted(ids) == [i for i in range(1, 61) if i % 2 and i % 3 == 1]
+
+
+def test_cache_key_is_stable_and_distinct():
+    assert ReadingFilters().cache_key() == ""
+    assert ReadingFilters(site_id="IA3", limit=10).cache_key() == ReadingFilters(site_id="IA3", limit=10).cache_key()
+    keys = {
+        ReadingFilters(site_id="IA3").cache_key(),
+        ReadingFilters(region="IA3").cache_key(),
+        ReadingFilters(aqs_site_id="IA3").cache_key(),
+        ReadingFilters(site_id="IA3", after=5).cache_key(),
+        ReadingFilters(site_id="IA3", limit=5).cache_key(),
+    }
+    assert len(keys) == 5
+    assert hash(ReadingFilters(site_id="IA3")) == hash(ReadingFilters(site_id="IA3"))
+
+
+def test_missing_indexes_are_added_to_existing_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    # The table as an earlier release created it: same columns, no secondary indexes
+    old = Table(AirQualitySiteDB.__tablename__, MetaData(),
+                *[Column(c.name, c.type, primary_key=c.primary_key) for c in AirQualitySiteDB.__table__.columns])
+    old.create(engine)
+
+    with engine.begin() as conn:
+        create_missing_indexes(conn)
+        create_missing_indexes(conn)  # idempotent
+
+    names = {index["name"] for index in inspect(engine).get_indexes(AirQualitySiteDB.__tablename__)}
+    assert {index.name for index in AirQualitySiteDB.__table__.indexes} <= names
+    engine.dispose()
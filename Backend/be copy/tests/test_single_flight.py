@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+from app.api.routes import prediction
+from app.services.single_flight import SingleFlight
+
+
+class FakeSession:
+    def __init__(self, log: list):
+        self.log = log
+        self.closed = False
+
+    async def __aenter__(self) -> "FakeSession":
+        self.log.append(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*[flight.do("key", work) for _ in range(5)])
+
+    assert asyncio.run(run()) == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 5, "executions": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_coalesced_work_owns_its_session(monkeypatch):
+    sessions = []
+    monkeypatch.setattr(prediction, "AsyncSessionLocal", lambda: FakeSession(sessions))
+    flight = SingleFlight()
+
+    async def run():
+        started = asyncio.Event()
+
+        async def work(db):
+            started.set()
+            await asyncio.sleep(0.05)
+            # Still usable after the request that started the work went away
+            assert not db.closed
+            return id(db)
+
+        first = asyncio.ensure_future(flight.do("key", lambda: prediction._with_own_session(work)))
+        await started.wait()
+        second = asyncio.ensure_future(flight.do("key", lambda: prediction._with_own_session(work)))
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == id(sessions[0])
+    assert len(sessions) == 1
+    assert sessions[0].closed
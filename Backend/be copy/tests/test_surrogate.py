@@ -0,0 +1,111 @@
+import os
+import shutil
+import joblib
+import numpy as np
+import pytest
+from app.services.inference import run_model
+from app.services.model_registry import ModelNotFoundError, ModelRegistry
+from app.services.surrogate import SurrogateGrid, build_surrogate
+
+LR_FILE = "LR_model_for_website.joblib"
+GB_PATH = "models/GB_model_for_website.joblib"
+GB_GRID_PATH = "models/GB_model_for_website.grid.npz"
+
+
+def _rows(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    low, high = np.array([0.0, 0.0, -30.0]), np.array([500.0, 100.0, 45.0])
+    return low + rng.random((n, 3)) * (high - low)
+
+
+def _multilinear(X: np.ndarray) -> np.ndarray:
+    # Linear along each axis, so trilinear interpolation reproduces it exactly
+    return 0.5 * X[:, 0] - 0.2 * X[:, 1] + 0.3 * X[:, 2] + 1e-4 * X[:, 0] * X[:, 1] * X[:, 2] + 3.0
+
+
+def _curved(X: np.ndarray) -> np.ndarray:
+    return np.sin(X[:, 0] / 40.0) * X[:, 1] + np.sqrt(X[:, 2] + 31.0)
+
+
+def _nodes(grid: SurrogateGrid) -> np.ndarray:
+    return np.stack(np.meshgrid(*grid.axes, indexing="ij"), axis=-1).reshape(-1, len(grid.axes))
+
+
+def _midpoints(grid: SurrogateGrid) -> np.ndarray:
+    centres = [(a[:-1] + a[1:]) / 2 for a in grid.axes]
+    return np.stack(np.meshgrid(*centres, indexing="ij"), axis=-1).reshape(-1, len(grid.axes))
+
+
+@pytest.fixture(scope="module")
+def curved_grid() -> SurrogateGrid:
+    return build_surrogate(_curved, _rows(5000), points=16)
+
+
+def test_nodes_match_the_source(curved_grid):
+    nodes = _nodes(curved_grid)
+    np.testing.assert_allclose(curved_grid.predict(nodes), _curved(nodes), rtol=1e-6, atol=1e-4)
+
+
+def test_midpoints_average_the_cell_corners(curved_grid):
+    values = curved_grid.values.astype(np.float64)
+    corners = sum(values[i:i + values.shape[0] - 1, j:j + values.shape[1] - 1, k:k + values.shape[2] - 1]
+                  for i in (0, 1) for j in (0, 1) for k in (0, 1)) / 8
+    np.testing.assert_allclose(curved_grid.predict(_midpoints(curved_grid)), corners.ravel(), rtol=1e-12, atol=1e-9)
+
+
+def test_multilinear_function_is_exact():
+    X = _rows(3000, seed=1)
+    grid = build_surrogate(_multilinear, X, points=8)
+    inside = _rows(2000, seed=2)
+    inside = inside[grid.contains(inside)]
+    np.testing.assert_allclose(grid.predict(inside), _multilinear(inside), rtol=1e-5, atol=1e-3)
+
+
+def test_outside_rows_go_to_the_fallback(curved_grid):
+    X = _rows(50, seed=3)
+    X[:10, 0] = curved_grid.highs[0] + 1.0
+    X[10:15, 2] = curved_grid.lows[2] - 1.0
+    X[15:20, 1] = np.nan
+    handed_over = []
+
+    def fallback(rows: np.ndarray) -> np.ndarray:
+        handed_over.append(rows)
+        return np.full(len(rows), -1.0)
+
+    output = curved_grid.predict(X, fallback=fallback)
+
+    assert len(handed_over) == 1
+    np.testing.assert_array_equal(handed_over[0], X[:20])
+    np.testing.assert_array_equal(output[:20], -1.0)
+    np.testing.assert_allclose(output[20:], curved_grid.interpolate(X[20:]))
+    assert np.isnan(curved_grid.predict(X)[:20]).all()
+
+
+def test_bundled_grid_matches_the_model_at_nodes():
+    if not (os.path.exists(GB_PATH) and os.path.exists(GB_GRID_PATH)):
+        pytest.skip(f"{GB_GRID_PATH} not found")
+    grid = SurrogateGrid.from_npz(GB_GRID_PATH)
+    nodes = _nodes(grid)[np.random.default_rng(4).choice(grid.values.size, 2000, replace=False)]
+    expected = run_model(joblib.load(GB_PATH), nodes)
+    np.testing.assert_allclose(grid.predict(nodes), expected.astype(np.float32), rtol=1e-6, atol=1e-4)
+
+
+@pytest.fixture
+def model_dir(tmp_path) -> str:
+    if not os.path.exists(os.path.join("models", LR_FILE)):
+        pytest.skip(f"models/{LR_FILE} not found")
+    shutil.copy(os.path.join("models", LR_FILE), tmp_path / LR_FILE)
+    return str(tmp_path)
+
+
+def test_registry_refuses_a_grid_from_another_artifact(model_dir):
+    registry = ModelRegistry(model_dir=model_dir)
+    grid = build_surrogate(_multilinear, _rows(500), points=4, model_code="LR", source_sha256=registry.sha256("LR"))
+    grid.save(registry.surrogate_path("LR"))
+    assert registry.surrogate("LR").source_sha256 == registry.sha256("LR")
+
+    # Retraining replaces the artifact but leaves the old grid behind
+    with open(os.path.join(model_dir, LR_FILE), "ab") as f:
+        f.write(b"\0")
+    with pytest.raises(ModelNotFoundError):
+        registry.surrogate("LR")
@@ -0,0 +1,20 @@
+import sys
+import pytest
+from app.training import __main__ as train_cli
+from app.training import incremental, recipes
+
+
+@pytest.mark.parametrize("cli", [train_cli, incremental])
+def test_nn_without_tensorflow_fails_before_loading_data(cli, monkeypatch, capsys):
+    monkeypatch.setattr(cli, "tensorflow_available", lambda: False)
+    monkeypatch.setattr(cli, "load_csv_table", lambda *args: pytest.fail("data loaded"))
+
+    with pytest.raises(SystemExit):
+        cli.main(["--models", "LR,NN", "--dataset", "missing.csv"])
+    assert recipes.TRAINING_REQUIREMENTS in capsys.readouterr().err
+
+
+def test_missing_tensorflow_names_the_requirements_file(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tensorflow", None)
+    with pytest.raises(ImportError, match=recipes.TRAINING_REQUIREMENTS):
+        recipes.build_nn(3)
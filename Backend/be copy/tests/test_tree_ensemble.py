@@ -0,0 +1,75 @@
+import os
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from app.services.dataset import FEATURE_COLUMNS
+from app.services.tree_ensemble import compile_tree_ensemble
+
+GB_PATH = "models/GB_model_for_website.joblib"
+
+
+def _random_rows(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    low, high = np.array([0.0, 0.0, -30.0]), np.array([500.0, 100.0, 45.0])
+    return low + rng.random((n, len(FEATURE_COLUMNS))) * (high - low)
+
+
+def _threshold_rows(model, rows: np.ndarray) -> np.ndarray:
+    # Copies of rows with one feature set exactly to a split threshold, so x == t must go left
+    estimator = model.steps[-1][1] if hasattr(model, "steps") else model
+    trees = [t.tree_ for t in np.ravel(estimator.estimators_)]
+    edges = []
+    for tree in trees[:20]:
+        split = tree.children_left != -1
+        edges.extend(zip(tree.feature[split], tree.threshold[split]))
+    output = np.repeat(rows[:1], len(edges), axis=0)
+    for i, (feature, threshold) in enumerate(edges):
+        output[i, feature] = threshold
+    return output
+
+
+def _frame(X: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame(X, columns=FEATURE_COLUMNS)
+
+
+@pytest.fixture(scope="module")
+def gb_model():
+    if not os.path.exists(GB_PATH):
+        pytest.skip(f"{GB_PATH} not found")
+    return joblib.load(GB_PATH)
+
+
+@pytest.fixture(scope="module")
+def rf_pipeline():
+    X = _random_rows(2000, seed=1)
+    y = 0.5 * X[:, 0] - 0.1 * X[:, 1] + 0.05 * X[:, 2] + np.random.default_rng(2).normal(0, 2, len(X))
+    X[::17, 1] = np.nan
+    pipeline = Pipeline([
+        ("imputer", SimpleImputer()),
+        ("model", RandomForestRegressor(n_estimators=25, max_depth=8, random_state=0))
+    ])
+    return pipeline.fit(_frame(X), y)
+
+
+@pytest.mark.parametrize("model_name", ["gb_model", "rf_pipeline"])
+def test_matches_sklearn(request, model_name):
+    model = request.getfixturevalue(model_name)
+    compiled = compile_tree_ensemble(model, batch_size=256)
+    rows = _random_rows(1000)
+    if model_name == "rf_pipeline":
+        rows[::7, 0] = np.nan
+
+    for X in (rows[:1], rows, _threshold_rows(model, rows)):
+        expected = model.predict(_frame(X))
+        np.testing.assert_allclose(compiled.predict(X), expected, rtol=0, atol=1e-9)
+
+
+def test_single_row_vector(gb_model):
+    compiled = compile_tree_ensemble(gb_model)
+    row = _random_rows(1)[0]
+    np.testing.assert_allclose(compiled.predict(row), gb_model.predict(_frame(row.reshape(1, -1))),
+                               rtol=0, atol=1e-9)